@@ -0,0 +1,125 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+
+from .models import ArchivedOrder, ArchivedOrderEvent, ArchivedOrderItem, Order, OrderEvent, OrderItem
+
+BATCH_SIZE = 500
+
+# Copied across as they are, ids included
+ORDER_COLUMNS = ['id', 'user_id', 'delivery_crew_id', 'status', 'state', 'total', 'date', 'idempotency_key']
+ITEM_COLUMNS = ['id', 'order_id', 'menuitem_id', 'quantity', 'unit_price']
+EVENT_COLUMNS = ['id', 'delivery_crew_id', 'order_id', 'kind', 'from_state', 'state', 'created']
+
+
+def archive_horizon(today=None):
+    """Orders dated on or after this day are never in the archive."""
+    return (today or date.today()) - timedelta(days=getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365))
+
+
+def _copy_sql(connection, source, target, columns, where):
+    quote = connection.ops.quote_name
+    names = ', '.join(quote(column) for column in columns)
+    return (f'INSERT INTO {quote(target._meta.db_table)} ({names}) '
+            f'SELECT {names} FROM {quote(source._meta.db_table)} WHERE {where}')
+
+
+def archive_orders(before=None, batch_size=BATCH_SIZE, limit=None):
+    """
+    Move delivered orders dated before ``before`` (by default the archive
+    horizon), with their lines, into the archive tables.
+
+    Orders are read a batch at a time, oldest first, and each batch is copied
+    and deleted in its own short transaction. Their lifecycle events move to
+    the archive with them and their sales stay in the rollups. Returns how
+    many orders were moved.
+    """
+    horizon = archive_horizon()
+    before = before or horizon
+    if before > horizon:
+        # Reads only look in the archive for orders older than the horizon
+        raise ValueError(f'Orders on or after {horizon} cannot be archived.')
+
+    connection = connections[router.db_for_write(Order)]
+    candidates = Order.objects.filter(state=Order.DELIVERED, date__lt=before)
+    moved = 0
+    last = None
+    while limit is None or moved < limit:
+        batch = candidates
+        if last:
+            last_id, last_date = last
+            batch = batch.filter(Q(date__gt=last_date) | Q(date=last_date, id__gt=last_id))
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        rows = list(batch.order_by('date', 'id').values_list('id', 'date')[:size])
+        if not rows:
+            break
+        last = rows[-1]
+
+        ids = [order_id for order_id, _ in rows]
+        placeholders = ', '.join(['%s'] * len(ids))
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                # Write first (see checkout.place_order); the state check skips
+                # orders reopened since they were read
+                cursor.execute(_copy_sql(connection, Order, ArchivedOrder, ORDER_COLUMNS,
+                                         f'state = %s AND id IN ({placeholders})'), [Order.DELIVERED, *ids])
+                ids = list(ArchivedOrder.objects.filter(id__in=ids).values_list('id', flat=True))
+                if ids:
+                    placeholders = ', '.join(['%s'] * len(ids))
+                    cursor.execute(_copy_sql(connection, OrderItem, ArchivedOrderItem, ITEM_COLUMNS,
+                                             f'order_id IN ({placeholders})'), ids)
+                    cursor.execute(_copy_sql(connection, OrderEvent, ArchivedOrderEvent, EVENT_COLUMNS,
+                                             f'order_id IN ({placeholders})'), ids)
+            Order.objects.filter(id__in=ids).delete()
+        moved += len(ids)
+    return moved
+
+
+def _sort_key(paginator):
+    field = paginator.ordering.lstrip('-')
+    return lambda row: (row[field], row['id']) if isinstance(row, dict) else (getattr(row, field), row.id)
+
+
+def _descending(paginator):
+    reverse = paginator.cursor is not None and paginator.cursor['r']
+    return paginator.ordering.startswith('-') != reverse
+
+
+def _reaches_archive(paginator, rows):
+    # Whether archived orders can belong on the page read from the hot table.
+    # They are all dated before the horizon, so a date-ordered page that stays
+    # on the recent side of it never needs them.
+    if paginator.ordering.lstrip('-') != 'date':
+        return True
+    horizon = archive_horizon()
+    if _descending(paginator):
+        return len(rows) <= paginator.page_size_value or _sort_key(paginator)(rows[-1])[0] < horizon
+    return paginator.cursor is None or date.fromisoformat(paginator.cursor['v']) < horizon
+
+
+def _merge(paginator, rows, archived_rows):
+    rows = sorted(rows + archived_rows, key=_sort_key(paginator), reverse=_descending(paginator))
+    return rows[:paginator.page_size_value + 1]
+
+
+def paginate_orders(paginator, request, orders, archived_orders):
+    """
+    Keyset-paginate ``orders``, reading through to ``archived_orders`` (the
+    same query on the archive) once the page reaches back into archived
+    history. Returns the page's rows like ``paginator.paginate_queryset``.
+    """
+    paginator.prepare(request)
+    rows = list(paginator.page_queryset(orders))
+    if _reaches_archive(paginator, rows):
+        rows = _merge(paginator, rows, list(paginator.page_queryset(archived_orders)))
+    return paginator.process_page(rows)
+
+
+async def apaginate_orders(paginator, request, orders, archived_orders):
+    paginator.prepare(request)
+    rows = [row async for row in paginator.page_queryset(orders)]
+    if _reaches_archive(paginator, rows):
+        rows = _merge(paginator, rows, [row async for row in paginator.page_queryset(archived_orders)])
+    return paginator.process_page(rows)
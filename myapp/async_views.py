@@ -0,0 +1,199 @@
+"""
+Native async versions of the hot read endpoints, the order export and the
+delivery crew's order event stream.
+
+The ASGI app routes these paths here (see myproject.asgi_urls); GET requests
+for JSON are answered with the async ORM, and other formats (XML, the
+browsable API) and every other method are handed to the regular DRF view,
+so both entry points expose the same API.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotAcceptable, NotFound
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import views
+from .archive import apaginate_orders
+from .authentication import aauthenticate
+from .cache import CATALOG, aget, aget_version, aset, catalog_etag
+from .events import latest_event_id, parse_last_event_id, stream_events
+from .export import ASYNC_FORMATS, FORMATS, aexport_rows
+from .fast_serializers import ValuesSerializer
+from .models import ArchivedOrder, Cart, MenuItem, Order
+from .pagination import KeysetPagination
+from .roles import DELIVERY_CREW, get_user_roles
+from .search import search_menu_items
+from .serializers import CartSerializer, MenuItemSerializer, OrderSerializer, parse_expand
+from .throttling import MenuItemThrottle
+
+
+def _json(data, status=200, headers=None):
+    return JsonResponse(data, status=status, headers=headers, encoder=JSONEncoder, safe=False)
+
+
+def _wants_json(request):
+    # Negotiated as DRF would; only JSON is rendered here
+    renderers = [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+    try:
+        renderer, _ = api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS().select_renderer(Request(request), renderers)
+    except NotAcceptable:
+        return False
+    return renderer.format == 'json'
+
+
+def _unauthenticated():
+    return _json({'detail': 'Authentication credentials were not provided.'}, status=401,
+                 headers={'WWW-Authenticate': 'Token'})
+
+
+async def _paginate(paginator, request, queryset):
+    paginator.prepare(request)
+    return paginator.process_page([row async for row in paginator.page_queryset(queryset)])
+
+
+@csrf_exempt
+async def menu_items(request):
+    if request.method != 'GET' or not _wants_json(request):
+        return await sync_to_async(views.menu_items_view)(request)
+    if await aauthenticate(request) is None:
+        return _unauthenticated()
+
+    etag, key = catalog_etag(request, await aget_version(CATALOG))
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=304, headers=headers)
+    else:
+        data = await aget(key)
+        if data is None:
+            fast_serializer = ValuesSerializer(MenuItemSerializer)
+            search_query = request.GET.get('search')
+            if search_query:
+                # The first search in a process looks up whether the index exists
+                queryset = await sync_to_async(search_menu_items)(MenuItem.objects.all(), search_query)
+                queryset = fast_serializer.values(queryset, 'search_rank')
+                paginator = KeysetPagination(page_size=3, ordering_fields=['search_rank', 'id', 'title', 'price'],
+                                             default_ordering='search_rank')
+            else:
+                queryset = fast_serializer.values(MenuItem.objects.all())
+                paginator = KeysetPagination(page_size=3, ordering_fields=['id', 'title', 'price'])
+            try:
+                rows = await _paginate(paginator, request, queryset)
+            except NotFound as exc:
+                return _json({'detail': exc.detail}, status=404)
+            data = paginator.get_paginated_data(fast_serializer.render(rows))
+            await aset(key, data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 3600))
+        response = _json(data, headers=headers)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+@csrf_exempt
+async def menu_item_detail(request, menu_item_id):
+    if request.method != 'GET' or not _wants_json(request):
+        return await sync_to_async(views.manage_menu_item)(request, menu_item_id)
+    user = await aauthenticate(request)
+    if user is None:
+        return _unauthenticated()
+
+    request.user = user
+    throttle = MenuItemThrottle()
+    if not await sync_to_async(throttle.allow_request)(request, None):
+        return _json({'detail': 'Request was throttled.'}, status=429,
+                     headers={'Retry-After': str(int(throttle.wait()) + 1)})
+
+    try:
+        menu_item = await MenuItem.objects.aget(id=menu_item_id)
+    except MenuItem.DoesNotExist:
+        return _json({'message': 'Menu item does not exist.'}, status=404)
+    return _json(MenuItemSerializer(menu_item).data)
+
+
+@csrf_exempt
+async def cart(request):
+    if request.method != 'GET' or not _wants_json(request):
+        return await sync_to_async(views.manage_cart)(request)
+    user = await aauthenticate(request)
+    if user is None:
+        return _unauthenticated()
+
+    fast_serializer = ValuesSerializer(CartSerializer)
+    cart_items = [row async for row in fast_serializer.values(Cart.objects.filter(user=user))]
+    return _json(fast_serializer.render(cart_items))
+
+
+@csrf_exempt
+async def user_orders(request):
+    if request.method != 'GET' or not _wants_json(request):
+        return await sync_to_async(views.manage_user_orders)(request)
+    user = await aauthenticate(request)
+    if user is None:
+        return _unauthenticated()
+
+    expand = parse_expand(request)
+    orders = OrderSerializer.setup_queryset(Order.objects.filter(user=user), expand)
+    archived_orders = OrderSerializer.setup_queryset(ArchivedOrder.objects.filter(user=user), expand)
+    paginator = KeysetPagination(ordering_fields=['id', 'date'], default_ordering='-date')
+    fast_serializer = None if 'items' in expand else ValuesSerializer(OrderSerializer)
+    if fast_serializer:
+        orders, archived_orders = fast_serializer.values(orders), fast_serializer.values(archived_orders)
+    try:
+        rows = await apaginate_orders(paginator, request, orders, archived_orders)
+    except NotFound as exc:
+        return _json({'detail': exc.detail}, status=404)
+    if fast_serializer:
+        return _json(paginator.get_paginated_data(fast_serializer.render(rows)))
+    serializer = OrderSerializer(rows, many=True, context={'expand': expand})
+    return _json(paginator.get_paginated_data(serializer.data))
+
+
+@csrf_exempt
+async def order_events(request):
+    if request.method != 'GET':
+        return await sync_to_async(views.order_events)(request)
+    user = await aauthenticate(request)
+    if user is None:
+        return _unauthenticated()
+    if DELIVERY_CREW not in await sync_to_async(get_user_roles)(user):
+        return _json({'detail': 'You do not have permission to perform this action.'}, status=403)
+
+    try:
+        last_id = parse_last_event_id(request)
+    except ValueError:
+        return _json({'error': 'Last-Event-ID must be an event id.'}, status=400)
+    if last_id is None:
+        last_id = await sync_to_async(latest_event_id)(user.id)
+
+    # Held open and fed as orders are assigned to or updated for this user
+    return StreamingHttpResponse(stream_events(user.id, last_id), content_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@csrf_exempt
+async def export_orders(request):
+    if request.method != 'GET':
+        return await sync_to_async(views.export_orders)(request)
+    user = await aauthenticate(request)
+    if user is None:
+        return _unauthenticated()
+    if not user.is_staff:
+        return _json({'detail': 'You do not have permission to perform this action.'}, status=403)
+
+    export_type = request.GET.get('type', 'ndjson')
+    if export_type not in FORMATS:
+        return _json({'error': f"Unknown export type. Use one of: {', '.join(FORMATS)}."}, status=400)
+    try:
+        start, end = views.parse_date_range(request.GET)
+    except ValueError:
+        return _json({'error': 'Dates must be in YYYY-MM-DD format.'}, status=400)
+
+    # Rows are read with the async ORM as the response is sent
+    content_type, _ = FORMATS[export_type]
+    response = StreamingHttpResponse(ASYNC_FORMATS[export_type](aexport_rows(start, end)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="orders.{export_type}"'
+    return response
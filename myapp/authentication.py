@@ -0,0 +1,177 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .cache import aget_version, bump_version, get_version
+
+AUTH = 'auth'
+
+
+class LRUCache:
+    """A thread-safe, size-bounded LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RevocableCache(LRUCache):
+    """
+    An LRU cache that is emptied whenever any process revokes credentials.
+
+    Revocations bump a version in the shared Django cache; every lookup
+    compares it with the version this process last saw.
+    """
+
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize, ttl)
+        self.version = None
+
+    def sync(self):
+        self._check(get_version(AUTH))
+
+    async def async_sync(self):
+        self._check(await aget_version(AUTH))
+
+    def _check(self, version):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+
+def _options():
+    options = getattr(settings, 'AUTH_CACHE', {})
+    return options.get('MAXSIZE', 10000), options.get('TTL', 60)
+
+
+token_cache = RevocableCache(*_options())
+jwt_user_cache = RevocableCache(*_options())
+
+
+def revoke_cached_credentials():
+    token_cache.clear()
+    jwt_user_cache.clear()
+    bump_version(AUTH)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that keeps recently seen tokens in memory.
+
+    A cache hit authenticates without touching the database. Deleting a token
+    (logout) or changing a user revokes the cached entries immediately.
+    """
+
+    def authenticate_credentials(self, key):
+        token_cache.sync()
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, (user, token))
+        else:
+            user, token = cached
+        # Hand out a copy so per-request state never leaks between requests
+        return copy.copy(user), token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    Stateless JWT access tokens for the API.
+
+    Tokens are verified from their signature alone; the user they name is
+    cached the same way CachedTokenAuthentication caches tokens.
+    """
+
+    def get_user(self, validated_token):
+        jwt_user_cache.sync()
+        key = validated_token.get(jwt_settings.USER_ID_CLAIM)
+        user = jwt_user_cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            jwt_user_cache.set(key, user)
+        return copy.copy(user)
+
+
+async def aauthenticate(request):
+    """
+    Authenticate a plain Django request for the async views.
+
+    Accepts the same credentials as the API (token, then JWT, then session)
+    through the same caches. Returns the user, or None without valid ones.
+    """
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) == 2 and auth[0] == 'Token':
+        await token_cache.async_sync()
+        cached = token_cache.get(auth[1])
+        if cached is None:
+            try:
+                token = await Token.objects.select_related('user').aget(key=auth[1])
+            except Token.DoesNotExist:
+                return None
+            if not token.user.is_active:
+                return None
+            cached = (token.user, token)
+            token_cache.set(auth[1], cached)
+        return copy.copy(cached[0])
+
+    if len(auth) == 2 and auth[0] in jwt_settings.AUTH_HEADER_TYPES:
+        try:
+            validated_token = CachedJWTAuthentication().get_validated_token(auth[1].encode())
+        except (InvalidToken, TokenError):
+            return None
+        await jwt_user_cache.async_sync()
+        key = validated_token.get(jwt_settings.USER_ID_CLAIM)
+        user = jwt_user_cache.get(key)
+        if user is None:
+            try:
+                user = await get_user_model().objects.aget(**{jwt_settings.USER_ID_FIELD: key})
+            except get_user_model().DoesNotExist:
+                return None
+            if not user.is_active:
+                return None
+            jwt_user_cache.set(key, user)
+        return copy.copy(user)
+
+    user = await request.auser()
+    return user if user.is_authenticated else None
@@ -0,0 +1,631 @@
+import asyncio
+import io
+import random
+import re
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.db import OperationalError, connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import CachedJWTAuthentication, CachedTokenAuthentication
+from .cart import add_to_cart
+from .checkout import place_order
+from .database import SQLITE_DEFAULTS, get_profile
+from .export import FORMATS, export_rows
+from .fast_serializers import ValuesSerializer
+from .lifecycle import state_for
+from .models import Cart, Category, MenuItem, Order, OrderItem
+from .profiling import get_settings
+from .rollups import rebuild_rollups
+from .serializers import CartSerializer, CategorySerializer, MenuItemSerializer, OrderSerializer
+
+# Number of orders seeded for each data tier; users, menu items and carts scale with it
+TIERS = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+Endpoint = namedtuple('Endpoint', ['name', 'method', 'role', 'path', 'data', 'setup'])
+
+# Maximum number of SQL queries each endpoint may issue for a single request
+QUERY_BUDGETS = {
+    'menu-items': 1,
+    'menu-item-detail': 2,
+    'categories': 1,
+    'menu-sync': 4,
+    'managers': 2,
+    'delivery-crew': 2,
+    'cart': 1,
+    'cart-add': 1,
+    'cart-add-batch': 1,
+    'user-orders': 2,
+    'user-orders-expanded': 4,
+    'checkout': 11,
+    'assigned-orders': 3,
+    'assigned-orders-active': 3,
+    'order-items': 3,
+    'order-status': 7,
+    'order-events': 2,
+    'sales-report': 2,
+    'sales-report-menu-items': 2,
+    'sales-report-categories': 2,
+    'orders-export': 2,
+    'orders-dispatch': 7,
+}
+
+
+def _refill_cart(context):
+    user = context['customer']
+    if not Cart.objects.filter(user=user).exists():
+        item = MenuItem.objects.order_by('id').first()
+        Cart.objects.create(user=user, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+
+
+ENDPOINTS = [
+    Endpoint('menu-items', 'get', 'customer', lambda c: '/api/menu-items/?ordering=price', None, None),
+    Endpoint('menu-item-detail', 'get', 'customer', lambda c: f"/api/menu-items/{c['menu_item_id']}/", None, None),
+    Endpoint('categories', 'get', 'customer', lambda c: '/api/categories/', None, None),
+    Endpoint('menu-sync', 'post', 'admin', lambda c: '/api/menu-items/bulk/',
+             lambda c: {'upsert': [{'id': menuitem_id, 'featured': False} for menuitem_id in c['menu_item_ids']]}, None),
+    Endpoint('managers', 'get', 'admin', lambda c: '/api/groups/manager/users/', None, None),
+    Endpoint('delivery-crew', 'get', 'admin', lambda c: '/api/manage-delivery-crew/', None, None),
+    Endpoint('cart', 'get', 'customer', lambda c: '/api/cart/menu-items/', None, None),
+    Endpoint('cart-add', 'post', 'customer', lambda c: '/api/cart/menu-items/',
+             lambda c: {'menuitem': c['menu_item_id'], 'quantity': 1}, None),
+    Endpoint('cart-add-batch', 'post', 'customer', lambda c: '/api/cart/menu-items/',
+             lambda c: {'items': [{'menuitem': menuitem_id, 'quantity': 1} for menuitem_id in c['menu_item_ids']]}, None),
+    Endpoint('user-orders', 'get', 'customer', lambda c: '/api/cart/orders/', None, None),
+    Endpoint('user-orders-expanded', 'get', 'customer', lambda c: '/api/cart/orders/?expand=items,menuitem', None, None),
+    Endpoint('checkout', 'post', 'customer', lambda c: '/api/cart/orders/', lambda c: {'date': '2024-01-01'}, _refill_cart),
+    Endpoint('assigned-orders', 'get', 'crew', lambda c: '/api/orders/', None, None),
+    Endpoint('assigned-orders-active', 'get', 'crew', lambda c: '/api/orders/?state=active', None, None),
+    Endpoint('order-items', 'get', 'customer', lambda c: f"/api/orders/{c['order_id']}/", None, None),
+    Endpoint('order-status', 'patch', 'crew', lambda c: f"/api/orders/{c['order_id']}/", lambda c: {'status': False}, None),
+    Endpoint('order-events', 'get', 'crew', lambda c: '/api/orders/events/', None, None),
+    Endpoint('sales-report', 'get', 'admin', lambda c: '/api/reports/sales/?start=2024-01-01&end=2024-03-31', None, None),
+    Endpoint('sales-report-menu-items', 'get', 'admin', lambda c: '/api/reports/sales/?group=menu-item&start=2024-01-01&end=2024-03-31', None, None),
+    Endpoint('sales-report-categories', 'get', 'admin', lambda c: '/api/reports/sales/?group=category&start=2024-01-01&end=2024-03-31', None, None),
+    Endpoint('orders-export', 'get', 'admin', lambda c: '/api/orders/export/?start=2024-01-01&end=2024-01-31', None, None),
+    Endpoint('orders-dispatch', 'post', 'admin', lambda c: '/api/orders/dispatch/', lambda c: {'limit': 10}, None),
+]
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def seed(rows, batch_size=5000, rng=None):
+    """
+    Seed a synthetic catalog, users, carts and ``rows`` orders.
+
+    Rows are generated and inserted in batches so memory stays flat for the
+    large tiers. Returns the context the benchmark endpoints run against.
+    """
+    rng = rng or random.Random(0)
+    n_users = max(rows // 100, 20)
+    n_items = max(rows // 100, 50)
+
+    categories = Category.objects.bulk_create(
+        Category(slug=f'category-{i}', title=f'Category {i}') for i in range(20)
+    )
+    for batch in _batches((
+        MenuItem(title=f'Menu item {i}', price=Decimal(rng.randint(200, 4000)) / 100,
+                 featured=i % 10 == 0, category=categories[i % len(categories)])
+        for i in range(n_items)
+    ), batch_size):
+        MenuItem.objects.bulk_create(batch)
+    item_ids = list(MenuItem.objects.values_list('id', flat=True))
+    prices = dict(MenuItem.objects.values_list('id', 'price'))
+
+    admin = User.objects.create_superuser('bench-admin', 'bench-admin@example.com', None)
+    for batch in _batches((
+        User(username=f'bench-user-{i}', email=f'bench-user-{i}@example.com', password='!')
+        for i in range(n_users)
+    ), batch_size):
+        User.objects.bulk_create(batch)
+    user_ids = list(User.objects.filter(username__startswith='bench-user-').order_by('id').values_list('id', flat=True))
+
+    manager, _ = Group.objects.get_or_create(name='Manager')
+    delivery_crew, _ = Group.objects.get_or_create(name='Delivery Crew')
+    crew_ids = user_ids[:max(n_users // 10, 2)]
+    customer_ids = user_ids[len(crew_ids):]
+    memberships = [User.groups.through(user_id=user_id, group_id=delivery_crew.id) for user_id in crew_ids]
+    memberships.append(User.groups.through(user_id=admin.id, group_id=manager.id))
+    User.groups.through.objects.bulk_create(memberships)
+
+    for batch in _batches((
+        Cart(user_id=user_id, menuitem_id=menuitem_id, quantity=1, unit_price=prices[menuitem_id], price=prices[menuitem_id])
+        for user_id in customer_ids
+        for menuitem_id in rng.sample(item_ids, 3)
+    ), batch_size):
+        Cart.objects.bulk_create(batch)
+
+    start = date(2024, 1, 1)
+
+    def make_order(i):
+        crew_id = crew_ids[i % len(crew_ids)] if i % 4 else None
+        delivered = i % 3 == 0
+        return Order(user_id=customer_ids[i % len(customer_ids)], delivery_crew_id=crew_id, status=delivered,
+                     state=state_for(crew_id, delivered), total=Decimal('0.00'), date=start + timedelta(days=i % 365))
+
+    for batch in _batches(range(rows), batch_size):
+        orders = Order.objects.bulk_create(make_order(i) for i in batch)
+        lines = []
+        for order in orders:
+            for menuitem_id in rng.sample(item_ids, 3):
+                lines.append(OrderItem(order_id=order.id, menuitem_id=menuitem_id, quantity=1, unit_price=prices[menuitem_id]))
+                order.total += prices[menuitem_id]
+        OrderItem.objects.bulk_create(lines)
+        Order.objects.bulk_update(orders, ['total'])
+
+    customer = User.objects.get(id=customer_ids[0])
+    crew = User.objects.get(id=crew_ids[0])
+    if not Order.objects.filter(user=customer, delivery_crew=crew).exists():
+        Order.objects.create(user=customer, delivery_crew=crew, state=Order.ASSIGNED, total=Decimal('0.00'), date=start)
+    # Bulk inserts bypass the incremental rollup updates
+    rebuild_rollups()
+    return benchmark_context()
+
+
+def benchmark_context():
+    """Look up the users and rows the benchmark endpoints run against in a seeded database."""
+    admin = User.objects.get(username='bench-admin')
+    crew = User.objects.filter(groups__name='Delivery Crew', username__startswith='bench-user-').order_by('id').first()
+    customer = User.objects.filter(username__startswith='bench-user-', groups__isnull=True).order_by('id').first()
+    order = Order.objects.filter(user=customer, delivery_crew=crew).order_by('id').first()
+    return {
+        'admin': admin,
+        'customer': customer,
+        'crew': crew,
+        'menu_item_id': MenuItem.objects.order_by('id').values_list('id', flat=True).first(),
+        'menu_item_ids': list(MenuItem.objects.order_by('id').values_list('id', flat=True)[:5]),
+        'order_id': order.id,
+    }
+
+
+def unthrottled():
+    """
+    Override the throttle rates with one no run gets near, so the throttles
+    (and their cost) stay in the measurement without rejecting requests.
+    """
+    rates = {scope: '1000000/day' for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']}
+    return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates})
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_benchmarks(context, iterations=20, endpoints=None):
+    """
+    Drive each endpoint through the DRF test client.
+
+    Returns ``{name: {'p50', 'p95', 'queries', 'errors'}}`` with latencies in
+    milliseconds and the largest number of queries seen for one request.
+    """
+    client = APIClient()
+    results = {}
+    with unthrottled():
+        for endpoint in endpoints or ENDPOINTS:
+            client.force_authenticate(context[endpoint.role])
+            timings, queries, errors = [], 0, 0
+            for _ in range(iterations):
+                if endpoint.setup:
+                    endpoint.setup(context)
+                data = endpoint.data(context) if endpoint.data else None
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = getattr(client, endpoint.method)(endpoint.path(context), data, format='json')
+                    if response.streaming:
+                        # Streaming responses only query as they are read
+                        b''.join(response.streaming_content)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries = max(queries, len(captured))
+                errors += response.status_code >= 400
+            results[endpoint.name] = {
+                'p50': percentile(timings, 50),
+                'p95': percentile(timings, 95),
+                'queries': queries,
+                'errors': errors,
+            }
+    return results
+
+
+def find_regressions(results, baseline=None, tolerance=1.5, budgets=QUERY_BUDGETS):
+    """Return a message for every endpoint over its query budget or baseline latency."""
+    failures = []
+    for name, result in results.items():
+        if result['errors']:
+            failures.append(f"{name}: {result['errors']} failed requests")
+        budget = budgets.get(name)
+        if budget is not None and result['queries'] > budget:
+            failures.append(f"{name}: {result['queries']} queries (budget {budget})")
+        if baseline and name in baseline and result['p95'] > baseline[name]['p95'] * tolerance:
+            failures.append(f"{name}: p95 {result['p95']:.2f}ms (baseline {baseline[name]['p95']:.2f}ms)")
+    return failures
+
+
+# Requests not worth timing on every run whose query plans are still checked
+PLAN_ENDPOINTS = ENDPOINTS + [
+    Endpoint('menu-items-by-title', 'get', 'customer', lambda c: '/api/menu-items/?ordering=title', None, None),
+    Endpoint('menu-items-search', 'get', 'customer', lambda c: '/api/menu-items/?search=item', None, None),
+    Endpoint('user-orders-by-id', 'get', 'customer', lambda c: '/api/cart/orders/?ordering=-id', None, None),
+    Endpoint('assigned-orders-by-total', 'get', 'crew', lambda c: '/api/orders/?ordering=-total', None, None),
+]
+
+# Tables an endpoint reads in full because it returns every row of them
+FULL_SCANS = {
+    'categories': {'myapp_category'},
+}
+# Endpoints that sort the rows they found, because the order is computed
+# (search relevance), rather than read an index in order
+SORTS = {'menu-items-search'}
+# Tables of a handful of rows, which the planner rightly scans once it has statistics
+LOOKUP_TABLES = {'auth_group'}
+
+_NOT_EXPLAINED = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT', 'PRAGMA')
+_TABLE = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.IGNORECASE)
+_SCAN = re.compile(r'^SCAN (\w+)')
+_SORT = re.compile(r'^USE TEMP B-TREE FOR .*ORDER BY')
+_INDEX_WALK = re.compile(r' USING (?:COVERING )?INDEX | VIRTUAL TABLE INDEX ')
+
+
+def explain(sql, params=()):
+    """Return the lines of SQLite's EXPLAIN QUERY PLAN for ``sql``."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def _request_each(context, endpoints):
+    # One request per endpoint, yielded with the queries it ran
+    client = APIClient()
+    with unthrottled():
+        for endpoint in endpoints:
+            client.force_authenticate(context[endpoint.role])
+            if endpoint.setup:
+                endpoint.setup(context)
+            data = endpoint.data(context) if endpoint.data else None
+            with CaptureQueriesContext(connection) as captured:
+                response = getattr(client, endpoint.method)(endpoint.path(context), data, format='json')
+                if response.streaming:
+                    # Streaming responses only query as they are read
+                    b''.join(response.streaming_content)
+            yield endpoint, response, captured
+
+
+def explain_endpoints(context, endpoints=None):
+    """
+    Send one request to each endpoint and explain every query it ran.
+
+    Returns ``{name: [(sql, plan lines), ...]}``.
+    """
+    plans = {}
+    for endpoint, _, captured in _request_each(context, endpoints or PLAN_ENDPOINTS):
+        queries = [query['sql'] for query in captured.captured_queries
+                   if not query['sql'].lstrip().upper().startswith(_NOT_EXPLAINED)]
+        plans[endpoint.name] = [(sql, explain(sql)) for sql in queries]
+    return plans
+
+
+def profile_endpoints(context, endpoints=None):
+    """
+    Send one request to each endpoint through QueryProfilerMiddleware.
+
+    Returns ``{name: QueryProfile}``.
+    """
+    with override_settings(QUERY_PROFILER={**get_settings(), 'ENABLED': True}):
+        return {endpoint.name: response.query_profile
+                for endpoint, response, _ in _request_each(context, endpoints or PLAN_ENDPOINTS)}
+
+
+def find_table_scans(plans, allowed=FULL_SCANS, sorts=SORTS):
+    """
+    Return a message for every query that reads a whole table or sorts its
+    rows in a temporary B-tree.
+
+    A scan is fine when it walks an index in the order asked for and the
+    query has a LIMIT, so it stops after a page; when ``allowed`` says the
+    endpoint returns the whole table; or when the table is one of
+    LOOKUP_TABLES. A LIMIT does not excuse a plain table scan. Sorts are
+    fine only for the endpoints in ``sorts``.
+    """
+    tables = set(connection.introspection.table_names())
+    failures = []
+    for name, queries in plans.items():
+        for sql, plan in queries:
+            limited = re.search(r'\bLIMIT\b', sql, re.IGNORECASE)
+            # Resolve aliases such as "FROM myapp_order o" back to their table
+            aliases = {}
+            for table, alias in _TABLE.findall(sql):
+                if table in tables:
+                    aliases[table] = table
+                    if alias:
+                        aliases.setdefault(alias, table)
+            for line in plan:
+                if _SORT.match(line) and name not in sorts:
+                    failures.append(f'{name}: {line} in {" ".join(sql.split())[:200]}')
+                    continue
+                match = _SCAN.match(line)
+                if match and limited and _INDEX_WALK.search(line):
+                    continue
+                table = match and aliases.get(match.group(1))
+                if table and table not in LOOKUP_TABLES and table not in allowed.get(name, ()):
+                    failures.append(f'{name}: {line} in {" ".join(sql.split())[:200]}')
+    return failures
+
+
+def benchmark_authentication(user, iterations=200):
+    """
+    Measure the per-request cost of each authentication mode for ``user``.
+
+    Returns ``{mode: {'p50', 'p95', 'queries'}}`` with latencies in
+    microseconds and the average number of queries per request.
+    """
+    token, _ = Token.objects.get_or_create(user=user)
+    access = str(AccessToken.for_user(user))
+    modes = {
+        'token': (TokenAuthentication(), f'Token {token.key}'),
+        'token-cached': (CachedTokenAuthentication(), f'Token {token.key}'),
+        'jwt': (JWTAuthentication(), f'Bearer {access}'),
+        'jwt-cached': (CachedJWTAuthentication(), f'Bearer {access}'),
+    }
+    factory = APIRequestFactory()
+    results = {}
+    for name, (authenticator, header) in modes.items():
+        timings = []
+        with CaptureQueriesContext(connection) as captured:
+            for _ in range(iterations):
+                request = Request(factory.get('/api/menu-items/', HTTP_AUTHORIZATION=header))
+                started = time.perf_counter()
+                authenticator.authenticate(request)
+                timings.append((time.perf_counter() - started) * 1_000_000)
+        results[name] = {
+            'p50': percentile(timings, 50),
+            'p95': percentile(timings, 95),
+            'queries': len(captured) / iterations,
+        }
+    return results
+
+
+# The read paths the ASGI app serves from native async views
+SERVER_PATHS = [
+    lambda c: '/api/menu-items/',
+    lambda c: f"/api/menu-items/{c['menu_item_id']}/",
+    lambda c: '/api/cart/menu-items/',
+    lambda c: '/api/cart/orders/',
+]
+
+
+def _wsgi_request(application, path, headers, method='GET', body=b''):
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1', 'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    for name, value in headers.items():
+        key = name.upper().replace('-', '_')
+        environ[key if key in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + key] = value
+    statuses = []
+    result = application(environ, lambda status, response_headers, exc_info=None: statuses.append(status))
+    try:
+        b''.join(result)
+    finally:
+        result.close()
+    return int(statuses[0].split()[0])
+
+
+async def _asgi_request(application, path, headers, method='GET', body=b''):
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'content-length', str(len(body)).encode())]
+                   + [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+    }
+    statuses = []
+    body_sent = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # Like a real server, only report the disconnect once the response is out
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+        elif not message.get('more_body', False):
+            finished.set()
+
+    await application(scope, receive, send)
+    return statuses[0]
+
+
+def _summarise(timings, statuses, elapsed):
+    return {
+        'throughput': len(timings) / elapsed,
+        'p50': percentile(timings, 50),
+        'p95': percentile(timings, 95),
+        'errors': sum(status >= 400 for status in statuses),
+    }
+
+
+def benchmark_servers(context, requests=400, concurrency=16):
+    """
+    Compare the WSGI and ASGI apps on the hot read paths under concurrent load.
+
+    Sends ``requests`` GETs spread over SERVER_PATHS to each app with
+    ``concurrency`` requests in flight (a thread pool for WSGI, tasks on one
+    event loop for ASGI). Returns ``{'wsgi': {...}, 'asgi': {...}}`` with
+    requests per second, p50/p95 latency in milliseconds and error count.
+    """
+    from myproject.asgi import application as asgi_application
+    from myproject.wsgi import application as wsgi_application
+
+    token, _ = Token.objects.get_or_create(user=context['customer'])
+    headers = {'Authorization': f'Token {token.key}'}
+    paths = [SERVER_PATHS[i % len(SERVER_PATHS)](context) for i in range(requests)]
+    results = {}
+
+    with unthrottled():
+        def timed_wsgi(path):
+            started = time.perf_counter()
+            status = _wsgi_request(wsgi_application, path, headers)
+            return (time.perf_counter() - started) * 1000, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(timed_wsgi, paths))
+        results['wsgi'] = _summarise([t for t, _ in outcomes], [s for _, s in outcomes], time.perf_counter() - started)
+
+        async def run_asgi():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def timed_asgi(path):
+                async with semaphore:
+                    started = time.perf_counter()
+                    status = await _asgi_request(asgi_application, path, headers)
+                    return (time.perf_counter() - started) * 1000, status
+
+            return await asyncio.gather(*(timed_asgi(path) for path in paths))
+
+        started = time.perf_counter()
+        outcomes = asyncio.run(run_asgi())
+        results['asgi'] = _summarise([t for t, _ in outcomes], [s for _, s in outcomes], time.perf_counter() - started)
+    return results
+
+
+def benchmark_writes(workers=8, operations=25, profiles=None):
+    """
+    Measure cart and checkout write throughput with concurrent writers.
+
+    Each of ``workers`` threads, one per customer, adds ``operations`` items
+    to its cart and checks each out, on its own connection. Runs once per
+    pragma profile (SQLite's defaults and SQLITE_PRAGMAS unless given) and
+    returns ``{profile: {'throughput', 'cart-add', 'checkout', 'errors'}}``
+    with writes per second and p95 latencies in milliseconds. Needs a file
+    database; an in-memory one has no journal to tune.
+    """
+    profiles = profiles or {'sqlite-defaults': SQLITE_DEFAULTS, 'profile': get_profile()}
+    customers = list(User.objects.filter(username__startswith='bench-user-', groups__isnull=True).order_by('id')[:workers])
+    items = list(MenuItem.objects.order_by('id')[:operations])
+    results = {}
+
+    def write(user):
+        timings = {'cart-add': [], 'checkout': []}
+        errors = 0
+        try:
+            for item in items:
+                try:
+                    started = time.perf_counter()
+                    add_to_cart(user, {item.id: 1})
+                    timings['cart-add'].append((time.perf_counter() - started) * 1000)
+                    started = time.perf_counter()
+                    place_order(user, date.today())
+                    timings['checkout'].append((time.perf_counter() - started) * 1000)
+                except OperationalError:
+                    # database is locked: the writer gave up waiting
+                    errors += 1
+        finally:
+            connection.close()
+        return timings, errors
+
+    for name, pragmas in profiles.items():
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            # Reconnect so every connection (and the journal mode) picks up the profile
+            connections.close_all()
+            Cart.objects.filter(user__in=customers).delete()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                outcomes = list(pool.map(write, customers))
+            elapsed = time.perf_counter() - started
+            connections.close_all()
+        cart_adds = [t for timings, _ in outcomes for t in timings['cart-add']]
+        checkouts = [t for timings, _ in outcomes for t in timings['checkout']]
+        results[name] = {
+            'throughput': (len(cart_adds) + len(checkouts)) / elapsed,
+            'cart-add': percentile(cart_adds, 95) if cart_adds else None,
+            'checkout': percentile(checkouts, 95) if checkouts else None,
+            'errors': sum(errors for _, errors in outcomes),
+        }
+    return results
+
+
+def benchmark_export(chunk_size=2000):
+    """
+    Stream the full order export in every format and measure its footprint.
+
+    Returns ``{type: {'rows', 'seconds', 'peak_kib'}}``: lines written, wall
+    time and the peak Python memory allocated while exporting. The peak
+    should not grow with the data tier.
+    """
+    results = {}
+    for name, (_, write_lines) in FORMATS.items():
+        lines = 0
+        tracemalloc.start()
+        started = time.perf_counter()
+        for _ in write_lines(export_rows(chunk_size=chunk_size)):
+            lines += 1
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {'rows': lines, 'seconds': elapsed, 'peak_kib': peak / 1024}
+    return results
+
+
+def benchmark_serializers(rows=10_000, iterations=5):
+    """
+    Compare ModelSerializer and ValuesSerializer on lists of up to ``rows`` rows.
+
+    Both sides include the query. Returns ``{name: {'rows', 'model', 'values'}}``
+    with the median milliseconds of each over ``iterations`` runs.
+    """
+    lists = {
+        'menu-items': (MenuItemSerializer, MenuItem.objects.order_by('id')[:rows]),
+        'categories': (CategorySerializer, Category.objects.order_by('id')[:rows]),
+        'cart': (CartSerializer, Cart.objects.order_by('id')[:rows]),
+        'orders': (OrderSerializer, Order.objects.order_by('id')[:rows]),
+    }
+    results = {}
+    for name, (serializer_class, queryset) in lists.items():
+        model_timings, values_timings = [], []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            serializer_class(queryset.all(), many=True).data
+            model_timings.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            ValuesSerializer(serializer_class).data(queryset.all())
+            values_timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {
+            'rows': queryset.count(),
+            'model': percentile(model_timings, 50),
+            'values': percentile(values_timings, 50),
+        }
+    return results
@@ -0,0 +1,109 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+CATALOG = 'catalog'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def get_version(name):
+    # Versions start from a timestamp so a version key that was evicted never
+    # comes back at a number that older cache entries were stored under.
+    cache = get_cache()
+    version = cache.get(_version_key(name))
+    if version is None:
+        cache.add(_version_key(name), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(name))
+    return version
+
+
+def bump_version(name):
+    cache = get_cache()
+    try:
+        return cache.incr(_version_key(name))
+    except ValueError:
+        cache.add(_version_key(name), time.time_ns(), timeout=None)
+        return cache.get(_version_key(name))
+
+
+def _is_local(cache):
+    # LocMemCache never blocks, so async callers can skip the thread hop
+    return isinstance(cache, LocMemCache)
+
+
+async def aget_version(name):
+    if _is_local(get_cache()):
+        return get_version(name)
+    cache = get_cache()
+    version = await cache.aget(_version_key(name))
+    if version is None:
+        await cache.aadd(_version_key(name), time.time_ns(), timeout=None)
+        version = await cache.aget(_version_key(name))
+    return version
+
+
+async def aget(key):
+    cache = get_cache()
+    return cache.get(key) if _is_local(cache) else await cache.aget(key)
+
+
+async def aset(key, value, timeout):
+    cache = get_cache()
+    if _is_local(cache):
+        cache.set(key, value, timeout)
+    else:
+        await cache.aset(key, value, timeout)
+
+
+def catalog_etag(request, version):
+    """Return the ETag and cache key of a catalog request under ``version``."""
+    variant = '\n'.join([str(version), request.build_absolute_uri(), request.META.get('HTTP_ACCEPT', '')])
+    digest = hashlib.sha1(variant.encode('utf-8')).hexdigest()
+    return f'"{digest}"', f'{CATALOG}:{digest}'
+
+
+def cache_catalog_response(view_func):
+    """
+    Cache GET responses of a catalog view under the current menu version.
+
+    Responses carry a strong ETag derived from the version and the request,
+    so a client that sends it back in If-None-Match gets a 304.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view_func(request, *args, **kwargs)
+
+        etag, key = catalog_etag(request, get_version(CATALOG))
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        else:
+            cache = get_cache()
+            data = cache.get(key)
+            if data is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 3600))
+                data = response.data
+            response = Response(data, headers=headers)
+        patch_vary_headers(response, ['Accept'])
+        return response
+    return wrapper
@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+from django.db import connections, router
+
+from .models import Cart, MenuItem
+
+# Adds every requested line in one statement: new lines take the menu item's
+# current price, lines already in the cart keep their unit price and grow by
+# the requested quantity. Nothing is written if any menu item is missing.
+UPSERT_SQL = """
+    WITH requested (menuitem_id, quantity) AS (VALUES {values})
+    INSERT INTO {cart} (user_id, menuitem_id, quantity, unit_price, price)
+    SELECT %s, m.id, r.quantity, m.price, m.price * r.quantity
+    FROM requested r INNER JOIN {menuitem} m ON m.id = r.menuitem_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM requested LEFT JOIN {menuitem} ON {menuitem}.id = requested.menuitem_id
+        WHERE {menuitem}.id IS NULL
+    )
+    ON CONFLICT (menuitem_id, user_id) DO UPDATE SET
+        quantity = {cart}.quantity + excluded.quantity,
+        price = ({cart}.quantity + excluded.quantity) * {cart}.unit_price
+    RETURNING id, menuitem_id, quantity, unit_price, price
+"""
+
+CENT = Decimal('0.01')
+
+
+def _decimal(value):
+    # Raw cursors hand SQLite's numeric columns back as floats
+    return Decimal(str(value)).quantize(CENT)
+
+
+def add_to_cart(user, lines):
+    """
+    Add ``{menuitem_id: quantity}`` to the user's cart with a single query.
+
+    Returns ``[(cart_item, created), ...]``. Raises MenuItem.DoesNotExist,
+    without changing the cart, when a menu item does not exist.
+    """
+    if not lines:
+        return []
+    connection = connections[router.db_for_write(Cart)]
+    quote = connection.ops.quote_name
+    sql = UPSERT_SQL.format(
+        values=', '.join(['(%s, %s)'] * len(lines)),
+        cart=quote(Cart._meta.db_table),
+        menuitem=quote(MenuItem._meta.db_table),
+    )
+    params = [value for line in lines.items() for value in line] + [user.pk]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    if not rows:
+        missing = set(lines) - set(MenuItem.objects.filter(id__in=lines).values_list('id', flat=True))
+        raise MenuItem.DoesNotExist(f"Menu item does not exist: {', '.join(map(str, sorted(missing)))}.")
+
+    rows = {row[1]: row for row in rows}
+    results = []
+    for menuitem_id, requested in lines.items():
+        cart_id, _, quantity, unit_price, price = rows[menuitem_id]
+        cart_item = Cart(id=cart_id, user=user, menuitem_id=menuitem_id, quantity=quantity,
+                         unit_price=_decimal(unit_price), price=_decimal(price))
+        # A line that already existed comes back with more than was requested
+        results.append((cart_item, quantity == requested))
+    return results
+
+
+def parse_lines(items):
+    """
+    Turn ``[{'menuitem': id, 'quantity': n}, ...]`` into ``{id: n}``.
+
+    Repeated menu items are summed. Raises ValueError for a missing or
+    non-positive quantity or menu item.
+    """
+    lines = {}
+    for item in items:
+        menuitem_id, quantity = int(item['menuitem']), int(item['quantity'])
+        if menuitem_id < 1 or quantity < 1:
+            raise ValueError('Menu item and quantity must be positive numbers.')
+        lines[menuitem_id] = lines.get(menuitem_id, 0) + quantity
+    return lines
@@ -0,0 +1,89 @@
+from django.db import transaction
+
+from .cache import CATALOG, bump_version
+from .models import Category, MenuItem
+from .serializers import MenuItemSyncSerializer
+
+BATCH_SIZE = 500
+FIELDS = ['title', 'price', 'featured', 'category_id']
+
+
+def _fail(result, field, message):
+    result.update(status='error', errors={field: [message]})
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def sync_menu_items(upserts, deletes):
+    """
+    Create, update and delete many menu items in one transaction.
+
+    Rows of ``upserts`` with an ``id`` update that menu item (only the fields
+    given); rows without one create a new item. ``deletes`` is a list of ids.
+    Returns ``(results, ok)`` with one result per row of each list, in request
+    order. Nothing is written unless every row is valid.
+    """
+    # Check every row in Python first...
+    upsert_results, valid_rows = [], []
+    for row in upserts:
+        serializer = MenuItemSyncSerializer(data=row, partial=isinstance(row, dict) and 'id' in row)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            result = {'id': data.get('id'), 'status': 'updated' if 'id' in data else 'created'}
+            valid_rows.append((result, data))
+        else:
+            result = {'id': row.get('id') if isinstance(row, dict) else None, 'status': 'error', 'errors': serializer.errors}
+        upsert_results.append(result)
+
+    delete_results, delete_ids = [], []
+    for menu_item_id in deletes:
+        result = {'id': menu_item_id, 'status': 'deleted'}
+        if _is_id(menu_item_id):
+            delete_ids.append(menu_item_id)
+        else:
+            _fail(result, 'id', 'A valid integer is required.')
+        delete_results.append(result)
+
+    # ...then look up every referenced category and menu item with one query each
+    category_ids = {data['category_id'] for _, data in valid_rows if 'category_id' in data}
+    categories = set(Category.objects.filter(id__in=category_ids).values_list('id', flat=True))
+    existing = MenuItem.objects.in_bulk([data['id'] for _, data in valid_rows if 'id' in data] + delete_ids)
+
+    for result, data in valid_rows:
+        if 'category_id' in data and data['category_id'] not in categories:
+            _fail(result, 'category', f"Invalid pk \"{data['category_id']}\" - object does not exist.")
+        elif 'id' in data and data['id'] not in existing:
+            _fail(result, 'id', 'Menu item does not exist.')
+        elif 'id' in data and data['id'] in delete_ids:
+            _fail(result, 'id', 'Menu item cannot be updated and deleted in the same request.')
+    for result in delete_results:
+        if result['status'] != 'error' and result['id'] not in existing:
+            _fail(result, 'id', 'Menu item does not exist.')
+
+    results = {'upsert': upsert_results, 'delete': delete_results}
+    if any(result['status'] == 'error' for result in upsert_results + delete_results):
+        return results, False
+
+    with transaction.atomic():
+        created = [(result, MenuItem(**data)) for result, data in valid_rows if 'id' not in data]
+        MenuItem.objects.bulk_create([menu_item for _, menu_item in created], batch_size=BATCH_SIZE)
+        for result, menu_item in created:
+            result['id'] = menu_item.id
+
+        # Later rows for the same menu item win, as if applied one by one
+        changed = {}
+        for _, data in valid_rows:
+            if 'id' in data:
+                menu_item = existing[data['id']]
+                for field, value in data.items():
+                    setattr(menu_item, field, value)
+                changed[menu_item.id] = menu_item
+        MenuItem.objects.bulk_update(changed.values(), FIELDS, batch_size=BATCH_SIZE)
+
+        MenuItem.objects.filter(id__in=delete_ids).delete()
+
+        # Bulk writes send no post_save signals, so move the catalog on by hand
+        transaction.on_commit(lambda: bump_version(CATALOG))
+    return results, True
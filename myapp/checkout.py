@@ -0,0 +1,87 @@
+from django.db import IntegrityError, connections, router, transaction
+
+from .dispatch import assign_orders
+from .events import record_placed
+from .jobs import enqueue
+from .models import Cart, Order, OrderItem
+from .notifications import send_order_receipt
+from .rollups import record_orders
+
+
+class EmptyCart(Exception):
+    pass
+
+
+# The order comes straight from the cart, its total summed in the same
+# statement; with HAVING an empty cart inserts nothing
+ORDER_SQL = """
+    INSERT INTO {order} (user_id, status, state, total, date, idempotency_key)
+    SELECT %(user)s, %(status)s, %(state)s, SUM(c.quantity * c.unit_price), %(date)s, %(key)s
+    FROM {cart} c
+    WHERE c.user_id = %(user)s
+    HAVING COUNT(*) > 0
+    RETURNING *
+"""
+ORDER_ITEMS_SQL = """
+    INSERT INTO {orderitem} (order_id, menuitem_id, quantity, unit_price)
+    SELECT %(order)s, c.menuitem_id, c.quantity, c.unit_price
+    FROM {cart} c
+    WHERE c.user_id = %(user)s
+"""
+
+
+def _tables(connection):
+    quote = connection.ops.quote_name
+    return {
+        'order': quote(Order._meta.db_table),
+        'orderitem': quote(OrderItem._meta.db_table),
+        'cart': quote(Cart._meta.db_table),
+    }
+
+
+def place_order(user, order_date, idempotency_key=None):
+    """
+    Turn the user's cart into an order in a single transaction.
+
+    Returns ``(order, created)``. When ``idempotency_key`` matches an order the
+    user already placed, that order is returned instead of creating another.
+    Raises EmptyCart, writing nothing, when the cart has no items.
+    """
+    if idempotency_key:
+        existing = Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return existing, False
+
+    connection = connections[router.db_for_write(Order)]
+    tables = _tables(connection)
+    try:
+        with transaction.atomic(using=connection.alias):
+            # Write first: on SQLite that takes the database write lock (waiting
+            # out busy_timeout) before anything is read, while a transaction that
+            # reads first fails outright if another writer commits in between.
+            # Holding the lock, no concurrent checkout can order the cart twice.
+            order = next(iter(Order.objects.db_manager(connection.alias).raw(ORDER_SQL.format(**tables), {
+                'user': user.id, 'status': False, 'state': Order.PLACED, 'key': idempotency_key,
+                'date': connection.ops.adapt_datefield_value(order_date),
+            })), None)
+            if order is None:
+                raise EmptyCart('The cart is empty.')
+            with connection.cursor() as cursor:
+                cursor.execute(ORDER_ITEMS_SQL.format(**tables), {'order': order.id, 'user': user.id})
+            record_orders([order.id])
+            record_placed([order])
+            # The rest is left to a worker (`manage.py runworker`); queued in
+            # this transaction, the jobs exist exactly when the order does.
+            # One waiting dispatch run picks up every order placed before it.
+            enqueue(send_order_receipt, args=[order.id])
+            enqueue(assign_orders, key='dispatch_orders')
+
+            # Clear the cart as part of the same transaction
+            Cart.objects.filter(user=user).delete()
+    except IntegrityError:
+        # A concurrent retry with the same key got there first
+        if idempotency_key:
+            return Order.objects.get(user=user, idempotency_key=idempotency_key), False
+        raise
+    return order, True
+
@@ -0,0 +1,60 @@
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# What SQLite (through Python's sqlite3 module) uses when nothing is set
+SQLITE_DEFAULTS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'cache_size': -2000,
+    'mmap_size': 0,
+    'busy_timeout': 5000,
+    'temp_store': 'DEFAULT',
+}
+
+# PRAGMA reports these as numbers
+_NAMED_VALUES = {
+    'synchronous': ['OFF', 'NORMAL', 'FULL', 'EXTRA'],
+    'temp_store': ['DEFAULT', 'FILE', 'MEMORY'],
+}
+
+_VALUE = re.compile(r'^-?[A-Za-z0-9_]+$')
+
+
+def get_profile():
+    return getattr(settings, 'SQLITE_PRAGMAS', {})
+
+
+def _check(name, value):
+    if name not in SQLITE_DEFAULTS:
+        raise ImproperlyConfigured(f'Unsupported SQLite pragma in SQLITE_PRAGMAS: {name!r}')
+    if not _VALUE.match(str(value)):
+        raise ImproperlyConfigured(f'Invalid value for SQLite pragma {name!r}: {value!r}')
+
+
+def apply_pragmas(connection, pragmas=None):
+    """Set every pragma of ``pragmas`` (the SQLITE_PRAGMAS profile by default) on ``connection``."""
+    pragmas = get_profile() if pragmas is None else pragmas
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            _check(name, value)
+            # PRAGMA takes no bound parameters; names and values are validated above
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def active_pragmas(connection):
+    """Return the value every supported pragma currently has on ``connection``."""
+    active = {}
+    with connection.cursor() as cursor:
+        for name in SQLITE_DEFAULTS:
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            if row is None:
+                # In-memory databases report nothing for mmap_size
+                active[name] = None
+            elif name in _NAMED_VALUES:
+                active[name] = _NAMED_VALUES[name][row[0]]
+            else:
+                active[name] = row[0].upper() if isinstance(row[0], str) else row[0]
+    return active
@@ -0,0 +1,79 @@
+import heapq
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .events import record_assignments
+from .lifecycle import active_orders
+from .models import Order
+from .roles import DELIVERY_CREW
+
+BATCH_SIZE = 500
+
+
+def crew_loads():
+    """Return ``{user_id: open orders}`` for every active delivery crew member."""
+    crew = User.objects.filter(groups__name=DELIVERY_CREW, is_active=True).values_list('id', flat=True)
+    loads = dict.fromkeys(crew, 0)
+    if loads:
+        # One grouped read of the active orders' partial index
+        open_orders = (active_orders().filter(delivery_crew__in=list(loads))
+                       .values_list('delivery_crew').annotate(count=Count('id')).order_by())
+        loads.update(open_orders)
+    return loads
+
+
+def assign_orders(batch_size=BATCH_SIZE, limit=None):
+    """
+    Assign placed orders to the delivery crew, oldest first.
+
+    Each order goes to the crew member with the fewest open orders at that
+    point. Orders are read a batch at a time and every batch is written with
+    one ``bulk_update`` (and its assignment events) in its own short
+    transaction, so the order table is never locked for a whole run. Orders
+    assigned or cancelled by someone else in the meantime are left alone.
+    Returns ``{user_id: orders assigned}``.
+    """
+    assigned = {}
+    total = 0
+    pending = Order.objects.filter(state=Order.PLACED)
+    last = None
+    while limit is None or total < limit:
+        loads = crew_loads()
+        if not loads:
+            break
+
+        # The next batch of waiting orders, after the last one looked at
+        candidates = pending
+        if last:
+            last_id, last_date = last
+            candidates = candidates.filter(Q(date__gt=last_date) | Q(date=last_date, id__gt=last_id))
+        size = batch_size if limit is None else min(batch_size, limit - total)
+        rows = list(candidates.order_by('date', 'id').values_list('id', 'date')[:size])
+        if not rows:
+            break
+        last = rows[-1]
+
+        # Hand each order to whoever has the least open work, ties to the lowest id
+        heap = [(load, user_id) for user_id, load in loads.items()]
+        heapq.heapify(heap)
+        batch = []
+        for order_id, _ in rows:
+            load, user_id = heap[0]
+            batch.append(Order(id=order_id, delivery_crew_id=user_id, state=Order.ASSIGNED))
+            heapq.heapreplace(heap, (load + 1, user_id))
+
+        with transaction.atomic():
+            # Filtering on pending skips orders that changed since they were read
+            updated = pending.bulk_update(batch, ['delivery_crew', 'state'])
+            if updated < len(batch):
+                current = dict(Order.objects.filter(id__in=[order.id for order in batch])
+                               .values_list('id', 'delivery_crew_id'))
+                batch = [order for order in batch if current.get(order.id) == order.delivery_crew_id]
+            # Tell each crew member about their new orders
+            record_assignments(batch)
+        for order in batch:
+            assigned[order.delivery_crew_id] = assigned.get(order.delivery_crew_id, 0) + 1
+        total += len(batch)
+    return assigned
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Order, OrderEvent
+
+# Events read from the table at a time
+BATCH_SIZE = 100
+# How long EventSource clients wait before reconnecting, in milliseconds
+RETRY = 3000
+FIELDS = ['id', 'kind', 'from_state', 'state', 'order_id', 'order__user_id', 'order__total', 'order__date']
+
+# Streams in this process waiting for new events: (loop, asyncio.Event)
+_listeners = set()
+_lock = threading.Lock()
+
+
+def notify():
+    """Wake every stream in this process to look for new events."""
+    with _lock:
+        listeners = list(_listeners)
+    for loop, event in listeners:
+        loop.call_soon_threadsafe(event.set)
+
+
+def _record(events):
+    OrderEvent.objects.bulk_create(events)
+    # Wake this process's streams once the events are visible; streams in
+    # other processes pick them up on their next poll
+    transaction.on_commit(notify)
+
+
+def _event(order, kind, delivery_crew_id, from_state=''):
+    return OrderEvent(order_id=order.id, delivery_crew_id=delivery_crew_id, kind=kind, from_state=from_state,
+                      state=order.state)
+
+
+def record_placed(orders):
+    """Start the lifecycle log of newly placed ``orders``."""
+    _record([_event(order, OrderEvent.PLACED, order.delivery_crew_id) for order in orders])
+
+
+def record_assignments(orders, from_state=Order.PLACED):
+    """Record ``orders`` as newly assigned to their ``delivery_crew_id``."""
+    _record([_event(order, OrderEvent.ASSIGNED, order.delivery_crew_id, from_state) for order in orders])
+
+
+def record_order_change(order, previous_crew_id, previous_state):
+    """
+    Log what changed on ``order``, once for each delivery crew member it
+    concerns (or once without one).
+    """
+    events = []
+    if previous_crew_id != order.delivery_crew_id:
+        if previous_crew_id:
+            events.append(_event(order, OrderEvent.UNASSIGNED, previous_crew_id, previous_state))
+        if order.delivery_crew_id:
+            events.append(_event(order, OrderEvent.ASSIGNED, order.delivery_crew_id, previous_state))
+    elif previous_state != order.state:
+        events.append(_event(order, OrderEvent.STATUS, order.delivery_crew_id, previous_state))
+    if events:
+        _record(events)
+
+
+def events_after(user_id, last_id):
+    """The next events for a delivery crew member after event ``last_id``, oldest first."""
+    return (OrderEvent.objects.filter(delivery_crew_id=user_id, id__gt=last_id)
+            .order_by('id').values(*FIELDS)[:BATCH_SIZE])
+
+
+def latest_event_id(user_id):
+    return OrderEvent.objects.filter(delivery_crew_id=user_id).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def prune_events(before):
+    """Delete the events created before ``before``; returns how many."""
+    # Ids grow with time, so the old events are one primary key range
+    first_kept = OrderEvent.objects.filter(created__gte=before).order_by('id').values_list('id', flat=True).first()
+    old = OrderEvent.objects.all() if first_kept is None else OrderEvent.objects.filter(id__lt=first_kept)
+    return old.delete()[0]
+
+
+def format_event(row):
+    data = {
+        'order': row['order_id'],
+        'user': row['order__user_id'],
+        'state': row['state'],
+        'from_state': row['from_state'] or None,
+        'status': row['state'] == Order.DELIVERED,
+        'total': f"{row['order__total']:.2f}",
+        'date': row['order__date'].isoformat(),
+    }
+    return f"id: {row['id']}\nevent: {row['kind']}\ndata: {json.dumps(data)}\n\n"
+
+
+def parse_last_event_id(request):
+    """
+    The event a client last saw: the Last-Event-ID header EventSource sends
+    when it reconnects, or ``?last_event_id=`` on the first connection.
+    Returns None when neither is given; raises ValueError for a bad one.
+    """
+    value = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if value in (None, ''):
+        return None
+    last_id = int(value)
+    if last_id < 0:
+        raise ValueError(value)
+    return last_id
+
+
+class _Listener:
+    def __enter__(self):
+        self.event = asyncio.Event()
+        self._entry = (asyncio.get_running_loop(), self.event)
+        with _lock:
+            _listeners.add(self._entry)
+        return self
+
+    def __exit__(self, *exc_info):
+        with _lock:
+            _listeners.discard(self._entry)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+async def stream_events(user_id, last_id):
+    """
+    Yield server-sent events for a delivery crew member after ``last_id``,
+    forever.
+
+    Waits for a notification from this process or, failing that, polls every
+    ``ORDER_EVENTS_POLL_INTERVAL`` seconds, sending a comment line to keep the
+    connection open when nothing happened.
+    """
+    poll_interval = getattr(settings, 'ORDER_EVENTS_POLL_INTERVAL', 5)
+    yield f'retry: {RETRY}\n\n'
+    with _Listener() as listener:
+        while True:
+            # Clear before reading so a notification during the read is not lost
+            listener.event.clear()
+            rows = [row async for row in events_after(user_id, last_id)]
+            for row in rows:
+                yield format_event(row)
+                last_id = row['id']
+            if len(rows) < BATCH_SIZE and not await listener.wait(poll_interval):
+                yield ': keepalive\n\n'
@@ -0,0 +1,116 @@
+import csv
+import heapq
+import json
+from itertools import groupby, islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .archive import archive_horizon
+from .models import ArchivedOrder, Order
+
+ORDER_FIELDS = ['id', 'user_id', 'delivery_crew_id', 'status', 'state', 'total', 'date']
+ITEM_FIELDS = ['menuitem_id', 'quantity', 'unit_price']
+
+# Exported column names
+_COLUMNS = ORDER_FIELDS + ITEM_FIELDS
+_DATE = ORDER_FIELDS.index('date')
+
+
+def _lookups(model):
+    # The values() lookups for an order model and its lines
+    lines = model.orderitem_set.field.related_query_name()
+    return ORDER_FIELDS + [f'{lines}__{field}' for field in ITEM_FIELDS]
+
+
+def export_rows(start=None, end=None, chunk_size=2000):
+    """
+    Yield one tuple per order line, orders without lines included once, from
+    the order tables and the order archive.
+
+    Rows come in ``(date, id)`` order, which the date indexes of both already
+    hold, so the database streams them without sorting, the two are merged as
+    they are read, and only ``chunk_size`` rows of each are in memory at a
+    time.
+    """
+    sources = [Order.objects.all()]
+    if start is None or start < archive_horizon():
+        # Archived orders are all dated before the horizon
+        sources.append(ArchivedOrder.objects.all())
+    streams = []
+    for orders in sources:
+        if start:
+            orders = orders.filter(date__gte=start)
+        if end:
+            orders = orders.filter(date__lte=end)
+        streams.append(orders.order_by('date', 'id').values_list(*_lookups(orders.model)).iterator(chunk_size=chunk_size))
+    return heapq.merge(*streams, key=lambda row: (row[_DATE], row[0]))
+
+
+async def aexport_rows(start=None, end=None, chunk_size=2000):
+    """export_rows() as an async iterator for the ASGI app, read a chunk at a time off the event loop."""
+    rows = export_rows(start, end, chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while chunk := await next_chunk():
+        for row in chunk:
+            yield row
+
+
+def _ndjson(lines):
+    order_width = len(ORDER_FIELDS)
+    order = dict(zip(ORDER_FIELDS, lines[0][:order_width]))
+    order['items'] = [dict(zip(ITEM_FIELDS, line[order_width:])) for line in lines if line[order_width] is not None]
+    return json.dumps(order, cls=DjangoJSONEncoder) + '\n'
+
+
+def ndjson_lines(rows):
+    """One JSON object per order, with its lines under ``items``."""
+    for _, lines in groupby(rows, key=lambda row: row[0]):
+        yield _ndjson(list(lines))
+
+
+async def andjson_lines(rows):
+    lines = []
+    async for row in rows:
+        if lines and row[0] != lines[0][0]:
+            yield _ndjson(lines)
+            lines = []
+        lines.append(row)
+    if lines:
+        yield _ndjson(lines)
+
+
+class _Echo:
+    # csv.writer only needs write(); hand each formatted row straight back
+    def write(self, value):
+        return value
+
+
+def _csv_row(row):
+    return ['' if value is None else value for value in row]
+
+
+def csv_lines(rows):
+    """A header, then one CSV row per order line."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['order_id'] + _COLUMNS[1:])
+    for row in rows:
+        yield writer.writerow(_csv_row(row))
+
+
+async def acsv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['order_id'] + _COLUMNS[1:])
+    async for row in rows:
+        yield writer.writerow(_csv_row(row))
+
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+    'csv': ('text/csv', csv_lines),
+}
+# Under ASGI, Django reads a plain iterator into memory before sending it
+ASYNC_FORMATS = {
+    'ndjson': andjson_lines,
+    'csv': acsv_lines,
+}
@@ -0,0 +1,86 @@
+import decimal
+from datetime import date
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+# Compiled plans per serializer class and field set
+_plans = {}
+
+
+def _decimal_formatter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if field.localize or field.decimal_places is None:
+        return field.to_representation
+    # What DecimalField.to_representation works out on every call, done once
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def to_representation(value):
+        quantized = value.quantize(exponent, rounding=rounding, context=context)
+        return '{:f}'.format(quantized) if coerce_to_string else quantized
+    return to_representation
+
+
+def _formatter(field):
+    # values() already returns ints, strings, booleans and related ids in
+    # their API form; only decimals and dates need formatting
+    if isinstance(field, serializers.DecimalField):
+        return _decimal_formatter(field)
+    if isinstance(field, serializers.DateField):
+        if getattr(field, 'format', api_settings.DATE_FORMAT) == ISO_8601:
+            return date.isoformat
+        return field.to_representation
+    if isinstance(field, (serializers.DateTimeField, serializers.TimeField)):
+        return field.to_representation
+    return None
+
+
+def _compile(serializer):
+    plan = []
+    for name, field in serializer.fields.items():
+        if isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField,
+                              serializers.ManyRelatedField)) or field.source == '*':
+            raise ImproperlyConfigured(
+                f'{type(serializer).__name__}.{name} cannot be read from values(); use the serializer itself.'
+            )
+        plan.append((name, '__'.join(field.source_attrs), _formatter(field)))
+    return plan
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path for a ModelSerializer's list output.
+
+    Builds the same dicts as ``serializer_class(rows, many=True).data`` from
+    ``QuerySet.values()`` rows, without model instances or per-field
+    ``to_representation`` calls. Only plain fields, related ids and related
+    fields reached through ``source`` are supported.
+    """
+
+    def __init__(self, serializer_class, context=None):
+        serializer = serializer_class(context=context or {})
+        key = (serializer_class, tuple(serializer.fields))
+        if key not in _plans:
+            _plans[key] = _compile(serializer)
+        self.plan = _plans[key]
+        self.columns = [column for _, column, _ in self.plan]
+
+    def values(self, queryset, *extra):
+        # Pagination needs the sort key in each row even when it is not rendered
+        return queryset.values(*self.columns, *extra)
+
+    def render(self, rows):
+        plan = self.plan
+        return [
+            {name: row[column] if convert is None or row[column] is None else convert(row[column])
+             for name, column, convert in plan}
+            for row in rows
+        ]
+
+    def data(self, queryset):
+        return self.render(self.values(queryset))
@@ -0,0 +1,168 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Subquery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def get_settings():
+    options = {'POLL_INTERVAL': 1, 'LEASE': 300, 'MAX_ATTEMPTS': 5, 'BACKOFF': 10, 'MAX_BACKOFF': 3600}
+    options.update(getattr(settings, 'JOB_QUEUE', {}))
+    return options
+
+
+def task_path(task):
+    return task if isinstance(task, str) else f'{task.__module__}.{task.__qualname__}'
+
+
+def enqueue(task, args=(), kwargs=None, key=None, delay=0, max_attempts=None):
+    """
+    Queue ``task`` (a function or its dotted path) to be called by a worker
+    with ``args`` and ``kwargs``, which must be JSON serialisable.
+
+    Call it inside the transaction that makes the job necessary: the job is
+    committed, or rolled back, with it. No job is queued when one with the
+    same ``key`` is already waiting to start.
+    """
+    options = get_settings()
+    job = Job(task=task_path(task), args=list(args), kwargs=kwargs or {}, key=key,
+              run_at=timezone.now() + timedelta(seconds=delay),
+              max_attempts=max_attempts or options['MAX_ATTEMPTS'])
+    # INSERT OR IGNORE: a waiting job with the key is left as it is
+    Job.objects.bulk_create([job], ignore_conflicts=True)
+
+
+def claim(worker):
+    """Claim the next job that is due for ``worker``; returns it, or None."""
+    now = timezone.now()
+    token = f'{worker}:{uuid.uuid4().hex[:8]}'
+    due = Job.objects.filter(state=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id').values('id')[:1]
+    # A single conditional UPDATE: SQLite runs it under the database write
+    # lock, and elsewhere the state check is made again on the locked row, so
+    # of two workers after the same job only one gets it
+    claimed = (Job.objects.filter(id=Subquery(due), state=Job.QUEUED)
+               .update(state=Job.RUNNING, claimed_by=token, attempts=F('attempts') + 1,
+                       claimed_until=now + timedelta(seconds=get_settings()['LEASE'])))
+    if not claimed:
+        return None
+    return Job.objects.get(state=Job.RUNNING, claimed_by=token)
+
+
+def requeue_expired():
+    """
+    Put back running jobs whose claim ran out (their worker died), or fail
+    those out of attempts; returns how many were put back.
+    """
+    now = timezone.now()
+    expired = Job.objects.filter(state=Job.RUNNING, claimed_until__lt=now)
+    expired.filter(attempts__gte=F('max_attempts')).update(
+        state=Job.FAILED, claimed_until=None, last_error='The worker running the job stopped.')
+    return expired.update(state=Job.QUEUED, claimed_by='', claimed_until=None, run_at=now)
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that failed ``attempts`` times."""
+    options = get_settings()
+    return min(options['BACKOFF'] * 2 ** (attempts - 1), options['MAX_BACKOFF'])
+
+
+def run_job(job):
+    """
+    Run a claimed job and delete it, or on failure queue it again after a
+    backoff, until it runs out of attempts and is left failed.
+
+    Jobs run at least once: one whose worker dies is run again once its claim
+    runs out, so tasks must be safe to repeat. Returns whether the job succeeded.
+    """
+    claimed = Job.objects.filter(id=job.id, state=Job.RUNNING, claimed_by=job.claimed_by)
+    try:
+        import_string(job.task)(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s (%s) failed for good after %s attempts', job.id, job.task, job.attempts)
+            claimed.update(state=Job.FAILED, claimed_until=None, last_error=error)
+        else:
+            logger.warning('Job %s (%s) failed, retrying', job.id, job.task, exc_info=True)
+            claimed.update(state=Job.QUEUED, claimed_by='', claimed_until=None, last_error=error,
+                           run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)))
+        return False
+    claimed.delete()
+    return True
+
+
+def work(index=0, stop=None, burst=False, poll_interval=None):
+    """
+    Claim and run jobs one at a time until ``stop`` is set, or with
+    ``burst`` until none are due. Returns how many jobs were run.
+    """
+    stop = stop or threading.Event()
+    poll_interval = get_settings()['POLL_INTERVAL'] if poll_interval is None else poll_interval
+    worker = f'{socket.gethostname()}:{os.getpid()}:{index}'
+    ran = 0
+    while not stop.is_set():
+        job = claim(worker)
+        if job is None:
+            if requeue_expired():
+                continue
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        run_job(job)
+        ran += 1
+    return ran
+
+
+def _work_in_thread(*args):
+    try:
+        return work(*args)
+    finally:
+        # Connections belong to the thread that opened them
+        connections.close_all()
+
+
+def _setup_process():
+    # The parent stops the workers on Ctrl+C; the children finish their job
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import django
+    django.setup()
+
+
+def run_worker(concurrency=1, pool='thread', burst=False, poll_interval=None, stop=None):
+    """
+    Run ``concurrency`` workers in a pool of threads or of processes (each
+    with its own database connection) until ``stop`` is set or, with
+    ``burst``, the queue is drained. Returns how many jobs were run.
+    """
+    if pool == 'thread':
+        stop = stop or threading.Event()
+        with ThreadPoolExecutor(concurrency, thread_name_prefix='worker') as executor:
+            futures = [executor.submit(_work_in_thread, i, stop, burst, poll_interval) for i in range(concurrency)]
+            return sum(future.result() for future in futures)
+    if pool == 'process':
+        # Shared with the children, so it comes from a multiprocessing.Manager()
+        stop = stop or multiprocessing.Manager().Event()
+        # Never hand an open connection to a child process
+        connections.close_all()
+        with ProcessPoolExecutor(concurrency, initializer=_setup_process) as executor:
+            futures = [executor.submit(_work_in_thread, i, stop, burst, poll_interval)
+                       for i in range(concurrency)]
+            return sum(future.result() for future in futures)
+    raise ValueError(f"Unknown pool '{pool}'. Use thread or process.")
+
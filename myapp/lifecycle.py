@@ -0,0 +1,106 @@
+from django.db import transaction
+
+from .events import record_order_change
+from .models import ACTIVE_ORDERS, Order
+from .rollups import record_delivery, remove_orders
+
+PLACED = Order.PLACED
+ASSIGNED = Order.ASSIGNED
+OUT_FOR_DELIVERY = Order.OUT_FOR_DELIVERY
+DELIVERED = Order.DELIVERED
+CANCELLED = Order.CANCELLED
+
+# Where each state can go next. An assigned or out-for-delivery order can be
+# handed to another crew member (back to assigned), and a delivery marked by
+# mistake can be undone.
+TRANSITIONS = {
+    PLACED: {ASSIGNED, CANCELLED},
+    ASSIGNED: {PLACED, OUT_FOR_DELIVERY, DELIVERED, CANCELLED},
+    OUT_FOR_DELIVERY: {ASSIGNED, DELIVERED, CANCELLED},
+    DELIVERED: {OUT_FOR_DELIVERY},
+    CANCELLED: set(),
+}
+# The states a delivery crew member can move their own orders to
+CREW_STATES = {OUT_FOR_DELIVERY, DELIVERED}
+
+_UNCHANGED = object()
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def active_orders():
+    """Orders not yet delivered or cancelled, read from the partial indexes."""
+    return Order.objects.filter(ACTIVE_ORDERS)
+
+
+def check_transition(from_state, state, delivery_crew_id):
+    """Raise InvalidTransition unless an order may move from ``from_state`` to ``state``."""
+    if state not in TRANSITIONS:
+        raise InvalidTransition(f"Unknown state '{state}'. Use one of: {', '.join(TRANSITIONS)}.")
+    if state != from_state and state not in TRANSITIONS[from_state]:
+        raise InvalidTransition(f"An order cannot go from {from_state} to {state}.")
+    if state == PLACED and delivery_crew_id is not None:
+        raise InvalidTransition('A placed order has no delivery crew.')
+    if state in (ASSIGNED, OUT_FOR_DELIVERY, DELIVERED) and delivery_crew_id is None:
+        raise InvalidTransition(f'A {state} order needs a delivery crew.')
+
+
+def transition(order, state, delivery_crew_id=_UNCHANGED):
+    """
+    Move ``order`` to ``state``, optionally handing it to ``delivery_crew_id``,
+    and log the change.
+
+    The update is conditional on the state and crew the order was read with,
+    so of two concurrent requests only one moves it; the other gets
+    InvalidTransition. Returns whether anything changed.
+    """
+    from_state, previous_crew_id = order.state, order.delivery_crew_id
+    if delivery_crew_id is _UNCHANGED:
+        delivery_crew_id = previous_crew_id
+    if state == from_state and delivery_crew_id == previous_crew_id:
+        return False
+    check_transition(from_state, state, delivery_crew_id)
+
+    delivered = state == DELIVERED
+    with transaction.atomic():
+        if state == CANCELLED:
+            # Out of the sales rollups while the order still counts in them;
+            # nothing leaves CANCELLED, so it never has to be put back
+            remove_orders([order.pk])
+        changed = (Order.objects.filter(pk=order.pk, state=from_state, delivery_crew_id=previous_crew_id)
+                   .update(state=state, delivery_crew_id=delivery_crew_id, status=delivered))
+        if not changed:
+            raise InvalidTransition('The order was changed by someone else; reload it and try again.')
+        order.state, order.delivery_crew_id, order.status = state, delivery_crew_id, delivered
+        if delivered != (from_state == DELIVERED):
+            record_delivery(order.pk, delivered)
+        record_order_change(order, previous_crew_id, from_state)
+    return True
+
+
+def assign_order(order, delivery_crew_id):
+    """Hand ``order`` to a delivery crew member, or back to the queue with None."""
+    return transition(order, ASSIGNED if delivery_crew_id is not None else PLACED, delivery_crew_id)
+
+
+def set_order_status(order, delivered):
+    """
+    Mark ``order`` delivered (or not) through the lifecycle, for clients of
+    the old boolean status. Undoing a delivery puts the order back out for
+    delivery.
+
+    Returns whether the status changed.
+    """
+    delivered = Order._meta.get_field('status').to_python(delivered)
+    if delivered == (order.state == DELIVERED):
+        return False
+    return transition(order, DELIVERED if delivered else OUT_FOR_DELIVERY)
+
+
+def state_for(delivery_crew, delivered):
+    """The state of an order written with the old ``delivery_crew`` and ``status`` fields."""
+    if delivered:
+        return DELIVERED
+    return ASSIGNED if delivery_crew is not None else PLACED
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+from importlib import import_module
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db import OperationalError, connections
+from django.db.backends.signals import connection_created
+from rest_framework.authtoken.models import Token
+
+from .benchmarks import _asgi_request, _wsgi_request, percentile, unthrottled
+from .models import MenuItem
+
+# Relative weight of each journey in a lunch rush
+DEFAULT_MIX = {'browse': 40, 'search': 20, 'cart': 20, 'checkout': 10, 'crew': 10}
+
+Sample = namedtuple('Sample', ['endpoint', 'ms', 'status', 'locked'])
+
+# The request being timed; flagged when one of its queries hit a locked database
+_outcome = ContextVar('loadtest_outcome', default=None)
+
+
+def _browse(context, rng):
+    return rng.choice(context['customers']), [
+        ('menu-items', 'GET', '/api/menu-items/', None),
+        ('menu-item-detail', 'GET', f"/api/menu-items/{rng.choice(context['menu_item_ids'])}/", None),
+    ]
+
+
+def _search(context, rng):
+    term = f'item {rng.randint(1, 99)}'
+    return rng.choice(context['customers']), [('menu-search', 'GET', f'/api/menu-items/?search={quote(term)}', None)]
+
+
+def _cart(context, rng):
+    item = {'menuitem': rng.choice(context['menu_item_ids']), 'quantity': 1}
+    return rng.choice(context['customers']), [
+        ('cart-add', 'POST', '/api/cart/menu-items/', item),
+        ('cart', 'GET', '/api/cart/menu-items/', None),
+    ]
+
+
+def _checkout(context, rng):
+    item = {'menuitem': rng.choice(context['menu_item_ids']), 'quantity': 1}
+    return rng.choice(context['customers']), [
+        ('cart-add', 'POST', '/api/cart/menu-items/', item),
+        ('checkout', 'POST', '/api/cart/orders/', {'date': date.today().isoformat()}),
+    ]
+
+
+def _crew(context, rng):
+    return rng.choice(context['crew']), [('assigned-orders', 'GET', '/api/orders/', None)]
+
+
+# Each journey picks a user and returns their token and requests:
+# (endpoint, method, path, JSON body)
+JOURNEYS = {'browse': _browse, 'search': _search, 'cart': _cart, 'checkout': _checkout, 'crew': _crew}
+
+
+def parse_mix(value):
+    """Parse ``browse=4,checkout=1`` into journey weights; raises ValueError for a bad mix."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in JOURNEYS:
+            raise ValueError(f"Unknown journey '{name}'. Use: {', '.join(JOURNEYS)}.")
+        mix[name] = float(weight) if weight else 1.0
+    if not any(mix.values()):
+        raise ValueError('Give at least one journey a weight.')
+    return mix
+
+
+def loadtest_context(customers=50):
+    """Tokens and ids for the journeys, from a seeded database (see benchmarks.seed)."""
+    customer_ids = (User.objects.filter(username__startswith='bench-user-', groups__isnull=True)
+                    .order_by('id').values_list('id', flat=True)[:customers])
+    crew_ids = (User.objects.filter(groups__name='Delivery Crew', username__startswith='bench-user-')
+                .order_by('id').values_list('id', flat=True))
+    return {
+        'customers': [Token.objects.get_or_create(user_id=user_id)[0].key for user_id in customer_ids],
+        'crew': [Token.objects.get_or_create(user_id=user_id)[0].key for user_id in crew_ids],
+        'menu_item_ids': list(MenuItem.objects.order_by('id').values_list('id', flat=True)[:1000]),
+    }
+
+
+def _detect_locks(execute, sql, params, many, context):
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as exc:
+        outcome = _outcome.get()
+        if outcome is not None and 'locked' in str(exc):
+            outcome['locked'] = True
+        raise
+
+
+def _watch_connection(sender, connection, **kwargs):
+    connection.execute_wrappers.append(_detect_locks)
+
+
+@contextmanager
+def _timed(samples, endpoint):
+    outcome = {'status': 0, 'locked': False}
+    reset = _outcome.set(outcome)
+    started = time.perf_counter()
+    try:
+        yield outcome
+    finally:
+        _outcome.reset(reset)
+        samples.append(Sample(endpoint, (time.perf_counter() - started) * 1000, outcome['status'], outcome['locked']))
+
+
+def _encode(token, data):
+    headers = {'Authorization': f'Token {token}'}
+    if data is None:
+        return headers, b''
+    headers['Content-Type'] = 'application/json'
+    return headers, json.dumps(data).encode()
+
+
+def _drive(application, context, mix, duration, rng):
+    samples = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        token, steps = JOURNEYS[rng.choices(list(mix), weights=list(mix.values()))[0]](context, rng)
+        for endpoint, method, path, data in steps:
+            headers, body = _encode(token, data)
+            with _timed(samples, endpoint) as outcome:
+                outcome['status'] = _wsgi_request(application, path, headers, method, body)
+    return samples
+
+
+async def _drive_async(application, context, mix, duration, rngs):
+    samples = []
+    deadline = time.monotonic() + duration
+
+    async def user(rng):
+        while time.monotonic() < deadline:
+            token, steps = JOURNEYS[rng.choices(list(mix), weights=list(mix.values()))[0]](context, rng)
+            for endpoint, method, path, data in steps:
+                headers, body = _encode(token, data)
+                with _timed(samples, endpoint) as outcome:
+                    outcome['status'] = await _asgi_request(application, path, headers, method, body)
+
+    await asyncio.gather(*(user(rng) for rng in rngs))
+    # The views' connections belong to the thread asgiref runs sync code in
+    await sync_to_async(connections.close_all)()
+    return samples
+
+
+def _virtual_users(app, context, mix, duration, seeds):
+    # One user per seed: a thread (or process) of its own under WSGI, tasks
+    # on one event loop under ASGI
+    rngs = [random.Random(seed) for seed in seeds]
+    try:
+        application = import_module(f'myproject.{app}').application
+        if app == 'asgi':
+            return asyncio.run(_drive_async(application, context, mix, duration, rngs))
+        return _drive(application, context, mix, duration, rngs[0])
+    finally:
+        connections.close_all()
+
+
+def summarise(samples, elapsed):
+    """Per endpoint and ``all``: requests, req/s, p50/p95/p99 ms, error rate and lock errors."""
+    groups = {}
+    for sample in samples:
+        groups.setdefault(sample.endpoint, []).append(sample)
+    groups['all'] = samples
+    results = {}
+    for endpoint, group in groups.items():
+        if not group:
+            continue
+        timings = [sample.ms for sample in group]
+        results[endpoint] = {
+            'requests': len(group),
+            'throughput': len(group) / elapsed,
+            'p50': percentile(timings, 50),
+            'p95': percentile(timings, 95),
+            'p99': percentile(timings, 99),
+            'error_rate': sum(not 200 <= sample.status < 400 for sample in group) / len(group),
+            'locked': sum(sample.locked for sample in group),
+        }
+    return results
+
+
+def run_loadtest(context, mix=None, duration=10, concurrency=8, pool='thread', app='wsgi', seed=0):
+    """
+    Drive ``concurrency`` virtual users through the WSGI or ASGI app for
+    ``duration`` seconds, each running journeys from ``mix`` back to back.
+
+    With the thread pool, WSGI users each get a thread and ASGI users are
+    tasks on one event loop, like a single server process. With the
+    process pool every user gets a (forked) process. The throttle rates are
+    raised for the run (see ``benchmarks.unthrottled``). Returns ``summarise()`` of every request; lock errors are
+    requests with a query that failed with "database is locked".
+    """
+    mix = mix or DEFAULT_MIX
+    # Loading the app sets up logging again, so load it before quietening it
+    import_module(f'myproject.{app}')
+    # The requests' failures are counted here, not logged one by one
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.CRITICAL)
+    connection_created.connect(_watch_connection)
+    try:
+        with unthrottled():
+            started = time.perf_counter()
+            if pool == 'process':
+                # Children inherit the settings and signal handlers, but no connection
+                connections.close_all()
+                executor = ProcessPoolExecutor(concurrency, mp_context=multiprocessing.get_context('fork'))
+                batches = [[seed + i] for i in range(concurrency)]
+            elif app == 'asgi':
+                executor = ThreadPoolExecutor(1)
+                batches = [[seed + i for i in range(concurrency)]]
+            else:
+                executor = ThreadPoolExecutor(concurrency)
+                batches = [[seed + i] for i in range(concurrency)]
+            with executor:
+                futures = [executor.submit(_virtual_users, app, context, mix, duration, seeds) for seeds in batches]
+                samples = [sample for future in futures for sample in future.result()]
+            elapsed = time.perf_counter() - started
+    finally:
+        connection_created.disconnect(_watch_connection)
+        request_logger.setLevel(level)
+    return summarise(samples, elapsed)
@@ -0,0 +1,24 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.archive import BATCH_SIZE, archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Move delivered orders older than a number of days into the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Archive orders dated more than this many days ago; at least, and by default, '
+                                 'ORDER_ARCHIVE_AFTER_DAYS.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Orders moved per transaction.')
+        parser.add_argument('--limit', type=int, help='Stop after moving this many orders.')
+
+    def handle(self, *args, **options):
+        try:
+            before = date.today() - timedelta(days=options['days']) if options['days'] is not None else None
+            moved = archive_orders(before=before, batch_size=options['batch_size'], limit=options['limit'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS(f'{moved} orders archived.'))
@@ -0,0 +1,141 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from myapp.benchmarks import (TIERS, benchmark_authentication, benchmark_context, benchmark_export, benchmark_serializers,
+                              benchmark_servers, benchmark_writes, explain_endpoints, find_regressions, find_table_scans,
+                              run_benchmarks, seed)
+from myapp.models import MenuItem
+
+
+class Command(BaseCommand):
+    help = 'Seed a data tier, benchmark every API endpoint and fail on query budget or latency regressions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', choices=['endpoints', 'auth', 'servers', 'writes', 'export', 'serializers', 'plans'],
+                            default='endpoints',
+                            help='endpoints: every API endpoint; auth: per-request cost of each authentication mode; '
+                                 'servers: WSGI against ASGI throughput on the hot read paths; '
+                                 'writes: concurrent cart and checkout writes with and without SQLITE_PRAGMAS; '
+                                 'export: time and peak memory of the streaming order export; '
+                                 'serializers: model serializers against the values() fast path on 10k-row lists; '
+                                 'plans: EXPLAIN QUERY PLAN of every query each endpoint runs, failing on full table scans.')
+        parser.add_argument('--tier', choices=sorted(TIERS), default='1k')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Requests in flight for the servers suite, writer threads for the writes suite.')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmark_baseline.json'))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Store this run as the new latency baseline instead of comparing against it.')
+        parser.add_argument('--tolerance', type=float, default=1.5,
+                            help='Allowed p95 slowdown against the baseline, as a ratio.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the seeded benchmark database between runs.')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run ANALYZE after seeding so the planner works from table statistics.')
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database, never the development one.
+        # The concurrent suites need a file: the in-memory test database
+        # locks whole tables and has no journal to tune.
+        if options['keepdb'] or options['suite'] in ('servers', 'writes'):
+            settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = str(Path(settings.BASE_DIR) / f"benchmark_{options['tier']}.sqlite3")
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            if options['keepdb'] and MenuItem.objects.exists():
+                context = benchmark_context()
+            else:
+                self.stdout.write(f"Seeding tier {options['tier']}...")
+                context = seed(TIERS[options['tier']])
+            if options['analyze']:
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            if options['suite'] == 'auth':
+                results = benchmark_authentication(context['customer'], iterations=options['iterations'])
+            elif options['suite'] == 'servers':
+                results = benchmark_servers(context, requests=options['iterations'], concurrency=options['concurrency'])
+            elif options['suite'] == 'writes':
+                results = benchmark_writes(workers=options['concurrency'], operations=options['iterations'])
+            elif options['suite'] == 'export':
+                results = benchmark_export()
+            elif options['suite'] == 'serializers':
+                results = benchmark_serializers()
+            elif options['suite'] == 'plans':
+                results = explain_endpoints(context)
+                failures = find_table_scans(results)
+            else:
+                results = run_benchmarks(context, iterations=options['iterations'])
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if options['suite'] == 'auth':
+            self.stdout.write(f"{'mode':<24}{'p50 us':>10}{'p95 us':>10}{'queries':>10}")
+            for name, result in results.items():
+                self.stdout.write(f"{name:<24}{result['p50']:>10.1f}{result['p95']:>10.1f}{result['queries']:>10.2f}")
+            return
+
+        if options['suite'] == 'servers':
+            self.stdout.write(f"{'app':<24}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>10}")
+            for name, result in results.items():
+                self.stdout.write(f"{name:<24}{result['throughput']:>10.1f}{result['p50']:>10.2f}"
+                                  f"{result['p95']:>10.2f}{result['errors']:>10}")
+            return
+
+        if options['suite'] == 'serializers':
+            self.stdout.write(f"{'list':<24}{'rows':>10}{'model ms':>10}{'values ms':>10}{'speedup':>10}")
+            for name, result in results.items():
+                self.stdout.write(f"{name:<24}{result['rows']:>10}{result['model']:>10.1f}{result['values']:>10.1f}"
+                                  f"{result['model'] / result['values']:>9.1f}x")
+            return
+
+        if options['suite'] == 'plans':
+            for name, queries in results.items():
+                self.stdout.write(f'{name} ({len(queries)} queries)')
+                for sql, plan in queries:
+                    self.stdout.write(f"  {' '.join(sql.split())[:120]}")
+                    for line in plan:
+                        self.stdout.write(f'    {line}')
+            if failures:
+                raise CommandError('Full table scans:\n' + '\n'.join(failures))
+            self.stdout.write(self.style.SUCCESS('No endpoint scans a whole table.'))
+            return
+
+        if options['suite'] == 'export':
+            self.stdout.write(f"{'type':<24}{'lines':>10}{'seconds':>10}{'peak KiB':>10}")
+            for name, result in results.items():
+                self.stdout.write(f"{name:<24}{result['rows']:>10}{result['seconds']:>10.2f}{result['peak_kib']:>10.0f}")
+            return
+
+        if options['suite'] == 'writes':
+            self.stdout.write(f"{'pragmas':<24}{'writes/s':>10}{'cart p95':>10}{'order p95':>10}{'errors':>10}")
+            for name, result in results.items():
+                self.stdout.write(f"{name:<24}{result['throughput']:>10.1f}{result['cart-add'] or 0:>10.2f}"
+                                  f"{result['checkout'] or 0:>10.2f}{result['errors']:>10}")
+            return
+
+        self.stdout.write(f"{'endpoint':<24}{'p50 ms':>10}{'p95 ms':>10}{'queries':>10}")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<24}{result['p50']:>10.2f}{result['p95']:>10.2f}{result['queries']:>10}")
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+            baseline[options['tier']] = results
+            baseline_path.write_text(json.dumps(baseline, indent=2))
+            self.stdout.write(f'Baseline written to {baseline_path}')
+            baseline = None
+        elif baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text()).get(options['tier'])
+        else:
+            baseline = None
+
+        failures = find_regressions(results, baseline, tolerance=options['tolerance'])
+        if failures:
+            raise CommandError('Benchmark regressions:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('All endpoints within budget.'))
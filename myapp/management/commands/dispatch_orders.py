@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from myapp.dispatch import BATCH_SIZE, assign_orders
+
+
+class Command(BaseCommand):
+    help = 'Assign placed orders to the delivery crew members with the fewest active orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Orders assigned per transaction.')
+        parser.add_argument('--limit', type=int, help='Stop after assigning this many orders.')
+
+    def handle(self, *args, **options):
+        assigned = assign_orders(batch_size=options['batch_size'], limit=options['limit'])
+        for user_id, count in sorted(assigned.items()):
+            self.stdout.write(f'Delivery crew {user_id}: {count} orders')
+        self.stdout.write(self.style.SUCCESS(f'{sum(assigned.values())} orders assigned.'))
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from myapp.export import FORMATS, export_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream orders and their order lines as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--start', type=date.fromisoformat, help='First order date to include (YYYY-MM-DD).')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last order date to include (YYYY-MM-DD).')
+        parser.add_argument('--output', help='File to write to instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time.')
+
+    def handle(self, *args, **options):
+        _, write_lines = FORMATS[options['type']]
+        lines = write_lines(export_rows(options['start'], options['end'], chunk_size=options['chunk_size']))
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
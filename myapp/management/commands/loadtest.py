@@ -0,0 +1,70 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from myapp.benchmarks import TIERS, seed
+from myapp.loadtest import DEFAULT_MIX, loadtest_context, parse_mix, run_loadtest
+from myapp.models import MenuItem
+
+
+class Command(BaseCommand):
+    help = ('Seed a data tier and drive a mix of concurrent user journeys through the WSGI or ASGI app, '
+            'reporting throughput, latency, errors and SQLite lock errors per endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+                            help='Journey weights: browse (menu and an item), search, cart (add and read), '
+                                 'checkout (add and order) and crew (assigned orders).')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run for.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Virtual users, each running journeys back to back.')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='thread: one server process (threads for WSGI, one event loop for ASGI); '
+                                 'process: a forked process per user.')
+        parser.add_argument('--app', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--tier', choices=sorted(TIERS), default='1k')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the journeys each user picks.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the seeded database between runs.')
+        parser.add_argument('--output', help='Also write the results to this JSON file, to compare runs.')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        # A throwaway database file, never the development one: the in-memory
+        # test database locks whole tables under concurrent writers
+        name = Path(settings.BASE_DIR) / f"loadtest_{options['tier']}.sqlite3"
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = str(name)
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            if not (options['keepdb'] and MenuItem.objects.exists()):
+                self.stdout.write(f"Seeding tier {options['tier']}...")
+                seed(TIERS[options['tier']])
+            context = loadtest_context()
+            self.stdout.write(f"Running {options['concurrency']} users for {options['duration']:g}s "
+                              f"({options['app']}, {options['pool']} pool)...")
+            results = run_loadtest(context, mix=mix, duration=options['duration'], concurrency=options['concurrency'],
+                                   pool=options['pool'], app=options['app'], seed=options['seed'])
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+            if not options['keepdb']:
+                # Under ASGI every request's thread keeps its own connection
+                # (CONN_MAX_AGE), so SQLite can leave its WAL files behind
+                for suffix in ('-wal', '-shm'):
+                    Path(f'{name}{suffix}').unlink(missing_ok=True)
+
+        self.stdout.write(f"{'endpoint':<20}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+                          f"{'p99 ms':>10}{'errors':>10}{'locked':>10}")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<20}{result['requests']:>10}{result['throughput']:>10.1f}{result['p50']:>10.2f}"
+                              f"{result['p95']:>10.2f}{result['p99']:>10.2f}{result['error_rate']:>10.1%}"
+                              f"{result['locked']:>10}")
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myapp.events import prune_events
+
+
+class Command(BaseCommand):
+    help = 'Delete delivery crew order events older than a number of days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7,
+                            help='Keep this many days of events for clients reconnecting with Last-Event-ID.')
+
+    def handle(self, *args, **options):
+        deleted = prune_events(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'{deleted} order events deleted.'))
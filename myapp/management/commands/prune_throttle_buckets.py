@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from myapp.throttling import prune_buckets
+
+
+class Command(BaseCommand):
+    help = 'Delete the throttle buckets of clients idle long enough for them to have refilled.'
+
+    def handle(self, *args, **options):
+        deleted = prune_buckets()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} throttle buckets deleted.'))
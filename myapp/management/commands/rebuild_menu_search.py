@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from myapp.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for menu items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        with transaction.atomic(using=options['database']):
+            created = rebuild_search_index(connection)
+        if not created:
+            raise CommandError('This database does not support SQLite FTS5; searches use the icontains fallback.')
+        self.stdout.write(self.style.SUCCESS('Menu search index rebuilt.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from myapp.models import CategorySales, DailySales, MenuItemSales
+from myapp.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily, menu item and category sales rollups from the order tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        with transaction.atomic(using=using):
+            rebuild_rollups(connections[using])
+        self.stdout.write(self.style.SUCCESS(
+            f'Sales rollups rebuilt: {DailySales.objects.using(using).count()} days, '
+            f'{MenuItemSales.objects.using(using).count()} menu items, '
+            f'{CategorySales.objects.using(using).count()} categories.'
+        ))
@@ -0,0 +1,35 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from myapp.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs queued by myapp.jobs.enqueue (order receipts, dispatch).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Jobs run at the same time.')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run the workers as threads (the default; jobs mostly wait on I/O) '
+                                 'or as processes.')
+        parser.add_argument('--burst', action='store_true', help='Stop once no jobs are due.')
+        parser.add_argument('--poll-interval', type=float,
+                            help="Seconds between looks at an empty queue; JOB_QUEUE['POLL_INTERVAL'] by default.")
+
+    def handle(self, *args, **options):
+        pool = options['pool']
+        stop = multiprocessing.Manager().Event() if pool == 'process' else threading.Event()
+
+        def shut_down(signum, frame):
+            # Let the running jobs finish, then stop
+            self.stderr.write('Stopping once the running jobs finish...')
+            stop.set()
+
+        signal.signal(signal.SIGINT, shut_down)
+        signal.signal(signal.SIGTERM, shut_down)
+        ran = run_worker(options['concurrency'], pool=pool, burst=options['burst'],
+                         poll_interval=options['poll_interval'], stop=stop)
+        self.stdout.write(self.style.SUCCESS(f'{ran} jobs run.'))
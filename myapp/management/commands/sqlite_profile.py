@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from myapp.database import SQLITE_DEFAULTS, active_pragmas, get_profile
+
+
+class Command(BaseCommand):
+    help = 'Show the SQLite pragma profile and the values active on a connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"Database '{options['database']}' is not SQLite; there is no pragma profile to show.")
+
+        profile = get_profile()
+        active = active_pragmas(connection)
+        self.stdout.write(f"{'pragma':<16}{'profile':>14}{'active':>14}{'sqlite default':>16}")
+        for name, default in SQLITE_DEFAULTS.items():
+            configured = profile.get(name, '-')
+            self.stdout.write(f'{name:<16}{str(configured):>14}{str(active[name]):>14}{str(default):>16}')
+        self.stdout.write(f"CONN_MAX_AGE: {connection.settings_dict['CONN_MAX_AGE']}")
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.routers import sync_replicas
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into its file-copy replicas (DATABASE_REPLICAS).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Replica database aliases; DATABASE_REPLICAS by default.')
+        parser.add_argument('--interval', type=float,
+                            help='Keep copying every this many seconds instead of once.')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or None
+        while True:
+            started = time.perf_counter()
+            try:
+                synced = sync_replicas(aliases)
+            except ValueError as exc:
+                raise CommandError(exc)
+            if not synced:
+                raise CommandError('No replicas to copy to: set DATABASE_REPLICAS or name them.')
+            self.stdout.write(f"Copied to {', '.join(synced)} in {time.perf_counter() - started:.2f}s.")
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,138 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+
+from .profiling import QueryProfile, get_settings
+from .routers import finish_request, get_replicas, pin_key, pin_seconds, start_request
+
+logger = logging.getLogger('myapp.profiler')
+
+
+class ASGIUrlconfMiddleware:
+    """
+    Resolve requests served by the ASGI app against ``ASGI_URLCONF``.
+
+    Requests served by the WSGI app keep using ``ROOT_URLCONF``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.urlconf = getattr(settings, 'ASGI_URLCONF', None)
+        return await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let ``myapp.routers.ReplicaRouter`` read from the replicas while serving
+    a request, and pin a client that wrote to the primary for
+    ``REPLICA_PIN_SECONDS``.
+
+    Clients are told apart by their ``Authorization`` header or session
+    cookie, and pins are kept in the default cache, which every server
+    process must share for them to hold across processes.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = pin_key(request)
+        state, token = start_request(request, key is not None and cache.get(key) is not None)
+        try:
+            return self.get_response(request)
+        finally:
+            finish_request(token)
+            self.pin(state)
+
+    async def __acall__(self, request):
+        key = pin_key(request)
+        state, token = start_request(request, key is not None and await cache.aget(key) is not None)
+        try:
+            return await self.get_response(request)
+        finally:
+            finish_request(token)
+            self.pin(state)
+
+    def pin(self, state):
+        if state.wrote and state.pin_key:
+            cache.set(state.pin_key, True, pin_seconds())
+
+
+class QueryProfilerMiddleware:
+    """
+    Profile the SQL of every request when ``QUERY_PROFILER['ENABLED']`` is set.
+
+    Adds a ``Server-Timing`` header with the SQL count and time and the time
+    spent in the view, logs query shapes repeated ``REPEAT_THRESHOLD`` times
+    or more (N+1 queries) with the code that ran them, and leaves the profile
+    on ``response.query_profile``. Queries run while a streaming response is
+    being read happen after the view returns and are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_settings()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = QueryProfile()
+        started = time.perf_counter()
+        with profile.record():
+            response = self.get_response(request)
+        return self.finish(request, response, profile, started)
+
+    async def __acall__(self, request):
+        profile = QueryProfile()
+        started = time.perf_counter()
+        # Connections are per thread: wrap the ones of the thread the ORM
+        # calls of this request run in
+        recording = ExitStack()
+        await sync_to_async(recording.enter_context)(profile.record())
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.close)()
+        return self.finish(request, response, profile, started)
+
+    def finish(self, request, response, profile, started):
+        profile.view_time = time.perf_counter() - started
+        for group in profile.repeated():
+            logger.warning(
+                'N+1 queries in %s %s: %d x %s (%.2f ms) from %s',
+                request.method, request.path, group['count'], group['shape'], group['time'] * 1000,
+                ', '.join(group['sites']) or 'unknown',
+            )
+        timing = profile.server_timing()
+        response['Server-Timing'] = f"{response['Server-Timing']}, {timing}" if response.has_header('Server-Timing') else timing
+        response.query_profile = profile
+        return response
@@ -0,0 +1,76 @@
+from django.db import migrations
+
+# The FTS5 index and triggers as myapp.search first created them, written out
+# here so later changes to the app cannot change what this migration does
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE myapp_menuitem_search USING fts5(title, category, tokenize='trigram')",
+    """CREATE TRIGGER myapp_menuitem_search_insert AFTER INSERT ON myapp_menuitem BEGIN
+        INSERT INTO myapp_menuitem_search (rowid, title, category)
+        SELECT new.id, new.title, title FROM myapp_category WHERE id = new.category_id;
+    END""",
+    """CREATE TRIGGER myapp_menuitem_search_update AFTER UPDATE OF title, category_id ON myapp_menuitem BEGIN
+        DELETE FROM myapp_menuitem_search WHERE rowid = old.id;
+        INSERT INTO myapp_menuitem_search (rowid, title, category)
+        SELECT new.id, new.title, title FROM myapp_category WHERE id = new.category_id;
+    END""",
+    """CREATE TRIGGER myapp_menuitem_search_delete AFTER DELETE ON myapp_menuitem BEGIN
+        DELETE FROM myapp_menuitem_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER myapp_menuitem_search_category AFTER UPDATE OF title ON myapp_category BEGIN
+        UPDATE myapp_menuitem_search SET category = new.title
+        WHERE rowid IN (SELECT id FROM myapp_menuitem WHERE category_id = new.id);
+    END""",
+    """INSERT INTO myapp_menuitem_search (rowid, title, category)
+    SELECT myapp_menuitem.id, myapp_menuitem.title, myapp_category.title
+    FROM myapp_menuitem INNER JOIN myapp_category ON myapp_category.id = myapp_menuitem.category_id""",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS myapp_menuitem_search_insert',
+    'DROP TRIGGER IF EXISTS myapp_menuitem_search_update',
+    'DROP TRIGGER IF EXISTS myapp_menuitem_search_delete',
+    'DROP TRIGGER IF EXISTS myapp_menuitem_search_category',
+    'DROP TABLE IF EXISTS myapp_menuitem_search',
+]
+
+
+def fts5_supported(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    if cursor.fetchone()[0]:
+        return True
+    # Some builds load FTS5 without reporting the compile option
+    try:
+        cursor.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+        cursor.execute('DROP TABLE temp.fts5_probe')
+    except Exception:
+        return False
+    return True
+
+
+def create_index(apps, schema_editor):
+    # Other databases, and SQLite builds without FTS5, search with icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if fts5_supported(cursor):
+            for sql in CREATE_SQL:
+                cursor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Fill the new rollups from the orders already placed, with the queries of
+# myapp.rollups as they stood for this migration
+POPULATE_SQL = [
+    """INSERT INTO myapp_dailysales (date, orders, quantity, revenue, delivered_orders, delivered_revenue)
+    SELECT o.date,
+           COUNT(DISTINCT o.id),
+           COALESCE(SUM(i.quantity), 0),
+           COALESCE(SUM(i.quantity * i.unit_price), 0),
+           COUNT(DISTINCT CASE WHEN o.status THEN o.id END),
+           COALESCE(SUM(CASE WHEN o.status THEN i.quantity * i.unit_price END), 0)
+    FROM myapp_order o LEFT JOIN myapp_orderitem i ON i.order_id = o.id
+    GROUP BY o.date""",
+    """INSERT INTO myapp_menuitemsales (menuitem_id, orders, quantity, revenue)
+    SELECT i.menuitem_id, COUNT(DISTINCT i.order_id), SUM(i.quantity), SUM(i.quantity * i.unit_price)
+    FROM myapp_orderitem i
+    GROUP BY i.menuitem_id""",
+    """INSERT INTO myapp_categorysales (category_id, orders, quantity, revenue)
+    SELECT m.category_id, COUNT(DISTINCT i.order_id), SUM(i.quantity), SUM(i.quantity * i.unit_price)
+    FROM myapp_orderitem i INNER JOIN myapp_menuitem m ON m.id = i.menuitem_id
+    GROUP BY m.category_id""",
+]
+
+
+def populate(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for sql in POPULATE_SQL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_throttle_bucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySales',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='myapp.category')),
+                ('orders', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('orders', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('delivered_orders', models.IntegerField(default=0)),
+                ('delivered_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MenuItemSales',
+            fields=[
+                ('menuitem', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='myapp.menuitem')),
+                ('orders', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
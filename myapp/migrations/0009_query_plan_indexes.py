@@ -0,0 +1,31 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_order_crew_status_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='order',
+            name='order_user_idempotency_key',
+        ),
+        migrations.AddIndex(
+            model_name='categorysales',
+            index=models.Index(fields=['-revenue', 'category'], name='category_sales_revenue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitemsales',
+            index=models.Index(fields=['-revenue', 'menuitem'], name='menuitem_sales_revenue_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('user', 'idempotency_key'), name='order_user_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_query_plan_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('assigned', 'Assigned'), ('unassigned', 'Unassigned'), ('status', 'Status changed')], max_length=16)),
+                ('status', models.BooleanField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('delivery_crew', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_events', to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['delivery_crew', 'id'], name='orderevent_crew_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.0.3 on 2026-10-18 13:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+STATES = [('placed', 'Placed'), ('assigned', 'Assigned'), ('out_for_delivery', 'Out for delivery'),
+          ('delivered', 'Delivered'), ('cancelled', 'Cancelled')]
+
+
+def populate(apps, schema_editor):
+    # Work out the state of existing orders from the old status and crew
+    db = schema_editor.connection.alias
+    Order = apps.get_model('myapp', 'Order')
+    OrderEvent = apps.get_model('myapp', 'OrderEvent')
+    Order.objects.using(db).filter(status=True).update(state='delivered')
+    Order.objects.using(db).filter(status=False, delivery_crew__isnull=False).update(state='assigned')
+    OrderEvent.objects.using(db).filter(status=True).update(state='delivered')
+    OrderEvent.objects.using(db).filter(status=False).update(state='assigned')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_order_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='state',
+            field=models.CharField(choices=STATES, default='placed', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='orderevent',
+            name='from_state',
+            field=models.CharField(blank=True, choices=STATES, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='orderevent',
+            name='state',
+            field=models.CharField(choices=STATES, default='', max_length=16),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='orderevent',
+            name='kind',
+            field=models.CharField(choices=[('placed', 'Placed'), ('assigned', 'Assigned'), ('unassigned', 'Unassigned'), ('status', 'Status changed')], max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='orderevent',
+            name='delivery_crew',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='order_events', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='orderevent',
+            name='status',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_crew_status_idx',
+        ),
+        # Created last so that SQLite prefers them before ANALYZE has run
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('state', 'delivered'), _negated=True) & models.Q(('state', 'cancelled'), _negated=True), fields=['delivery_crew', 'date', 'id', 'state', 'user', 'status', 'total'], name='order_crew_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('state', 'placed')), fields=['date', 'id'], name='order_placed_idx'),
+        ),
+    ]
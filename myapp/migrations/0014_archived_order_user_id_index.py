@@ -0,0 +1,19 @@
+# Generated by Django 5.0.3 on 2026-10-18 13:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_job_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', 'id'], name='archivedorder_user_id_idx'),
+        ),
+    ]
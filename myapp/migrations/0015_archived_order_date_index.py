@@ -0,0 +1,19 @@
+# Generated by Django 5.0.3 on 2026-10-18 13:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0014_archived_order_user_id_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['date', 'id'], name='archivedorder_date_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Create your models here.
 class Category(models.Model):
@@ -15,6 +16,11 @@ class MenuItem(models.Model):
     category = models.ForeignKey(Category, on_delete=models.PROTECT, default=1)
     def __str__(self):
         return self.title
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'title', 'id'], name='menuitem_category_title_idx'),
+        ]
     
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -26,12 +32,49 @@ class Cart(models.Model):
     class Meta:
         unique_together = ('menuitem', 'user')    
         
+# Orders still on their way: the lifecycle's non-terminal states. Written as
+# two inequalities rather than NOT IN so that SQLite can match it against the
+# partial indexes below with the state as a bound parameter.
+ACTIVE_ORDERS = ~models.Q(state='delivered') & ~models.Q(state='cancelled')
+
+
 class Order(models.Model):
+    # Lifecycle states, moved between by myapp.lifecycle
+    PLACED = 'placed'
+    ASSIGNED = 'assigned'
+    OUT_FOR_DELIVERY = 'out_for_delivery'
+    DELIVERED = 'delivered'
+    CANCELLED = 'cancelled'
+    STATES = [(PLACED, 'Placed'), (ASSIGNED, 'Assigned'), (OUT_FOR_DELIVERY, 'Out for delivery'),
+              (DELIVERED, 'Delivered'), (CANCELLED, 'Cancelled')]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="delivery_crew", null=True)
     status = models.BooleanField(db_index=True, default=0)
+    # The current lifecycle state; status is kept as state == DELIVERED
+    state = models.CharField(max_length=16, choices=STATES, default=PLACED)
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Most orders have no key, so only the ones that do are indexed
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='order_user_idempotency_key',
+                                    condition=models.Q(idempotency_key__isnull=False)),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'], name='order_user_date_idx'),
+            models.Index(fields=['delivery_crew', 'date', 'id'], name='order_crew_date_idx'),
+            models.Index(fields=['delivery_crew', 'total', 'id'], name='order_crew_total_idx'),
+            # Only the active orders, however much delivered history there is.
+            # It carries every column of a crew's order list (and the state),
+            # so lists and crew loads are read from the index alone.
+            models.Index(fields=['delivery_crew', 'date', 'id', 'state', 'user', 'status', 'total'],
+                         name='order_crew_active_idx',
+                         condition=ACTIVE_ORDERS),
+            models.Index(fields=['date', 'id'], name='order_placed_idx', condition=models.Q(state='placed')),
+        ]
     
 
 class OrderItem(models.Model):
@@ -42,4 +85,146 @@ class OrderItem(models.Model):
     
     class Meta:
         unique_together = ("order", "menuitem")
-    
\ No newline at end of file
+
+
+# Delivered orders moved out of Order and OrderItem by myapp.archive once they
+# are old, so the hot tables and their indexes stay the same size. Rows keep
+# their ids, and the lines are reachable as orderitem_set like an order's.
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True)
+    status = models.BooleanField()
+    state = models.CharField(max_length=16, choices=Order.STATES)
+    total = models.DecimalField(max_digits=6, decimal_places=2)
+    date = models.DateField()
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'], name='archivedorder_user_date_idx'),
+            # The id is not SQLite's rowid here, so the user index does not
+            # hold it in order the way Order's does
+            models.Index(fields=['user', 'id'], name='archivedorder_user_id_idx'),
+            # For the order export, which reads in (date, id) order
+            models.Index(fields=['date', 'id'], name='archivedorder_date_idx'),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='orderitem_set')
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.SmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+
+
+class ThrottleBucket(models.Model):
+    # One row per throttle key: the tokens left and when they were last counted
+    key = models.CharField(max_length=255, primary_key=True)
+    tokens = models.FloatField()
+    updated = models.FloatField()
+    allowed = models.BooleanField(default=True)
+
+
+# Append-only log of every lifecycle transition, written alongside the change
+# by myapp.events. Events that concern a delivery crew member also make up
+# their change feed, which is streamed to them.
+class OrderEvent(models.Model):
+    PLACED = 'placed'
+    ASSIGNED = 'assigned'
+    UNASSIGNED = 'unassigned'
+    STATUS = 'status'
+    KINDS = [(PLACED, 'Placed'), (ASSIGNED, 'Assigned'), (UNASSIGNED, 'Unassigned'), (STATUS, 'Status changed')]
+
+    delivery_crew = models.ForeignKey(User, on_delete=models.CASCADE, related_name='order_events', null=True)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16, choices=KINDS)
+    from_state = models.CharField(max_length=16, choices=Order.STATES, blank=True)
+    state = models.CharField(max_length=16, choices=Order.STATES)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery_crew', 'id'], name='orderevent_crew_idx'),
+        ]
+
+
+# The lifecycle events of archived orders, moved out of OrderEvent with them
+class ArchivedOrderEvent(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    delivery_crew = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', null=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=16, choices=OrderEvent.KINDS)
+    from_state = models.CharField(max_length=16, choices=Order.STATES, blank=True)
+    state = models.CharField(max_length=16, choices=Order.STATES)
+    created = models.DateTimeField()
+
+
+# Sales rollups, kept up to date by myapp.rollups as orders are placed and
+# delivered so reports never aggregate the order tables themselves
+class DailySales(models.Model):
+    date = models.DateField(primary_key=True)
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    delivered_orders = models.IntegerField(default=0)
+    delivered_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+
+class MenuItemSales(models.Model):
+    menuitem = models.OneToOneField(MenuItem, on_delete=models.CASCADE, primary_key=True)
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-revenue', 'menuitem'], name='menuitem_sales_revenue_idx'),
+        ]
+
+
+class CategorySales(models.Model):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True)
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-revenue', 'category'], name='category_sales_revenue_idx'),
+        ]
+
+
+# Background jobs run by `manage.py runworker` (see myapp.jobs)
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    task = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    # Jobs with the same key are not queued twice
+    key = models.CharField(max_length=255, null=True, blank=True)
+    state = models.CharField(max_length=16, choices=STATES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    # The worker running the job and when its claim runs out
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Only jobs that have not started yet: a retry never clashes
+            models.UniqueConstraint(fields=['key'], condition=models.Q(state='queued', attempts=0),
+                                    name='job_waiting_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['run_at', 'id'], condition=models.Q(state='queued'), name='job_queued_idx'),
+            models.Index(fields=['claimed_by'], condition=models.Q(state='running'), name='job_running_idx'),
+        ]
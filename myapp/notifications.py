@@ -0,0 +1,18 @@
+from templated_mail.mail import BaseEmailMessage
+
+from .models import Order
+
+
+class OrderReceiptEmail(BaseEmailMessage):
+    template_name = 'email/order_receipt.html'
+
+
+def send_order_receipt(order_id):
+    """Email the customer the receipt for order ``order_id``; run by a worker after checkout."""
+    order = Order.objects.select_related('user').filter(id=order_id).first()
+    if order is None or not order.user.email:
+        return
+    items = list(order.orderitem_set.select_related('menuitem').order_by('id'))
+    for item in items:
+        item.price = item.quantity * item.unit_price
+    OrderReceiptEmail(context={'order': order, 'user': order.user, 'items': items}).send([order.user.email])
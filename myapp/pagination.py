@@ -0,0 +1,149 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a stable ``(sort key, id)`` order.
+
+    The cursor carries the sort key and id of the last row on the page, so
+    every page is fetched with an indexed range scan instead of an OFFSET.
+    """
+    page_size = api_settings.PAGE_SIZE or 10
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    ordering_fields = ('id',)
+    default_ordering = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, page_size=None, ordering_fields=None, default_ordering=None, ordering_query_param=None):
+        if page_size is not None:
+            self.page_size = page_size
+        if ordering_fields is not None:
+            self.ordering_fields = tuple(ordering_fields)
+        if default_ordering is not None:
+            self.default_ordering = default_ordering
+        if ordering_query_param is not None:
+            self.ordering_query_param = ordering_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.prepare(request)
+        return self.process_page(list(self.page_queryset(queryset)))
+
+    def prepare(self, request):
+        # Parse the page size, ordering and cursor from the query string
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is not None and self.cursor['o'] != self.ordering:
+            # A cursor is only valid for the ordering it was issued for
+            raise NotFound(self.invalid_cursor_message)
+
+    def page_queryset(self, queryset):
+        # Build the (lazy) queryset for the requested page, one row over size
+        field, descending = self.ordering.lstrip('-'), self.ordering.startswith('-')
+        reverse = self.cursor is not None and self.cursor['r']
+        if self.cursor is not None:
+            value, pk = self.cursor['v'], self.cursor['i']
+            forwards = descending == reverse
+            op = 'gt' if forwards else 'lt'
+            if field == 'id':
+                queryset = queryset.filter(**{'id__' + op: pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{field + '__' + op: value}) | Q(**{field: value, 'id__' + op: pk})
+                )
+        if descending != reverse:
+            order = ['-id'] if field == 'id' else ['-' + field, '-id']
+        else:
+            order = ['id'] if field == 'id' else [field, 'id']
+        return queryset.order_by(*order)[:self.page_size_value + 1]
+
+    def process_page(self, rows):
+        # Trim the lookahead row and work out which links to offer
+        has_more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        if self.cursor is not None and self.cursor['r']:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = self.cursor is not None, has_more
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.GET.get(self.ordering_query_param, self.default_ordering)
+        if ordering.lstrip('-') not in self.ordering_fields:
+            return self.default_ordering
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.GET.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if not isinstance(cursor, dict) or not {'o', 'v', 'i', 'r'} <= cursor.keys():
+                raise ValueError
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, row, reverse):
+        field = self.ordering.lstrip('-')
+        value = row[field] if isinstance(row, dict) else getattr(row, field)
+        pk = row['id'] if isinstance(row, dict) else row.id
+        cursor = {'o': self.ordering, 'v': value if isinstance(value, (int, float)) else str(value), 'i': pk, 'r': reverse}
+        encoded = b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
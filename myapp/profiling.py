@@ -0,0 +1,113 @@
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+Query = namedtuple('Query', ['sql', 'shape', 'duration', 'site'])
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.IGNORECASE)
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_LISTS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+# Transaction control is repeated by design and says nothing about the view
+_TRANSACTION = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+
+def normalize(sql):
+    """
+    Reduce ``sql`` to its shape: literals and placeholders become ``?`` and
+    IN/VALUES lists of any length become ``(...)``.
+    """
+    sql = _STRING.sub('?', sql.replace('%s', '?'))
+    sql = _NUMBER.sub('?', sql)
+    sql = _LISTS.sub('(...)', _LIST.sub('(...)', sql))
+    return _SPACE.sub(' ', sql).strip()
+
+
+# Frames of the profiler itself are never the call site
+_SKIP = {__file__, str(Path(__file__).with_name('middleware.py'))}
+
+
+def _call_site(base):
+    # The innermost frame in the project's own code
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base) and filename not in _SKIP and 'site-packages' not in filename:
+            return f'{Path(filename).relative_to(base)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class QueryProfile:
+    """
+    Every query run while recording, with its shape, duration and call site.
+
+    Use as ``with profile.record(): ...``; the middleware keeps one per
+    request.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.view_time = 0.0
+        self._base = os.path.join(str(settings.BASE_DIR), '')
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper
+        site = _call_site(self._base)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(Query(sql, normalize(sql), time.perf_counter() - started, site))
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def sql_time(self):
+        return sum(query.duration for query in self.queries)
+
+    def repeated(self, threshold=None):
+        """
+        Return the query shapes run at least ``threshold`` times, most first,
+        as ``[{'shape', 'count', 'time', 'sites'}, ...]``.
+        """
+        if threshold is None:
+            threshold = get_settings()['REPEAT_THRESHOLD']
+        groups = {}
+        for query in self.queries:
+            if query.shape.upper().startswith(_TRANSACTION):
+                continue
+            group = groups.setdefault(query.shape, {'shape': query.shape, 'count': 0, 'time': 0.0, 'sites': []})
+            group['count'] += 1
+            group['time'] += query.duration
+            if query.site and query.site not in group['sites']:
+                group['sites'].append(query.site)
+        return sorted((group for group in groups.values() if group['count'] >= threshold),
+                      key=lambda group: -group['count'])
+
+    def server_timing(self):
+        return (f'sql;dur={self.sql_time * 1000:.2f};desc="{self.count} queries", '
+                f'view;dur={self.view_time * 1000:.2f}')
+
+
+def get_settings():
+    options = {'ENABLED': False, 'REPEAT_THRESHOLD': 3}
+    options.update(getattr(settings, 'QUERY_PROFILER', {}))
+    return options
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from .cache import bump_version, get_cache, get_version
+
+ROLES = 'roles'
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery Crew'
+
+
+def _cache_key(user_id, version):
+    return f'{ROLES}:{version}:{user_id}'
+
+
+def _timeout():
+    return getattr(settings, 'ROLES_CACHE_TIMEOUT', 300)
+
+
+def get_user_roles(user):
+    """
+    Return the names of the groups ``user`` belongs to.
+
+    The names are kept on the user object for the rest of the request (the
+    same way Django caches permissions) and in the cache across requests.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_roles_cache', None)
+    if roles is None:
+        cache = get_cache()
+        key = _cache_key(user.pk, get_version(ROLES))
+        roles = cache.get(key)
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(key, roles, _timeout())
+        user._roles_cache = roles
+    return roles
+
+
+def prime_roles(users):
+    """Load the roles of many users with at most one cache round trip and one query."""
+    users = [user for user in users if getattr(user, '_roles_cache', None) is None]
+    if not users:
+        return
+    cache = get_cache()
+    version = get_version(ROLES)
+    cached = cache.get_many([_cache_key(user.pk, version) for user in users])
+    missing = {}
+    for user in users:
+        roles = cached.get(_cache_key(user.pk, version))
+        if roles is None:
+            missing[user.pk] = set()
+        else:
+            user._roles_cache = roles
+    if not missing:
+        return
+
+    memberships = User.groups.through.objects.filter(user_id__in=missing).values_list('user_id', 'group__name')
+    for user_id, name in memberships:
+        missing[user_id].add(name)
+    loaded = {user_id: frozenset(names) for user_id, names in missing.items()}
+    for user in users:
+        if user.pk in loaded:
+            user._roles_cache = loaded[user.pk]
+    cache.set_many({_cache_key(user_id, version): roles for user_id, roles in loaded.items()}, _timeout())
+
+
+def invalidate_user_roles(user_ids):
+    cache = get_cache()
+    version = get_version(ROLES)
+    cache.delete_many([_cache_key(user_id, version) for user_id in user_ids])
+
+
+def invalidate_all_roles():
+    bump_version(ROLES)
@@ -0,0 +1,146 @@
+from django.db import connections, router
+
+from .models import (ArchivedOrder, ArchivedOrderItem, CategorySales, DailySales, MenuItem, MenuItemSales, Order,
+                     OrderItem)
+
+
+def _tables(connection):
+    quote = connection.ops.quote_name
+    return {
+        'archived_order': quote(ArchivedOrder._meta.db_table),
+        'archived_orderitem': quote(ArchivedOrderItem._meta.db_table),
+        'daily': quote(DailySales._meta.db_table),
+        'menuitem_sales': quote(MenuItemSales._meta.db_table),
+        'category_sales': quote(CategorySales._meta.db_table),
+        'order': quote(Order._meta.db_table),
+        'orderitem': quote(OrderItem._meta.db_table),
+        'menuitem': quote(MenuItem._meta.db_table),
+    }
+
+
+# Each statement adds (sign 1) or subtracts (sign -1) the orders matching
+# {where} to/from the rollups. The SELECTs always have a WHERE clause, which
+# SQLite needs to parse INSERT ... SELECT ... ON CONFLICT.
+DAILY_SQL = """
+    INSERT INTO {daily} (date, orders, quantity, revenue, delivered_orders, delivered_revenue)
+    SELECT o.date,
+           %(sign)s * COUNT(DISTINCT o.id),
+           %(sign)s * COALESCE(SUM(i.quantity), 0),
+           %(sign)s * COALESCE(SUM(i.quantity * i.unit_price), 0),
+           %(sign)s * COUNT(DISTINCT CASE WHEN o.status THEN o.id END),
+           %(sign)s * COALESCE(SUM(CASE WHEN o.status THEN i.quantity * i.unit_price END), 0)
+    FROM {order} o LEFT JOIN {orderitem} i ON i.order_id = o.id
+    WHERE {where}
+    GROUP BY o.date
+    ON CONFLICT (date) DO UPDATE SET
+        orders = {daily}.orders + excluded.orders,
+        quantity = {daily}.quantity + excluded.quantity,
+        revenue = {daily}.revenue + excluded.revenue,
+        delivered_orders = {daily}.delivered_orders + excluded.delivered_orders,
+        delivered_revenue = {daily}.delivered_revenue + excluded.delivered_revenue
+"""
+
+MENUITEM_SQL = """
+    INSERT INTO {menuitem_sales} (menuitem_id, orders, quantity, revenue)
+    SELECT i.menuitem_id,
+           %(sign)s * COUNT(DISTINCT i.order_id),
+           %(sign)s * SUM(i.quantity),
+           %(sign)s * SUM(i.quantity * i.unit_price)
+    FROM {order} o INNER JOIN {orderitem} i ON i.order_id = o.id
+    WHERE {where}
+    GROUP BY i.menuitem_id
+    ON CONFLICT (menuitem_id) DO UPDATE SET
+        orders = {menuitem_sales}.orders + excluded.orders,
+        quantity = {menuitem_sales}.quantity + excluded.quantity,
+        revenue = {menuitem_sales}.revenue + excluded.revenue
+"""
+
+CATEGORY_SQL = """
+    INSERT INTO {category_sales} (category_id, orders, quantity, revenue)
+    SELECT m.category_id,
+           %(sign)s * COUNT(DISTINCT i.order_id),
+           %(sign)s * SUM(i.quantity),
+           %(sign)s * SUM(i.quantity * i.unit_price)
+    FROM {order} o INNER JOIN {orderitem} i ON i.order_id = o.id INNER JOIN {menuitem} m ON m.id = i.menuitem_id
+    WHERE {where}
+    GROUP BY m.category_id
+    ON CONFLICT (category_id) DO UPDATE SET
+        orders = {category_sales}.orders + excluded.orders,
+        quantity = {category_sales}.quantity + excluded.quantity,
+        revenue = {category_sales}.revenue + excluded.revenue
+"""
+
+DELIVERED_SQL = """
+    UPDATE {daily} SET
+        delivered_orders = delivered_orders + %(sign)s,
+        delivered_revenue = delivered_revenue + %(sign)s * (
+            SELECT COALESCE(SUM(quantity * unit_price), 0) FROM {orderitem} WHERE order_id = %(order_id)s
+        )
+    WHERE date = (SELECT date FROM {order} WHERE id = %(order_id)s)
+"""
+
+
+# Cancelled orders are not sales; they are taken out of the rollups as they
+# are cancelled (see lifecycle.transition)
+COUNTED = 'o.state <> %(cancelled)s'
+
+
+def _connection():
+    return connections[router.db_for_write(Order)]
+
+
+def _apply(order_ids, sign, archived=False):
+    connection = _connection()
+    tables = _tables(connection)
+    if archived:
+        tables.update(order=tables['archived_order'], orderitem=tables['archived_orderitem'])
+    placeholders = ', '.join(['%(order_{})s'.format(i) for i in range(len(order_ids))])
+    params = {'sign': sign, 'cancelled': Order.CANCELLED,
+              **{f'order_{i}': order_id for i, order_id in enumerate(order_ids)}}
+    with connection.cursor() as cursor:
+        for sql in (DAILY_SQL, MENUITEM_SQL, CATEGORY_SQL):
+            cursor.execute(sql.format(where=f'o.id IN ({placeholders}) AND {COUNTED}', **tables), params)
+
+
+def record_orders(order_ids, archived=False):
+    """
+    Add the orders (from the archive with ``archived``) to the rollups, lines
+    included.
+
+    Call inside the transaction that writes the orders so the rollups commit
+    (or roll back) with them.
+    """
+    if order_ids:
+        _apply(list(order_ids), 1, archived)
+
+
+def remove_orders(order_ids, archived=False):
+    """Take the orders back out of the rollups, before they are changed, cancelled or deleted."""
+    if order_ids:
+        _apply(list(order_ids), -1, archived)
+
+
+def record_delivery(order_id, delivered):
+    """Move an order in or out of its day's delivered totals."""
+    connection = _connection()
+    with connection.cursor() as cursor:
+        cursor.execute(DELIVERED_SQL.format(**_tables(connection)), {
+            'sign': 1 if delivered else -1, 'order_id': order_id,
+        })
+
+
+def rebuild_rollups(connection=None):
+    """
+    Recompute every rollup from the order tables and the order archive.
+
+    Sales are attributed to the category each menu item is in now.
+    """
+    connection = connection or _connection()
+    tables = _tables(connection)
+    sources = [tables, {**tables, 'order': tables['archived_order'], 'orderitem': tables['archived_orderitem']}]
+    with connection.cursor() as cursor:
+        for table in ('daily', 'menuitem_sales', 'category_sales'):
+            cursor.execute(f'DELETE FROM {tables[table]}')
+        for source in sources:
+            for sql in (DAILY_SQL, MENUITEM_SQL, CATEGORY_SQL):
+                cursor.execute(sql.format(where=COUNTED, **source), {'sign': 1, 'cancelled': Order.CANCELLED})
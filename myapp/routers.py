@@ -0,0 +1,104 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Routing state of the request being served, set by ReplicaRoutingMiddleware
+_request_state = ContextVar('replica_request_state', default=None)
+
+# Credentials are read from the primary: the token a login just created, or
+# the account a sign-up just created, was written by an anonymous request,
+# which has no client to pin
+PRIMARY_APPS = {'auth', 'authtoken', 'sessions'}
+
+
+class RequestState:
+    def __init__(self, replica, pin_key=None, pinned=False):
+        # One replica for the whole request, so its reads never go back in time
+        self.replica = replica
+        self.pin_key = pin_key
+        self.primary = pinned
+        self.wrote = False
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+
+def pin_key(request):
+    """The cache key pinning this client (by its credentials) to the primary, or None for anonymous requests."""
+    credentials = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return 'replica-pin:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+def start_request(request, pinned):
+    """Route the ORM reads of ``request`` to a replica unless ``pinned``; returns the state and a reset token."""
+    state = RequestState(random.choice(get_replicas()), pin_key(request), pinned)
+    return state, _request_state.set(state)
+
+
+def finish_request(token):
+    _request_state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send the reads of a request to one of ``DATABASE_REPLICAS`` and every
+    write to the primary (``default``).
+
+    Reads stay on the primary inside a transaction, once the request has
+    written, and for ``REPLICA_PIN_SECONDS`` after a request by the same
+    client wrote, so users see their own changes. Users, groups, tokens and
+    sessions are always read from the primary, as is all work outside
+    requests (management commands, job workers).
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or state.primary or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if model._meta.app_label in PRIMARY_APPS:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.primary = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def sync_replicas(aliases=None):
+    """
+    Copy the primary into each SQLite replica in ``aliases`` (by default
+    ``DATABASE_REPLICAS``) with SQLite's online backup API, which leaves a
+    consistent snapshot even while the primary is being written. Returns the
+    aliases copied to.
+    """
+    aliases = get_replicas() if aliases is None else aliases
+    source = connections[DEFAULT_DB_ALIAS]
+    for alias in aliases:
+        if alias not in connections:
+            raise ValueError(f"Unknown database '{alias}'.")
+        target = connections[alias]
+        if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+            raise ValueError(f"Only SQLite replicas can be copied; '{alias}' is {target.vendor}.")
+        source.ensure_connection()
+        target.ensure_connection()
+        source.connection.backup(target.connection)
+    return aliases
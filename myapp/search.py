@@ -0,0 +1,138 @@
+from django.db import connections
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'myapp_menuitem_search'
+
+# Trigram tokens match any substring of three or more characters, which is
+# what the old icontains search offered, but through an index. The triggers
+# keep it in sync with every write, bulk ones included. Note that migrations
+# which remake myapp_menuitem on SQLite drop its triggers; run the
+# rebuild_menu_search command afterwards.
+CREATE_SQL = [
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(title, category, tokenize='trigram')",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON myapp_menuitem BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, title, category)
+        SELECT new.id, new.title, title FROM myapp_category WHERE id = new.category_id;
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_update AFTER UPDATE OF title, category_id ON myapp_menuitem BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        INSERT INTO {SEARCH_TABLE} (rowid, title, category)
+        SELECT new.id, new.title, title FROM myapp_category WHERE id = new.category_id;
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_delete AFTER DELETE ON myapp_menuitem BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_category AFTER UPDATE OF title ON myapp_category BEGIN
+        UPDATE {SEARCH_TABLE} SET category = new.title
+        WHERE rowid IN (SELECT id FROM myapp_menuitem WHERE category_id = new.id);
+    END""",
+]
+
+DROP_SQL = [
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_category',
+    f'DROP TABLE IF EXISTS {SEARCH_TABLE}',
+]
+
+POPULATE_SQL = f"""INSERT INTO {SEARCH_TABLE} (rowid, title, category)
+    SELECT myapp_menuitem.id, myapp_menuitem.title, myapp_category.title
+    FROM myapp_menuitem INNER JOIN myapp_category ON myapp_category.id = myapp_menuitem.category_id"""
+
+
+def fts5_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        # Some builds load FTS5 without reporting the compile option
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+            cursor.execute('DROP TABLE temp.fts5_probe')
+        except Exception:
+            return False
+    return True
+
+
+# Whether each database has the index, so searches do not check on every request
+_index_exists = {}
+
+
+def search_index_exists(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    key = str(connection.settings_dict['NAME'])
+    if key not in _index_exists:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+            _index_exists[key] = cursor.fetchone() is not None
+    return _index_exists[key]
+
+
+def create_search_index(connection):
+    if not fts5_supported(connection):
+        return False
+    with connection.cursor() as cursor:
+        for sql in CREATE_SQL:
+            cursor.execute(sql)
+        cursor.execute(POPULATE_SQL)
+    _index_exists.pop(str(connection.settings_dict['NAME']), None)
+    return True
+
+
+def drop_search_index(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+    _index_exists.pop(str(connection.settings_dict['NAME']), None)
+
+
+def rebuild_search_index(connection):
+    """Recreate the index, triggers and contents from the menu tables."""
+    drop_search_index(connection)
+    created = create_search_index(connection)
+    if created:
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return created
+
+
+def match_expression(query):
+    # Quote every term so user input is never parsed as FTS5 syntax; terms
+    # shorter than a trigram cannot be looked up in the index.
+    terms = [term.replace('"', '""') for term in query.split()]
+    if not terms or any(len(term) < 3 for term in terms):
+        return None
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def search_menu_items(queryset, query):
+    """
+    Filter ``queryset`` to menu items matching ``query`` on title or category.
+
+    Adds a ``search_rank`` annotation where lower is a better match. Uses the
+    FTS5 index when the database has one and falls back to icontains otherwise.
+    """
+    connection = connections[queryset.db]
+    expression = match_expression(query)
+    if expression is not None and search_index_exists(connection):
+        table = queryset.model._meta.db_table
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', (expression,))
+        ).annotate(search_rank=RawSQL(
+            # bm25 with title matches weighted above category matches
+            f'SELECT bm25({SEARCH_TABLE}, 10.0, 1.0) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rowid = {table}.id',
+            (expression,), output_field=FloatField(),
+        ))
+
+    return queryset.filter(
+        Q(category__title__icontains=query) | Q(title__icontains=query)
+    ).annotate(search_rank=Case(
+        When(title__icontains=query, then=Value(0.0)), default=Value(1.0), output_field=FloatField(),
+    ))
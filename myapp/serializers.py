@@ -1,15 +1,26 @@
 from rest_framework import serializers
 from .models import *
 from django.contrib.auth.models import User
+from django.db import models
+from django.db.models import Prefetch
+from .roles import get_user_roles, prime_roles
+
+class UserListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Resolve the roles of the whole list at once instead of once per user
+        users = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        prime_roles(users)
+        return super().to_representation(users)
 
 class UserSerializer(serializers.ModelSerializer):
     groups = serializers.SerializerMethodField()
 
     def get_groups(self, obj):
-        return obj.groups.values_list('name', flat=True)
+        return sorted(get_user_roles(obj))
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'groups']
+        list_serializer_class = UserListSerializer
 
 class CategorySerializer (serializers.ModelSerializer):
     class Meta:
@@ -22,19 +33,84 @@ class MenuItemSerializer(serializers.ModelSerializer):
         model = MenuItem
         fields = ['id', 'title', 'price', 'featured', 'category']
 
+class MenuItemSyncSerializer(serializers.ModelSerializer):
+    # Category ids are checked for a whole sync at once instead of one query per item
+    id = serializers.IntegerField(required=False, min_value=1)
+    category = serializers.IntegerField(source='category_id', min_value=1)
+    class Meta:
+        model = MenuItem
+        fields = ['id', 'title', 'price', 'featured', 'category']
+
 class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ['id', 'user', 'menuitem', 'quantity', 'unit_price', 'price']
 
+class MenuItemSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MenuItem
+        fields = ['id', 'title', 'price']
+
 class OrderItemSerialzers(serializers.ModelSerializer):
     class Meta:
         model = OrderItem 
         fields = ['id', 'order', 'menuitem', 'quantity', 'unit_price']
+
+class ExpandedOrderItemSerializer(OrderItemSerialzers):
+    menuitem = MenuItemSummarySerializer(read_only=True)
         
 class OrderSerializer(serializers.ModelSerializer):
-    order_items = OrderItemSerialzers(many=True, read_only=True)
+    # Order lines are only rendered when the client asks for them with ?expand=items
+    # (and ?expand=items,menuitem for the menu item title and price)
+    order_items = OrderItemSerialzers(many=True, read_only=True, source='orderitem_set')
     class Meta:
         model = Order
-        fields = ['id', 'user', 'delivery_crew', 'status', 'total', 'date', 'order_items']
-    
\ No newline at end of file
+        fields = ['id', 'user', 'delivery_crew', 'status', 'state', 'total', 'date', 'order_items']
+        # The state only moves through myapp.lifecycle
+        read_only_fields = ['state']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.context.get('expand', ())
+        if 'items' not in expand:
+            self.fields.pop('order_items')
+        elif 'menuitem' in expand:
+            self.fields['order_items'] = ExpandedOrderItemSerializer(many=True, read_only=True, source='orderitem_set')
+
+    @staticmethod
+    def setup_queryset(queryset, expand):
+        # Load the lines for a whole page of orders (or archived orders) with one extra query
+        if 'items' not in expand:
+            return queryset
+        # In order_id index order, so the page's lines are read without a sort
+        items = queryset.model.orderitem_set.rel.related_model.objects.order_by('order_id', 'id')
+        if 'menuitem' in expand:
+            items = items.select_related('menuitem').only(
+                'id', 'order_id', 'menuitem_id', 'quantity', 'unit_price',
+                'menuitem__id', 'menuitem__title', 'menuitem__price',
+            )
+        return queryset.prefetch_related(Prefetch('orderitem_set', queryset=items))
+
+class DailySalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySales
+        fields = ['date', 'orders', 'quantity', 'revenue', 'delivered_orders', 'delivered_revenue']
+
+class MenuItemSalesSerializer(serializers.ModelSerializer):
+    title = serializers.CharField(source='menuitem.title', read_only=True)
+    class Meta:
+        model = MenuItemSales
+        fields = ['menuitem', 'title', 'orders', 'quantity', 'revenue']
+
+class CategorySalesSerializer(serializers.ModelSerializer):
+    title = serializers.CharField(source='category.title', read_only=True)
+    class Meta:
+        model = CategorySales
+        fields = ['category', 'title', 'orders', 'quantity', 'revenue']
+
+
+def parse_expand(request):
+    expand = {name.strip() for name in request.GET.get('expand', '').split(',') if name.strip()}
+    if 'menuitem' in expand:
+        expand.add('items')
+    return expand
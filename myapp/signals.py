@@ -0,0 +1,82 @@
+from django.contrib.auth.models import Group, User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from .authentication import revoke_cached_credentials
+from .cache import CATALOG, bump_version
+from .database import apply_pragmas
+from .models import ArchivedOrder, ArchivedOrderItem, Category, MenuItem, Order, OrderItem
+from .roles import invalidate_all_roles, invalidate_user_roles
+from .rollups import record_orders, remove_orders
+
+
+@receiver([post_save, post_delete], sender=MenuItem)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog(sender, **kwargs):
+    # Any menu or category change moves the catalog to a new version
+    bump_version(CATALOG)
+
+
+@receiver(pre_delete, sender=MenuItem)
+def unroll_menu_item_lines(sender, instance, **kwargs):
+    # Deleting a menu item cascades to its order lines. Take the orders with
+    # such lines out of the sales rollups, delete the lines, and put the
+    # orders back without them; all in the delete's transaction.
+    for lines, archived in ((OrderItem.objects, False), (ArchivedOrderItem.objects, True)):
+        lines = lines.filter(menuitem=instance)
+        order_ids = list(lines.values_list('order_id', flat=True).distinct())
+        remove_orders(order_ids, archived)
+        lines.delete()
+        record_orders(order_ids, archived)
+
+
+@receiver(pre_delete, sender=User)
+def unroll_user_orders(sender, instance, **kwargs):
+    # Deleting a user cascades to their orders, live and archived
+    remove_orders(Order.objects.filter(user=instance).values_list('id', flat=True))
+    remove_orders(ArchivedOrder.objects.filter(user=instance).values_list('id', flat=True), archived=True)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        # user.groups.add/remove/clear(...)
+        instance.__dict__.pop('_roles_cache', None)
+        invalidate_user_roles([instance.pk])
+    elif pk_set:
+        # group.user_set.add/remove(...)
+        invalidate_user_roles(pk_set)
+    else:
+        # group.user_set.clear() does not say which users were affected
+        invalidate_all_roles()
+
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_renamed_roles(sender, created=False, **kwargs):
+    if not created:
+        invalidate_all_roles()
+
+
+@receiver(post_delete, sender=Token)
+@receiver(post_delete, sender=User)
+def revoke_credentials(sender, **kwargs):
+    # Logging out deletes the token; drop it from every worker's cache
+    revoke_cached_credentials()
+
+
+@receiver(post_save, sender=User)
+def revoke_changed_user(sender, created=False, update_fields=None, **kwargs):
+    # Logins only touch last_login, which cached credentials do not depend on
+    if not created and set(update_fields or ()) != {'last_login'}:
+        revoke_cached_credentials()
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection)
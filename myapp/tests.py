@@ -1,3 +1,1490 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.core.management import call_command
+from django.db import connection, connections, router, transaction
+from django.db.models import Count, QuerySet
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import async_views, views
+from .archive import archive_orders
+from .authentication import LRUCache
+from .benchmarks import (ENDPOINTS, PLAN_ENDPOINTS, explain, explain_endpoints, find_regressions, find_table_scans,
+                         profile_endpoints, run_benchmarks, seed)
+from .loadtest import loadtest_context, parse_mix, run_loadtest
+from .lifecycle import InvalidTransition, assign_order, set_order_status, state_for, transition
+from .checkout import EmptyCart, place_order
+from .database import active_pragmas, apply_pragmas
+from .dispatch import assign_orders, crew_loads
+from .events import notify, record_order_change, record_placed
+from .export import FORMATS, export_rows
+from .fast_serializers import ValuesSerializer
+from .jobs import claim, enqueue, requeue_expired, run_job, run_worker, work
+from .profiling import QueryProfile, normalize
+from .models import *
+from .roles import get_user_roles
+from .routers import finish_request, pin_key, start_request, sync_replicas
+from .rollups import rebuild_rollups, record_orders
+from .search import search_index_exists
+from .serializers import (CartSerializer, CategorySerializer, DailySalesSerializer, MenuItemSalesSerializer,
+                          MenuItemSerializer, OrderSerializer, UserSerializer)
+from .throttling import consume, prune_buckets
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.crew = User.objects.create_user('crew', 'crew@example.com', 'pass')
+        cls.crew.groups.add(Group.objects.create(name='Delivery Crew'))
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        for i in range(7):
+            MenuItem.objects.create(title=f'Item {i % 3}', price=Decimal('5.00') + i, category=cls.category)
+        for day in (1, 1, 2, 3, 3):
+            Order.objects.create(user=cls.user, delivery_crew=cls.crew, total=Decimal('10.00'), date=date(2024, 1, day))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def walk(self, url):
+        # Follow next links from the first page and return every row seen
+        rows, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            rows.extend(response.data['results'])
+            pages.append(response.data)
+            url = response.data['next']
+        return rows, pages
+
+    def test_menu_items_pages_cover_every_row_once(self):
+        self.client.force_authenticate(self.user)
+        rows, pages = self.walk('/api/menu-items/')
+        self.assertEqual([row['id'] for row in rows], list(MenuItem.objects.order_by('id').values_list('id', flat=True)))
+        self.assertTrue(all(len(page['results']) <= 3 for page in pages))
+        self.assertIsNone(pages[0]['previous'])
+
+    def test_duplicate_sort_keys_are_tie_broken_by_id(self):
+        self.client.force_authenticate(self.user)
+        rows, _ = self.walk('/api/menu-items/?ordering=-title&page_size=2')
+        expected = list(MenuItem.objects.order_by('-title', '-id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in rows], expected)
+
+    def test_previous_link_returns_the_earlier_page(self):
+        self.client.force_authenticate(self.user)
+        first = self.client.get('/api/menu-items/?ordering=price').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/menu-items/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_user_orders_are_paginated_newest_first(self):
+        self.client.force_authenticate(self.user)
+        rows, _ = self.walk('/api/cart/orders/')
+        expected = list(Order.objects.order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in rows], expected)
+
+    def test_assigned_orders_use_keyset_pages(self):
+        self.client.force_authenticate(self.crew)
+        rows, pages = self.walk('/api/orders/?ordering=total')
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(len({row['id'] for row in rows}), 5)
+        self.assertTrue(all(len(page['results']) <= 2 for page in pages))
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        cls.item = MenuItem.objects.create(title='Soup', price=Decimal('4.50'), category=cls.category)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_repeat_requests_are_served_from_cache(self):
+        self.client.get('/api/menu-items/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/menu-items/')
+        self.assertEqual(response.data['results'][0]['title'], 'Soup')
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get('/api/categories/')['ETag']
+        response = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_menu_change_invalidates_cached_responses(self):
+        etag = self.client.get('/api/menu-items/')['ETag']
+        self.item.title = 'Stew'
+        self.item.save()
+        response = self.client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['title'], 'Stew')
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.items = [
+            MenuItem.objects.create(title=f'Item {i}', price=Decimal('2.50') * (i + 1), category=category)
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for item in self.items:
+            Cart.objects.create(user=self.user, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+
+    def test_checkout_moves_cart_into_order(self):
+        response = self.client.post('/api/cart/orders/', {'date': '2024-03-01'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total, Decimal('75.00'))
+        self.assertEqual(order.orderitem_set.count(), 5)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_checkout_with_empty_cart_places_nothing(self):
+        Cart.objects.filter(user=self.user).delete()
+        response = self.client.post('/api/cart/orders/', {'date': '2024-03-01'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(EmptyCart):
+            place_order(self.user, date(2024, 3, 1))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Job.objects.exists())
+        self.assertFalse(DailySales.objects.exists())
+
+    def test_checkout_query_count_does_not_grow_with_cart_size(self):
+        with CaptureQueriesContext(connection) as large_cart:
+            self.client.post('/api/cart/orders/', {'date': '2024-03-01'}, format='json')
+        Cart.objects.create(user=self.user, menuitem=self.items[0], quantity=1, unit_price=Decimal('2.50'), price=Decimal('2.50'))
+        with CaptureQueriesContext(connection) as single_item:
+            self.client.post('/api/cart/orders/', {'date': '2024-03-02'}, format='json')
+        self.assertEqual(len(large_cart), len(single_item))
+
+    def test_idempotency_key_prevents_duplicate_orders(self):
+        first = self.client.post('/api/cart/orders/', {'date': '2024-03-01'}, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        Cart.objects.create(user=self.user, menuitem=self.items[0], quantity=1, unit_price=Decimal('2.50'), price=Decimal('2.50'))
+        retry = self.client.post('/api/cart/orders/', {'date': '2024-03-01'}, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertTrue(Cart.objects.filter(user=self.user).exists())
+
+
+class OrderExpansionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        category = Category.objects.create(slug='mains', title='Mains')
+        items = [MenuItem.objects.create(title=f'Item {i}', price=Decimal('3.00'), category=category) for i in range(3)]
+        for day in range(1, 9):
+            order = Order.objects.create(user=cls.user, total=Decimal('9.00'), date=date(2024, 2, day))
+            for item in items:
+                OrderItem.objects.create(order=order, menuitem=item, quantity=1, unit_price=item.price)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_headers_only_by_default(self):
+        response, _ = self.count_queries('/api/cart/orders/')
+        self.assertNotIn('order_items', response.data['results'][0])
+
+    def test_expanded_items_include_menu_item_details(self):
+        response, _ = self.count_queries('/api/cart/orders/?expand=items,menuitem')
+        line = response.data['results'][0]['order_items'][0]
+        self.assertEqual(line['menuitem']['price'], '3.00')
+        self.assertIn('title', line['menuitem'])
+
+    def test_expansion_uses_a_fixed_number_of_queries(self):
+        _, small_page = self.count_queries('/api/cart/orders/?expand=menuitem&page_size=1')
+        _, large_page = self.count_queries('/api/cart/orders/?expand=menuitem&page_size=8')
+        _, headers_only = self.count_queries('/api/cart/orders/?page_size=8')
+        self.assertEqual(small_page, large_page)
+        self.assertEqual(large_page, headers_only + 1)
+
+
+class EndpointBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.context = seed(200)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_every_endpoint_stays_within_its_query_budget(self):
+        results = run_benchmarks(self.context, iterations=2)
+        self.assertEqual(set(results), {endpoint.name for endpoint in ENDPOINTS})
+        self.assertEqual(find_regressions(results), [])
+
+
+class MenuSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        starters = Category.objects.create(slug='starters', title='Starters')
+        desserts = Category.objects.create(slug='desserts', title='Desserts')
+        cls.salad = MenuItem.objects.create(title='Greek Salad', price=Decimal('7.00'), category=starters)
+        cls.bruschetta = MenuItem.objects.create(title='Bruschetta', price=Decimal('5.00'), category=starters)
+        cls.lemon = MenuItem.objects.create(title='Lemon Dessert', price=Decimal('6.00'), category=desserts)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query):
+        response = self.client.get('/api/menu-items/', {'search': query, 'page_size': 10})
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.data['results']]
+
+    def test_index_is_used_on_sqlite(self):
+        self.assertTrue(search_index_exists(connection))
+
+    def test_rebuild_command_restores_the_index(self):
+        call_command('rebuild_menu_search', stdout=StringIO())
+        self.assertEqual(self.search('bruschetta'), ['Bruschetta'])
+
+    def test_matches_title_and_category_substrings(self):
+        self.assertEqual(self.search('sala'), ['Greek Salad'])
+        self.assertEqual(set(self.search('starter')), {'Greek Salad', 'Bruschetta'})
+
+    def test_index_follows_menu_and_category_changes(self):
+        self.lemon.title = 'Lemon Tart'
+        self.lemon.save()
+        Category.objects.filter(title='Desserts').update(title='Sweets')
+        self.assertEqual(self.search('lemon tart'), ['Lemon Tart'])
+        self.assertEqual(self.search('sweet'), ['Lemon Tart'])
+        self.salad.delete()
+        self.assertEqual(self.search('salad'), [])
+
+    def test_title_matches_rank_above_category_matches(self):
+        MenuItem.objects.create(title='Starter Platter', price=Decimal('9.00'), category=Category.objects.get(title='Desserts'))
+        self.assertEqual(self.search('starter')[0], 'Starter Platter')
+
+    def test_short_terms_fall_back_to_icontains(self):
+        self.assertEqual(self.search('le'), ['Lemon Dessert'])
+
+
+class RoleResolutionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        cls.crew_group = Group.objects.create(name='Delivery Crew')
+        cls.crew = [User.objects.create_user(f'crew{i}', f'crew{i}@example.com', 'pass') for i in range(5)]
+        for user in cls.crew:
+            user.groups.add(cls.crew_group)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_role_check_is_cached_across_requests(self):
+        get_user_roles(User.objects.get(username='crew0'))
+        user = User.objects.get(username='crew0')
+        with self.assertNumQueries(0):
+            self.assertIn('Delivery Crew', get_user_roles(user))
+
+    def test_group_changes_invalidate_cached_roles(self):
+        self.assertIn('Delivery Crew', get_user_roles(User.objects.get(username='crew1')))
+        self.crew_group.user_set.remove(self.crew[1])
+        self.assertNotIn('Delivery Crew', get_user_roles(User.objects.get(username='crew1')))
+        User.objects.get(username='crew1').groups.add(self.crew_group)
+        self.assertIn('Delivery Crew', get_user_roles(User.objects.get(username='crew1')))
+
+    def test_staff_listing_resolves_roles_in_one_query(self):
+        self.client.force_authenticate(self.admin)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/manage-delivery-crew/')
+        self.assertEqual(len(response.data), 5)
+        self.assertTrue(all(row['groups'] == ['Delivery Crew'] for row in response.data))
+
+
+class AuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        Category.objects.create(slug='mains', title='Mains')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.token = Token.objects.create(user=self.user)
+
+    def test_cached_token_skips_the_token_lookup(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.client.get('/api/categories/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/categories/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleting_a_token_revokes_it_immediately(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.get('/api/categories/').status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/categories/').status_code, 401)
+
+    def test_jwt_access_tokens_authenticate_api_requests(self):
+        access = str(AccessToken.for_user(self.user))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/categories/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.client.get('/api/categories/')
+
+    def test_lru_cache_is_bounded(self):
+        lru = LRUCache(maxsize=2, ttl=60)
+        for key in 'abc':
+            lru.set(key, key)
+        self.assertEqual(len(lru), 2)
+        self.assertIsNone(lru.get('a'))
+
+
+class TokenBucketThrottleTests(TestCase):
+    def test_bucket_allows_a_burst_then_refills(self):
+        results = [consume('test-key', capacity=3, refill_rate=1, now=100.0)[0] for _ in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        self.assertTrue(consume('test-key', capacity=3, refill_rate=1, now=101.5)[0])
+        self.assertFalse(consume('test-key', capacity=3, refill_rate=1, now=101.6)[0])
+
+    def test_state_is_one_row_per_key(self):
+        for _ in range(10):
+            consume('test-key', capacity=100, refill_rate=1)
+        self.assertEqual(ThrottleBucket.objects.count(), 1)
+
+    def test_idle_buckets_are_pruned(self):
+        # The longest rate is per day: a day without requests refills any bucket
+        consume('idle', capacity=100, refill_rate=100 / 86400, now=1000.0)
+        consume('active', capacity=100, refill_rate=100 / 86400, now=50000.0)
+        self.assertEqual(prune_buckets(now=1000.0 + 86400), 0)
+        self.assertEqual(prune_buckets(now=1001.0 + 86400), 1)
+        self.assertEqual(list(ThrottleBucket.objects.values_list('key', flat=True)), ['active'])
+
+    def test_view_rates_come_from_their_scope(self):
+        user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        item = MenuItem.objects.create(title='Soup', price=Decimal('4.50'), category=Category.objects.create(slug='mains', title='Mains'))
+        client = APIClient()
+        client.force_authenticate(user)
+        rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'menu_item': '2/min'}
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}):
+            statuses = [client.get(f'/api/menu-items/{item.id}/').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.token = Token.objects.create(user=cls.user)
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.item = MenuItem.objects.create(title='Soup', price=Decimal('4.50'), category=category)
+        Cart.objects.create(user=cls.user, menuitem=cls.item, quantity=2, unit_price=Decimal('4.50'), price=Decimal('9.00'))
+        order = Order.objects.create(user=cls.user, total=Decimal('9.00'), date=date(2024, 1, 1))
+        OrderItem.objects.create(order=order, menuitem=cls.item, quantity=2, unit_price=Decimal('4.50'))
+
+    def setUp(self):
+        cache.clear()
+        self.async_client = AsyncClient()
+        self.auth = {'Authorization': f'Token {self.token.key}'}
+
+    def test_asgi_requests_resolve_to_async_views(self):
+        match = resolve('/api/cart/menu-items/', urlconf=settings.ASGI_URLCONF)
+        self.assertIs(match.func, async_views.cart)
+        self.assertIsNot(resolve('/api/cart/menu-items/').func, async_views.cart)
+
+    async def test_async_reads_match_the_sync_views(self):
+        for url in ['/api/menu-items/', f'/api/menu-items/{self.item.id}/', '/api/cart/menu-items/',
+                    '/api/cart/orders/?expand=items,menuitem']:
+            async_response = await self.async_client.get(url, headers=self.auth)
+            sync_response = await sync_to_async(self.client.get)(url, headers=self.auth)
+            self.assertEqual(async_response.status_code, 200, url)
+            self.assertEqual(async_response.json(), sync_response.json(), url)
+
+    async def test_other_formats_fall_through_to_the_drf_views(self):
+        for headers in [{'Accept': 'application/xml'}, {'Accept': 'text/html'}]:
+            for url in ['/api/menu-items/', f'/api/menu-items/{self.item.id}/', '/api/cart/menu-items/',
+                        '/api/cart/orders/']:
+                async_response = await self.async_client.get(url, headers={**self.auth, **headers})
+                sync_response = await sync_to_async(self.client.get)(url, headers={**self.auth, **headers})
+                self.assertEqual(async_response.status_code, 200, url)
+                self.assertEqual(async_response['Content-Type'], sync_response['Content-Type'], url)
+        response = await self.async_client.get('/api/cart/menu-items/?format=xml', headers=self.auth)
+        self.assertTrue(response['Content-Type'].startswith('application/xml'))
+        response = await self.async_client.get('/api/cart/menu-items/', headers={**self.auth, 'Accept': 'image/png'})
+        self.assertEqual(response.status_code, 406)
+
+    async def test_async_views_require_authentication(self):
+        response = await AsyncClient().get('/api/cart/menu-items/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_writes_fall_through_to_the_drf_views(self):
+        response = await self.async_client.delete('/api/cart/menu-items/', headers=self.auth)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await Cart.objects.filter(user=self.user).aexists())
+
+
+class SQLitePragmaTests(TestCase):
+    def test_profile_is_applied_to_new_connections(self):
+        active = active_pragmas(connection)
+        for name in ['synchronous', 'cache_size', 'busy_timeout', 'temp_store']:
+            self.assertEqual(str(active[name]), str(settings.SQLITE_PRAGMAS[name]), name)
+
+    def test_only_known_pragmas_and_plain_values_are_accepted(self):
+        with self.assertRaises(ImproperlyConfigured):
+            apply_pragmas(connection, {'foreign_keys': 'OFF'})
+        with self.assertRaises(ImproperlyConfigured):
+            apply_pragmas(connection, {'cache_size': '1; DROP TABLE myapp_cart'})
+
+    def test_command_shows_profile_and_active_values(self):
+        out = StringIO()
+        call_command('sqlite_profile', stdout=out)
+        self.assertIn('busy_timeout', out.getvalue())
+        self.assertIn('CONN_MAX_AGE: 600', out.getvalue())
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.items = [MenuItem.objects.create(title=f'Item {i}', price=Decimal('4.50'), category=category) for i in range(2)]
+        cls.january = Order.objects.create(user=cls.user, total=Decimal('13.50'), date=date(2024, 1, 5))
+        OrderItem.objects.create(order=cls.january, menuitem=cls.items[0], quantity=1, unit_price=Decimal('4.50'))
+        OrderItem.objects.create(order=cls.january, menuitem=cls.items[1], quantity=2, unit_price=Decimal('4.50'))
+        cls.february = Order.objects.create(user=cls.user, total=Decimal('0.00'), date=date(2024, 2, 5))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_has_one_line_per_order_with_its_items(self):
+        response = self.client.get('/api/orders/export/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        orders = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([order['id'] for order in orders], [self.january.id, self.february.id])
+        self.assertEqual(orders[0]['total'], '13.50')
+        self.assertEqual([item['quantity'] for item in orders[0]['items']], [1, 2])
+        self.assertEqual(orders[1]['items'], [])
+
+    def test_csv_has_one_row_per_order_line(self):
+        response = self.client.get('/api/orders/export/?type=csv')
+        rows = list(csv.DictReader(self.read(response).splitlines()))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['order_id'], str(self.january.id))
+        self.assertEqual(rows[2]['menuitem_id'], '')
+
+    def test_date_range_filters_orders(self):
+        response = self.client.get('/api/orders/export/?start=2024-02-01&end=2024-02-28')
+        self.assertEqual([json.loads(line)['id'] for line in self.read(response).splitlines()], [self.february.id])
+        self.assertEqual(self.client.get('/api/orders/export/?start=02/01/2024').status_code, 400)
+
+    def test_export_is_staff_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/orders/export/').status_code, 403)
+
+    async def test_asgi_export_streams_from_an_async_iterator(self):
+        token = await Token.objects.acreate(user=self.staff)
+        for export_type in FORMATS:
+            url = f'/api/orders/export/?type={export_type}'
+            response = await AsyncClient().get(url, headers={'Authorization': f'Token {token.key}'})
+            self.assertTrue(response.is_async)
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+            self.assertEqual(body, await sync_to_async(lambda: self.read(self.client.get(url)))())
+
+    def test_command_matches_the_endpoint(self):
+        out = StringIO()
+        call_command('export_orders', '--type', 'csv', '--chunk-size', '1', stdout=out)
+        self.assertEqual(out.getvalue(), self.read(self.client.get('/api/orders/export/?type=csv')))
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.crew = User.objects.create_user('crew', 'crew@example.com', 'pass')
+        mains = Category.objects.create(slug='mains', title='Mains')
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        cls.burger = MenuItem.objects.create(title='Burger', price=Decimal('8.00'), category=mains)
+        cls.soda = MenuItem.objects.create(title='Soda', price=Decimal('1.50'), category=drinks)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, order_date, lines):
+        for item, quantity in lines:
+            Cart.objects.create(user=self.user, menuitem=item, quantity=quantity,
+                                unit_price=item.price, price=item.price * quantity)
+        response = self.client.post('/api/cart/orders/', {'date': order_date}, format='json')
+        return Order.objects.get(id=response.data['id'])
+
+    def snapshot(self):
+        return (
+            list(DailySales.objects.order_by('date').values()),
+            list(MenuItemSales.objects.order_by('menuitem_id').values()),
+            list(CategorySales.objects.order_by('category_id').values()),
+        )
+
+    def test_checkout_updates_every_rollup(self):
+        self.checkout('2024-03-01', [(self.burger, 2), (self.soda, 1)])
+        self.checkout('2024-03-01', [(self.burger, 1)])
+        day = DailySales.objects.get(date=date(2024, 3, 1))
+        self.assertEqual((day.orders, day.quantity, day.revenue), (2, 4, Decimal('25.50')))
+        burger = MenuItemSales.objects.get(menuitem=self.burger)
+        self.assertEqual((burger.orders, burger.quantity, burger.revenue), (2, 3, Decimal('24.00')))
+        drinks = CategorySales.objects.get(category=self.soda.category)
+        self.assertEqual((drinks.orders, drinks.revenue), (1, Decimal('1.50')))
+
+    def test_status_changes_move_delivered_totals_once(self):
+        order = self.checkout('2024-03-01', [(self.burger, 1)])
+        assign_order(order, self.crew.id)
+        self.client.force_authenticate(self.crew)
+        for _ in range(2):
+            self.client.patch(f'/api/orders/{order.id}/', {'status': True}, format='json')
+        day = DailySales.objects.get(date=date(2024, 3, 1))
+        self.assertEqual((day.delivered_orders, day.delivered_revenue), (1, Decimal('8.00')))
+        self.client.patch(f'/api/orders/{order.id}/', {'status': False}, format='json')
+        day.refresh_from_db()
+        self.assertEqual((day.delivered_orders, day.delivered_revenue), (0, Decimal('0.00')))
+
+    def test_cancelled_orders_leave_the_report(self):
+        kept = self.checkout('2024-03-01', [(self.soda, 2)])
+        cancelled = self.checkout('2024-03-01', [(self.burger, 2)])
+        assign_order(kept, self.crew.id)
+        assign_order(cancelled, self.crew.id)
+        self.client.force_authenticate(self.staff)
+        response = self.client.patch(f'/api/orders/{cancelled.id}/', {'state': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        report = self.client.get('/api/reports/sales/?group=menu-item').data
+        self.assertEqual((report['totals']['orders'], report['totals']['revenue']), (1, '3.00'))
+        self.assertEqual(MenuItemSales.objects.get(menuitem=self.burger).orders, 0)
+        rebuild_rollups()
+        self.assertEqual(self.client.get('/api/reports/sales/').data['totals'], report['totals'])
+        self.assertFalse(MenuItemSales.objects.filter(menuitem=self.burger).exists())
+
+    def test_rebuild_matches_incremental_updates(self):
+        self.checkout('2024-03-01', [(self.burger, 2), (self.soda, 3)])
+        delivered = self.checkout('2024-03-02', [(self.soda, 1)])
+        assign_order(delivered, self.crew.id)
+        set_order_status(delivered, True)
+        incremental = self.snapshot()
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_cascading_deletes_keep_the_rollups_in_step(self):
+        archived = self.checkout('2020-01-01', [(self.burger, 1), (self.soda, 2)])
+        assign_order(archived, self.crew.id)
+        set_order_status(archived, True)
+        archive_orders()
+        self.checkout('2024-03-01', [(self.burger, 2), (self.soda, 1)])
+        self.checkout('2024-03-02', [(self.soda, 1)])
+        other = User.objects.create_user('other', 'other@example.com', 'pass')
+        self.client.force_authenticate(other)
+        Cart.objects.create(user=other, menuitem=self.burger, quantity=1, unit_price=self.burger.price,
+                            price=self.burger.price)
+        self.client.post('/api/cart/orders/', {'date': '2024-03-01'}, format='json')
+
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.delete(f'/api/menu-items/{self.soda.id}/').status_code, 204)
+        other.delete()
+        incremental = self.snapshot()
+        rebuild_rollups()
+        # A rebuild writes no rows for what sold nothing
+        self.assertEqual(self.snapshot(), tuple([row for row in rows if row['orders']] for rows in incremental))
+        day = DailySales.objects.get(date=date(2024, 3, 1))
+        self.assertEqual((day.orders, day.revenue), (1, Decimal('16.00')))
+
+    def test_report_reads_only_the_rollups(self):
+        self.checkout('2024-03-01', [(self.burger, 2), (self.soda, 3)])
+        self.checkout('2024-03-02', [(self.soda, 1)])
+        self.client.force_authenticate(self.staff)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/reports/sales/?start=2024-03-02')
+        self.assertEqual(response.data['totals']['revenue'], '1.50')
+        self.assertEqual([row['date'] for row in response.data['results']], ['2024-03-02'])
+
+        response = self.client.get('/api/reports/sales/?group=menu-item')
+        self.assertEqual([row['title'] for row in response.data['results']], ['Burger', 'Soda'])
+        self.assertEqual(response.data['results'][1]['quantity'], 4)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/reports/sales/').status_code, 403)
+
+
+class CartUpsertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.items = [MenuItem.objects.create(title=f'Item {i}', price=Decimal('2.50') * (i + 1), category=category)
+                     for i in range(3)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, data):
+        return self.client.post('/api/cart/menu-items/', data, format='json')
+
+    def test_adding_twice_tops_up_quantity_and_price(self):
+        first = self.add({'menuitem': self.items[0].id, 'quantity': 2})
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):
+            second = self.add({'menuitem': self.items[0].id, 'quantity': 3})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual((second.data['quantity'], second.data['price']), (5, '12.50'))
+        cart_item = Cart.objects.get(user=self.user)
+        self.assertEqual((cart_item.quantity, cart_item.price), (5, Decimal('12.50')))
+
+    def test_batch_adds_many_items_in_one_query(self):
+        self.add({'menuitem': self.items[0].id, 'quantity': 1})
+        items = [{'menuitem': item.id, 'quantity': 2} for item in self.items] + [{'menuitem': self.items[2].id, 'quantity': 1}]
+        with self.assertNumQueries(1):
+            response = self.add({'items': items})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['menuitem'], row['quantity']) for row in response.data],
+                         [(self.items[0].id, 3), (self.items[1].id, 2), (self.items[2].id, 3)])
+        self.assertEqual(Cart.objects.get(menuitem=self.items[2]).price, Decimal('22.50'))
+
+    def test_missing_menu_item_leaves_the_cart_unchanged(self):
+        response = self.add({'items': [{'menuitem': self.items[0].id, 'quantity': 1}, {'menuitem': 999, 'quantity': 1}]})
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('999', response.data['error'])
+        self.assertFalse(Cart.objects.exists())
+
+    def test_invalid_quantities_are_rejected(self):
+        for data in [{'menuitem': self.items[0].id}, {'menuitem': self.items[0].id, 'quantity': 0}, {'items': 'all'}]:
+            self.assertEqual(self.add(data).status_code, 400, data)
+
+
+class BulkMenuSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.mains = Category.objects.create(slug='mains', title='Mains')
+        cls.drinks = Category.objects.create(slug='drinks', title='Drinks')
+        cls.burger = MenuItem.objects.create(title='Burger', price=Decimal('8.00'), category=cls.mains)
+        cls.soup = MenuItem.objects.create(title='Soup', price=Decimal('4.00'), category=cls.mains)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def sync(self, data):
+        return self.client.post('/api/menu-items/bulk/', data, format='json')
+
+    def test_creates_updates_and_deletes_in_one_request(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.sync({
+                'upsert': [
+                    {'title': 'Lemonade', 'price': '2.50', 'category': self.drinks.id},
+                    {'id': self.burger.id, 'price': '9.00'},
+                ],
+                'delete': [self.soup.id],
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['status'] for row in response.data['upsert']], ['created', 'updated'])
+        self.assertEqual(response.data['delete'], [{'id': self.soup.id, 'status': 'deleted'}])
+        lemonade = MenuItem.objects.get(id=response.data['upsert'][0]['id'])
+        self.assertEqual((lemonade.title, lemonade.category_id), ('Lemonade', self.drinks.id))
+        self.burger.refresh_from_db()
+        self.assertEqual((self.burger.title, self.burger.price), ('Burger', Decimal('9.00')))
+        self.assertFalse(MenuItem.objects.filter(id=self.soup.id).exists())
+
+    def test_any_invalid_row_rejects_the_whole_sync(self):
+        response = self.sync({
+            'upsert': [
+                {'title': 'Lemonade', 'price': '2.50', 'category': self.drinks.id},
+                {'title': 'Tea', 'price': '1.00', 'category': 999},
+                {'id': 999, 'price': '1.00'},
+                {'title': 'Cake', 'price': 'free', 'category': self.mains.id},
+            ],
+            'delete': [self.burger.id, 'soup'],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([row['status'] for row in response.data['upsert']], ['created', 'error', 'error', 'error'])
+        self.assertIn('category', response.data['upsert'][1]['errors'])
+        self.assertIn('price', response.data['upsert'][3]['errors'])
+        self.assertEqual(response.data['delete'][1]['status'], 'error')
+        self.assertEqual(MenuItem.objects.count(), 2)
+
+    def test_query_count_does_not_grow_with_the_number_of_rows(self):
+        def rows(n):
+            return [{'title': f'Item {i}', 'price': '1.00', 'category': self.mains.id if i % 2 else self.drinks.id}
+                    for i in range(n)] + [{'id': self.burger.id, 'featured': True}]
+        with CaptureQueriesContext(connection) as small:
+            self.sync({'upsert': rows(2)})
+        with CaptureQueriesContext(connection) as large:
+            self.sync({'upsert': rows(200)})
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(MenuItem.objects.count(), 204)
+
+    def test_sync_invalidates_the_cached_catalog(self):
+        etag = self.client.get('/api/menu-items/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sync({'upsert': [{'id': self.soup.id, 'title': 'Stew'}]})
+        response = self.client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Stew', [row['title'] for row in response.data['results']])
+
+    def test_sync_is_staff_only(self):
+        self.client.force_authenticate(User.objects.create_user('customer', 'customer@example.com', 'pass'))
+        self.assertEqual(self.sync({'upsert': []}).status_code, 403)
+
+
+class ValuesSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        crew = User.objects.create_user('crew', 'crew@example.com', 'pass')
+        category = Category.objects.create(slug='mains', title='Mains')
+        items = [MenuItem.objects.create(title=f'Item {i}', price=Decimal('1.05') * (i + 1), featured=i % 2 == 0,
+                                         category=category) for i in range(3)]
+        for i, item in enumerate(items):
+            Cart.objects.create(user=cls.user, menuitem=item, quantity=i + 1, unit_price=item.price, price=item.price * (i + 1))
+            order = Order.objects.create(user=cls.user, delivery_crew=crew if i else None, status=i == 2,
+                                         total=Decimal('12.3'), date=date(2024, 1, i + 1))
+            OrderItem.objects.create(order=order, menuitem=item, quantity=1, unit_price=item.price)
+        rebuild_rollups()
+
+    def assertParity(self, serializer_class, queryset):
+        fast = ValuesSerializer(serializer_class).data(queryset)
+        expected = serializer_class(queryset, many=True).data
+        # Byte-for-byte, so key order and number formatting match too
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+
+    def test_output_matches_the_model_serializers(self):
+        self.assertParity(MenuItemSerializer, MenuItem.objects.order_by('id'))
+        self.assertParity(CategorySerializer, Category.objects.order_by('id'))
+        self.assertParity(CartSerializer, Cart.objects.order_by('id'))
+        self.assertParity(OrderSerializer, Order.objects.order_by('id'))
+        self.assertParity(DailySalesSerializer, DailySales.objects.order_by('date'))
+        self.assertParity(MenuItemSalesSerializer, MenuItemSales.objects.order_by('menuitem_id'))
+
+    def test_list_endpoints_match_the_model_serializers(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/cart/orders/?ordering=-id&page_size=10')
+        expected = OrderSerializer(Order.objects.order_by('-id'), many=True).data
+        self.assertEqual(JSONRenderer().render(response.data['results']), JSONRenderer().render(expected))
+
+    def test_nested_and_computed_fields_are_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ValuesSerializer(UserSerializer)
+        with self.assertRaises(ImproperlyConfigured):
+            ValuesSerializer(OrderSerializer, context={'expand': {'items'}})
+
+
+class DispatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        crew_group = Group.objects.create(name='Delivery Crew')
+        cls.busy = User.objects.create_user('busy', 'busy@example.com', 'pass')
+        cls.idle = User.objects.create_user('idle', 'idle@example.com', 'pass')
+        cls.away = User.objects.create_user('away', 'away@example.com', 'pass', is_active=False)
+        for user in (cls.busy, cls.idle, cls.away):
+            user.groups.add(crew_group)
+
+    def create_orders(self, count, **fields):
+        fields.setdefault('state', state_for(fields.get('delivery_crew'), fields.get('status')))
+        return [Order.objects.create(user=self.customer, total=Decimal('5.00'), date=date(2024, 1, 1 + i % 28), **fields)
+                for i in range(count)]
+
+    def test_orders_go_to_the_least_loaded_crew(self):
+        self.create_orders(2, delivery_crew=self.busy)
+        self.create_orders(1, delivery_crew=self.idle, status=True)
+        waiting = self.create_orders(4)
+        self.assertEqual(crew_loads(), {self.busy.id: 2, self.idle.id: 0})
+
+        self.assertEqual(assign_orders(), {self.idle.id: 3, self.busy.id: 1})
+        self.assertEqual(crew_loads(), {self.busy.id: 3, self.idle.id: 3})
+        # The oldest orders go first, to whoever had the least work
+        self.assertEqual([order.delivery_crew_id for order in Order.objects.filter(id__in=[o.id for o in waiting]).order_by('date', 'id')],
+                         [self.idle.id, self.idle.id, self.busy.id, self.idle.id])
+
+    def test_assigned_delivered_orders_and_non_crew_are_left_alone(self):
+        delivered = self.create_orders(1, status=True)[0]
+        self.assertEqual(assign_orders(), {})
+        delivered.refresh_from_db()
+        self.assertIsNone(delivered.delivery_crew_id)
+        self.assertFalse(Order.objects.filter(delivery_crew__in=[self.away, self.customer]).exists())
+
+    def test_batches_use_a_fixed_number_of_queries(self):
+        self.create_orders(12)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sum(assign_orders(batch_size=5).values()), 12)
+        # Per batch: crew, loads, orders, then the update and its events in a savepoint;
+        # then an empty read
+        self.assertLessEqual(len(queries), 3 * 7 + 3)
+        self.assertFalse(Order.objects.filter(delivery_crew__isnull=True).exists())
+
+    def test_orders_taken_in_the_meantime_are_skipped(self):
+        orders = self.create_orders(2)
+        bulk_update = QuerySet.bulk_update
+
+        def assign_first_by_hand(queryset, objs, fields, **kwargs):
+            # Someone assigns an order between the dispatcher's read and its write
+            Order.objects.filter(id=orders[0].id).update(delivery_crew=self.idle, state=Order.ASSIGNED)
+            return bulk_update(queryset, objs, fields, **kwargs)
+
+        with mock.patch.object(QuerySet, 'bulk_update', autospec=True, side_effect=assign_first_by_hand):
+            self.assertEqual(assign_orders(limit=2), {self.idle.id: 1})
+        self.assertEqual(Order.objects.get(id=orders[0].id).delivery_crew, self.idle)
+        self.assertEqual(Order.objects.get(id=orders[1].id).delivery_crew, self.idle)
+
+    def test_limit_stops_the_run(self):
+        self.create_orders(5)
+        self.assertEqual(sum(assign_orders(batch_size=2, limit=3).values()), 3)
+        self.assertEqual(Order.objects.filter(delivery_crew__isnull=True).count(), 2)
+
+    def test_dispatcher_reads_from_indexes(self):
+        # Open load per crew member is counted from the index alone
+        loads = Order.objects.filter(ACTIVE_ORDERS, delivery_crew__in=[self.busy.id, self.idle.id]) \
+            .values_list('delivery_crew').annotate(count=Count('id')).order_by()
+        self.assertIn('COVERING INDEX order_crew_active_idx', ' '.join(explain(*loads.query.sql_with_params())))
+        # Waiting orders come out in date order without a sort
+        waiting = Order.objects.filter(state=Order.PLACED).order_by('date', 'id').values_list('id', 'date')[:10]
+        plan = ' '.join(explain(*waiting.query.sql_with_params()))
+        self.assertIn('USING INDEX order_placed_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_endpoint_and_command(self):
+        self.create_orders(3)
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        self.assertEqual(client.post('/api/orders/dispatch/').status_code, 403)
+
+        client.force_authenticate(self.staff)
+        self.assertEqual(client.post('/api/orders/dispatch/', {'limit': 0}, format='json').status_code, 400)
+        response = client.post('/api/orders/dispatch/', {'limit': 2}, format='json')
+        self.assertEqual(response.data['assigned'], 2)
+        self.assertEqual(response.data['delivery_crew'], [{'id': self.busy.id, 'assigned': 1}, {'id': self.idle.id, 'assigned': 1}])
+
+        out = StringIO()
+        call_command('dispatch_orders', stdout=out)
+        self.assertIn('1 orders assigned.', out.getvalue())
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.context = seed(200)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_no_endpoint_scans_a_whole_table(self):
+        plans = explain_endpoints(self.context)
+        self.assertEqual(set(plans), {endpoint.name for endpoint in PLAN_ENDPOINTS})
+        self.assertEqual(find_table_scans(plans), [])
+
+    def test_scans_are_reported(self):
+        plans = {'orders': [('SELECT * FROM "myapp_order" o WHERE o.total > 1', ['SCAN o'])],
+                 'categories': [('SELECT * FROM "myapp_category"', ['SCAN myapp_category'])]}
+        self.assertEqual(len(find_table_scans(plans)), 1)
+        self.assertIn('orders: SCAN o', find_table_scans(plans)[0])
+
+    def test_a_limit_only_excuses_an_index_walk(self):
+        sql = 'SELECT * FROM "myapp_order" ORDER BY "myapp_order"."total" LIMIT 3'
+        plans = {'walk': [(sql, ['SCAN myapp_order USING INDEX order_total_idx'])],
+                 'scan': [(sql, ['SCAN myapp_order'])],
+                 'sort': [(sql, ['SEARCH myapp_order USING INDEX order_user_idx (user_id=?)', 'USE TEMP B-TREE FOR ORDER BY'])]}
+        self.assertEqual([failure.split(':')[0] for failure in find_table_scans(plans)], ['scan', 'sort'])
+
+    def test_idempotency_key_lookup_uses_the_partial_unique_index(self):
+        lookup = Order.objects.filter(user=self.context['customer'], idempotency_key='abc').order_by('id')[:1]
+        self.assertIn('order_user_idempotency_key', ' '.join(explain(*lookup.query.sql_with_params())))
+
+    def test_best_sellers_are_read_in_revenue_order(self):
+        plans = explain_endpoints(self.context, [endpoint for endpoint in PLAN_ENDPOINTS if endpoint.name.startswith('sales-report-')])
+        for queries in plans.values():
+            plan = ' '.join(queries[-1][1])
+            self.assertIn('sales_revenue_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+class QueryProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.context = seed(200)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_no_endpoint_repeats_a_query_shape(self):
+        profiles = profile_endpoints(self.context)
+        self.assertEqual(set(profiles), {endpoint.name for endpoint in PLAN_ENDPOINTS})
+        for name, profile in profiles.items():
+            self.assertEqual(profile.repeated(), [], name)
+
+    def test_shapes_ignore_literals_and_list_lengths(self):
+        self.assertEqual(normalize('SELECT * FROM t WHERE id IN (%s, %s) AND x = 12'),
+                         normalize("SELECT * FROM t  WHERE id IN (%s) AND x = 'a'"))
+        self.assertEqual(normalize('INSERT INTO t (a) VALUES (%s), (%s)'), 'INSERT INTO t (a) VALUES (...)')
+
+    def test_repeated_queries_are_found_with_their_call_site(self):
+        with QueryProfile().record() as profile:
+            for menu_item in MenuItem.objects.order_by('id')[:5]:
+                menu_item.category.title
+        [group] = profile.repeated()
+        self.assertEqual(group['count'], 5)
+        self.assertIn('FROM "myapp_category"', group['shape'])
+        self.assertTrue(group['sites'][0].startswith('myapp/tests.py:'))
+
+    @override_settings(QUERY_PROFILER={'ENABLED': True, 'REPEAT_THRESHOLD': 1})
+    def test_middleware_logs_repeats_and_sets_server_timing(self):
+        client = APIClient()
+        client.force_authenticate(self.context['customer'])
+        with self.assertLogs('myapp.profiler', 'WARNING') as logs:
+            response = client.get('/api/categories/')
+        self.assertRegex(response['Server-Timing'], r'^sql;dur=[\d.]+;desc="1 queries", view;dur=[\d.]+$')
+        self.assertEqual(response.query_profile.count, 1)
+        self.assertIn('GET /api/categories/: 1 x SELECT', logs.output[0])
+        self.assertIn('myapp/', logs.output[0])
+
+    @override_settings(QUERY_PROFILER={'ENABLED': True})
+    async def test_middleware_profiles_async_views(self):
+        token = await sync_to_async(Token.objects.create)(user=self.context['customer'])
+        response = await AsyncClient().get('/api/cart/menu-items/', headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.query_profile.count, 1)
+        self.assertIn('sql;dur=', response['Server-Timing'])
+
+    def test_middleware_is_off_by_default(self):
+        client = APIClient()
+        client.force_authenticate(self.context['customer'])
+        self.assertFalse(client.get('/api/categories/').has_header('Server-Timing'))
+
+
+class OrderEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.crew = User.objects.create_user('crew', 'crew@example.com', 'pass')
+        cls.crew.groups.add(Group.objects.create(name='Delivery Crew'))
+        cls.token = Token.objects.create(user=cls.crew)
+        cls.orders = [Order.objects.create(user=cls.customer, total=Decimal('5.00'), date=date(2024, 1, i + 1))
+                      for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+        self.auth = {'Authorization': f'Token {self.token.key}'}
+
+    def parse(self, text):
+        # [(id, event, data)] for every event in a chunk of the stream
+        events = []
+        for block in text.strip().split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+            if 'event' in fields:
+                events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+        return events
+
+    def test_assignments_and_status_changes_are_recorded(self):
+        assign_orders()
+        set_order_status(Order.objects.get(id=self.orders[0].id), True)
+        events = list(OrderEvent.objects.order_by('id').values_list('delivery_crew_id', 'order_id', 'kind', 'from_state', 'state'))
+        self.assertEqual(events, [
+            (self.crew.id, self.orders[0].id, 'assigned', 'placed', 'assigned'),
+            (self.crew.id, self.orders[1].id, 'assigned', 'placed', 'assigned'),
+            (self.crew.id, self.orders[0].id, 'status', 'assigned', 'delivered'),
+        ])
+
+    def test_reassignment_notifies_both_crew_members(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pass')
+        order = self.orders[0]
+        order.delivery_crew = other
+        record_order_change(order, self.crew.id, order.state)
+        self.assertEqual(sorted(OrderEvent.objects.values_list('delivery_crew_id', 'kind')),
+                         sorted([(self.crew.id, 'unassigned'), (other.id, 'assigned')]))
+
+    def test_old_events_are_pruned(self):
+        assign_orders()
+        OrderEvent.objects.filter(order=self.orders[0]).update(created=datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+        out = StringIO()
+        call_command('prune_order_events', '--days', '7', stdout=out)
+        self.assertIn('1 order events deleted.', out.getvalue())
+        self.assertEqual(list(OrderEvent.objects.values_list('order_id', flat=True)), [self.orders[1].id])
+
+    def test_wsgi_feed_sends_waiting_events_and_ends(self):
+        assign_orders()
+        first = OrderEvent.objects.order_by('id').first()
+        response = self.client.get('/api/orders/events/', headers={**self.auth, 'Last-Event-ID': str(first.id),
+                                                                  'Accept': 'text/event-stream'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        text = b''.join(response.streaming_content).decode()
+        self.assertTrue(text.startswith('retry: '))
+        [(event_id, kind, data)] = self.parse(text)
+        self.assertEqual((kind, data['order'], data['status'], data['total']), ('assigned', self.orders[1].id, False, '5.00'))
+
+    def test_feed_is_for_delivery_crew_only(self):
+        token = Token.objects.create(user=self.customer)
+        response = self.client.get('/api/orders/events/', headers={'Authorization': f'Token {token.key}',
+                                                                  'Accept': 'text/event-stream'})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(response.content.startswith(b'event: error'))
+        response = self.client.get('/api/orders/events/?last_event_id=x', headers=self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(ORDER_EVENTS_POLL_INTERVAL=30)
+    async def test_asgi_stream_resumes_and_pushes_new_events(self):
+        await sync_to_async(assign_orders)()
+        response = await AsyncClient().get('/api/orders/events/?last_event_id=0', headers=self.auth)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        try:
+            self.assertTrue((await anext(stream)).startswith(b'retry: '))
+            backlog = self.parse((await anext(stream)).decode() + (await anext(stream)).decode())
+            self.assertEqual([data['order'] for _, _, data in backlog], [order.id for order in self.orders])
+
+            # A status change is pushed as soon as the stream is told, not at the next poll
+            await sync_to_async(set_order_status)(await Order.objects.aget(id=self.orders[1].id), True)
+            notify()
+            [(event_id, kind, data)] = self.parse((await asyncio.wait_for(anext(stream), 5)).decode())
+            self.assertEqual((kind, data['order'], data['status']), ('status', self.orders[1].id, True))
+            self.assertGreater(event_id, backlog[-1][0])
+        finally:
+            await stream.aclose()
+
+    @override_settings(ORDER_EVENTS_POLL_INTERVAL=0.01)
+    async def test_asgi_stream_starts_from_now_without_a_last_event_id(self):
+        await sync_to_async(assign_orders)()
+        response = await AsyncClient().get('/api/orders/events/', headers=self.auth)
+        stream = aiter(response.streaming_content)
+        try:
+            await anext(stream)
+            # Nothing but keepalives once the stream has caught up
+            self.assertEqual(await asyncio.wait_for(anext(stream), 5), b': keepalive\n\n')
+        finally:
+            await stream.aclose()
+
+
+class OrderLifecycleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True)
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.crew = User.objects.create_user('crew', 'crew@example.com', 'pass')
+        cls.crew.groups.add(Group.objects.create(name='Delivery Crew'))
+        item = MenuItem.objects.create(title='Burger', price=Decimal('8.00'), category=Category.objects.create(slug='mains', title='Mains'))
+        Cart.objects.create(user=cls.customer, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.order, _ = place_order(self.customer, date(2024, 3, 1))
+
+    def move(self, user, state):
+        self.client.force_authenticate(user)
+        return self.client.patch(f'/api/orders/{self.order.id}/', {'state': state}, format='json')
+
+    def test_order_goes_from_placed_to_delivered_with_a_logged_step_each(self):
+        self.assertEqual(self.order.state, Order.PLACED)
+        assign_order(self.order, self.crew.id)
+        self.assertEqual(self.move(self.crew, 'out_for_delivery').data['state'], 'out_for_delivery')
+        response = self.move(self.crew, 'delivered')
+        self.assertEqual((response.data['state'], response.data['status']), ('delivered', True))
+
+        events = list(OrderEvent.objects.filter(order=self.order).order_by('id').values_list('kind', 'from_state', 'state'))
+        self.assertEqual(events, [('placed', '', 'placed'), ('assigned', 'placed', 'assigned'),
+                                  ('status', 'assigned', 'out_for_delivery'), ('status', 'out_for_delivery', 'delivered')])
+        self.assertEqual(DailySales.objects.get(date=date(2024, 3, 1)).delivered_orders, 1)
+
+    def test_transitions_are_checked(self):
+        with self.assertRaises(InvalidTransition):
+            transition(self.order, Order.DELIVERED)
+        assign_order(self.order, self.crew.id)
+        self.assertEqual(self.move(self.crew, 'sideways').status_code, 400)
+        # Crew move their orders on; only staff can cancel them
+        self.assertEqual(self.move(self.crew, 'cancelled').status_code, 403)
+        self.assertEqual(self.move(self.staff, 'cancelled').data['state'], 'cancelled')
+        self.assertEqual(self.move(self.staff, 'assigned').status_code, 409)
+        self.assertEqual(self.move(self.customer, 'delivered').status_code, 403)
+
+    def test_a_stale_copy_cannot_move_the_order(self):
+        assign_order(self.order, self.crew.id)
+        stale = Order.objects.get(id=self.order.id)
+        transition(self.order, Order.OUT_FOR_DELIVERY)
+        with self.assertRaises(InvalidTransition):
+            transition(stale, Order.DELIVERED)
+        self.assertEqual(Order.objects.get(id=self.order.id).state, Order.OUT_FOR_DELIVERY)
+
+    def test_assigned_orders_filter_by_state(self):
+        assign_order(self.order, self.crew.id)
+        done = Order.objects.create(user=self.customer, delivery_crew=self.crew, state=Order.DELIVERED, status=True,
+                                    total=Decimal('1.00'), date=date(2024, 3, 2))
+        self.client.force_authenticate(self.crew)
+        ids = lambda query: [row['id'] for row in self.client.get(f'/api/orders/{query}').data['results']]
+        self.assertEqual(ids(''), [done.id, self.order.id])
+        self.assertEqual(ids('?state=active'), [self.order.id])
+        self.assertEqual(ids('?state=delivered'), [done.id])
+        self.assertEqual(ids('?state=out_for_delivery'), [])
+        self.assertEqual(self.client.get('/api/orders/?state=lost').status_code, 400)
+
+    def test_active_orders_are_read_from_the_partial_indexes(self):
+        # A crew member's active orders, or those in one active state, come
+        # out of the index alone and already sorted
+        self.client.force_authenticate(self.crew)
+        for state in ('active', 'out_for_delivery'):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(f'/api/orders/?state={state}')
+            [page] = [query['sql'] for query in queries.captured_queries if 'FROM "myapp_order"' in query['sql']]
+            plan = ' '.join(explain(page))
+            self.assertIn('COVERING INDEX order_crew_active_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+        # Dispatch reads the placed orders from their own partial index
+        placed = Order.objects.filter(state=Order.PLACED).order_by('date', 'id')[:10]
+        self.assertIn('order_placed_idx', ' '.join(explain(*placed.query.sql_with_params())))
+
+
+class OrderArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.item = MenuItem.objects.create(title='Soup', price=Decimal('4.50'), category=Category.objects.create(slug='mains', title='Mains'))
+        old, recent = date(2020, 1, 1), date.today()
+        # Two old delivered orders, an old cancelled one and three recent ones
+        cls.old = [cls.create_order(old + timedelta(days=i), Order.DELIVERED) for i in range(2)]
+        cls.cancelled = cls.create_order(old, Order.CANCELLED)
+        cls.recent = [cls.create_order(recent, Order.DELIVERED) for _ in range(3)]
+
+    @classmethod
+    def create_order(cls, order_date, state):
+        order = Order.objects.create(user=cls.user, total=Decimal('4.50'), date=order_date, state=state,
+                                     status=state == Order.DELIVERED)
+        OrderItem.objects.create(order=order, menuitem=cls.item, quantity=1, unit_price=Decimal('4.50'))
+        record_orders([order.id])
+        return order
+
+    def setUp(self):
+        cache.clear()
+        self.auth = {'Authorization': f'Token {self.token.key}'}
+
+    def walk(self, url):
+        # Every order id on every page, following the next links
+        ids = []
+        while url:
+            data = self.client.get(url, headers=self.auth).json()
+            ids += [order['id'] for order in data['results']]
+            url = data['next']
+        return ids
+
+    def test_old_delivered_orders_move_with_their_lines(self):
+        record_placed(self.old)
+        events = list(OrderEvent.objects.filter(order__in=self.old).order_by('id').values_list('id', 'kind', 'created'))
+        rollups = list(DailySales.objects.order_by('date').values())
+        out = StringIO()
+        call_command('archive_orders', '--batch-size', '1', stdout=out)
+        self.assertIn('2 orders archived.', out.getvalue())
+
+        old_ids = [order.id for order in self.old]
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('id', flat=True)), old_ids)
+        self.assertEqual(ArchivedOrderItem.objects.filter(order_id__in=old_ids).count(), 2)
+        self.assertFalse(Order.objects.filter(id__in=old_ids).exists())
+        self.assertFalse(OrderItem.objects.filter(order_id__in=old_ids).exists())
+        self.assertEqual(list(ArchivedOrderEvent.objects.order_by('id').values_list('id', 'kind', 'created')), events)
+        self.assertTrue(Order.objects.filter(id=self.cancelled.id).exists())
+        # Archived sales still count, and survive a rebuild
+        self.assertEqual(list(DailySales.objects.order_by('date').values()), rollups)
+        rebuild_rollups()
+        self.assertEqual(list(DailySales.objects.order_by('date').values()), rollups)
+
+    def test_recent_orders_cannot_be_archived(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_orders', '--days', '1', stdout=StringIO())
+
+    def test_order_history_reads_through_to_the_archive(self):
+        before = {url: self.walk(url) for url in ['/api/cart/orders/?page_size=2', '/api/cart/orders/?page_size=2&ordering=id',
+                                                  '/api/cart/orders/?ordering=date']}
+        archive_orders()
+        for url, ids in before.items():
+            self.assertEqual(self.walk(url), ids, url)
+
+        response = self.client.get('/api/cart/orders/?expand=items&ordering=date', headers=self.auth)
+        lines = {order['id']: order['order_items'] for order in response.json()['results']}
+        self.assertEqual(lines[self.old[0].id][0]['menuitem'], self.item.id)
+
+        # A page of recent orders does not look in the archive at all
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/cart/orders/?page_size=2', headers=self.auth)
+        self.assertFalse([query for query in queries.captured_queries if 'archivedorder' in query['sql']])
+
+    def test_order_view_pages_through_the_archive(self):
+        archive_orders()
+        ids, url = [], '/api/order/?page_size=2'
+        while url:
+            request = APIRequestFactory().get(url)
+            force_authenticate(request, self.user)
+            data = views.order(request).data
+            self.assertLessEqual(len(data['results']), 2)
+            ids += [order['id'] for order in data['results']]
+            url = data['next']
+        self.assertEqual(ids, sorted(order.id for order in [*self.old, self.cancelled, *self.recent]))
+
+    def test_export_includes_archived_orders(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'pass', is_staff=True))
+        before = b''.join(client.get('/api/orders/export/?type=csv').streaming_content)
+        archive_orders()
+        self.assertEqual(b''.join(client.get('/api/orders/export/?type=csv').streaming_content), before)
+        self.assertEqual(len(list(export_rows(end=date(2020, 1, 2)))), 3)
+        # Nothing after the horizon is archived, so the archive is not read
+        with CaptureQueriesContext(connection) as queries:
+            list(export_rows(start=date.today()))
+        self.assertFalse([query for query in queries.captured_queries if 'archivedorder' in query['sql']])
+
+    async def test_async_history_matches_the_sync_view(self):
+        await sync_to_async(archive_orders)()
+        for url in ['/api/cart/orders/?ordering=date', '/api/cart/orders/?ordering=date&expand=items,menuitem']:
+            async_response = await AsyncClient().get(url, headers=self.auth)
+            sync_response = await sync_to_async(self.client.get)(url, headers=self.auth)
+            self.assertEqual(async_response.json(), sync_response.json(), url)
+        self.assertEqual(async_response.json()['results'][0]['id'], self.old[0].id)
+
+
+def failing_task():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        cls.crew = User.objects.create_user('crew', 'crew@example.com', 'pass')
+        cls.crew.groups.add(Group.objects.create(name='Delivery Crew'))
+        cls.item = MenuItem.objects.create(title='Soup', price=Decimal('4.50'), category=Category.objects.create(slug='mains', title='Mains'))
+
+    def checkout(self, order_date):
+        Cart.objects.create(user=self.customer, menuitem=self.item, quantity=2, unit_price=self.item.price, price=self.item.price * 2)
+        return place_order(self.customer, order_date)[0]
+
+    def test_checkout_leaves_receipt_and_dispatch_to_a_worker(self):
+        orders = [self.checkout(date(2024, 3, 1)), self.checkout(date(2024, 3, 2))]
+        # A receipt each, and a single dispatch run for both orders
+        self.assertEqual(sorted(Job.objects.values_list('task', flat=True)), [
+            'myapp.dispatch.assign_orders', 'myapp.notifications.send_order_receipt', 'myapp.notifications.send_order_receipt'])
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(work(burst=True), 3)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(sorted(message.subject for message in mail.outbox),
+                         [f'Your Little Lemon order #{order.id}' for order in orders])
+        self.assertIn('2 x Soup  9.00', mail.outbox[0].body)
+        self.assertEqual(set(Order.objects.values_list('state', flat=True)), {Order.ASSIGNED})
+
+    def test_jobs_are_rolled_back_with_their_transaction(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            enqueue(failing_task)
+            raise RuntimeError
+        self.assertFalse(Job.objects.exists())
+
+    def test_a_job_is_claimed_once_until_its_claim_runs_out(self):
+        enqueue(failing_task)
+        job = claim('first')
+        self.assertEqual((job.state, job.attempts), (Job.RUNNING, 1))
+        self.assertIsNone(claim('second'))
+
+        Job.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(requeue_expired(), 1)
+        self.assertEqual(claim('second').attempts, 2)
+        # The first worker lost the job, so its outcome is not recorded
+        with self.assertLogs('myapp.jobs', 'WARNING'):
+            self.assertFalse(run_job(job))
+        self.assertEqual(Job.objects.get().claimed_by.split(':')[0], 'second')
+
+    @override_settings(JOB_QUEUE={'BACKOFF': 10})
+    def test_failed_jobs_back_off_then_fail(self):
+        enqueue(failing_task, max_attempts=2)
+        started = timezone.now()
+        with self.assertLogs('myapp.jobs', 'WARNING'):
+            self.assertEqual(work(burst=True), 1)
+        job = Job.objects.get()
+        self.assertEqual((job.state, job.attempts), (Job.QUEUED, 1))
+        self.assertGreaterEqual(job.run_at, started + timedelta(seconds=10))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        # Not due yet
+        self.assertEqual(work(burst=True), 0)
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('myapp.jobs', 'ERROR'):
+            self.assertEqual(work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (Job.FAILED, 2))
+
+    def test_keyed_jobs_are_queued_once_while_waiting(self):
+        enqueue(assign_orders, key='dispatch_orders')
+        enqueue(assign_orders, key='dispatch_orders')
+        self.assertEqual(Job.objects.count(), 1)
+        # Once it has started, the next one queues behind it
+        claim('worker')
+        enqueue(assign_orders, key='dispatch_orders')
+        self.assertEqual(Job.objects.filter(state=Job.QUEUED).count(), 1)
+
+
+class JobWorkerPoolTests(TransactionTestCase):
+    def test_thread_pool_drains_the_queue(self):
+        user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        order = Order.objects.create(user=user, total=Decimal('0.00'), date=date(2024, 1, 1))
+        enqueue('myapp.notifications.send_order_receipt', args=[order.id])
+        enqueue('myapp.notifications.send_order_receipt', args=[order.id + 1])
+        # One thread: the in-memory test database reports lock contention at
+        # once rather than waiting out busy_timeout like a database file
+        self.assertEqual(run_worker(concurrency=1, pool='thread', burst=True, poll_interval=0), 2)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A replica of the tests' own, whatever the settings name: a second
+        # in-memory database, shared between threads, that sync_replicas fills.
+        # The test runner never sees it, so it is added once the class is set up.
+        connections.settings['replica'] = {**connections['default'].settings_dict,
+                                           'NAME': 'file:memorydb_replica?mode=memory&cache=shared'}
+        cls.addClassCleanup(connections.settings.pop, 'replica')
+        cls.addClassCleanup(connections.__delitem__, 'replica')
+        cls.addClassCleanup(connections['replica'].close)
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('customer', 'customer@example.com', 'pass')
+        self.auth = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+        other = User.objects.create_user('other', 'other@example.com', 'pass')
+        self.other_auth = {'Authorization': f'Token {Token.objects.create(user=other).key}'}
+        self.category = Category.objects.create(slug='mains', title='Mains')
+        self.soup = MenuItem.objects.create(title='Soup', price=Decimal('4.50'), category=self.category)
+        sync_replicas()
+
+    def test_reads_are_served_from_the_replica(self):
+        MenuItem.objects.create(title='Salad', price=Decimal('6.00'), category=self.category)
+        with CaptureQueriesContext(connections['replica']) as replica, CaptureQueriesContext(connection) as primary:
+            response = self.client.get('/api/menu-items/', headers=self.auth)
+        # The new item has not been copied yet
+        self.assertEqual([item['title'] for item in response.json()['results']], ['Soup'])
+        self.assertGreater(len(replica), 0)
+        # Only the credentials are read from the primary
+        self.assertEqual([query['sql'] for query in primary
+                          if 'SELECT' in query['sql'] and not query['sql'].startswith('SELECT "authtoken_token"')], [])
+
+        sync_replicas()
+        cache.clear()
+        response = self.client.get('/api/menu-items/', headers=self.auth)
+        self.assertEqual({item['title'] for item in response.json()['results']}, {'Soup', 'Salad'})
+
+    def test_a_client_reads_its_own_writes(self):
+        response = self.client.post('/api/cart/menu-items/', {'menuitem': self.soup.id, 'quantity': 2},
+                                    headers=self.auth, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        # Pinned to the primary, although the replica has no cart yet
+        self.assertEqual(len(self.client.get('/api/cart/menu-items/', headers=self.auth).json()), 1)
+        # Other clients still read the replica
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.client.get('/api/cart/menu-items/', headers=self.other_auth)
+        self.assertGreater(len(replica), 0)
+
+        # Once the pin runs out, back to the replica
+        cache.clear()
+        self.assertEqual(self.client.get('/api/cart/menu-items/', headers=self.auth).json(), [])
+
+    def test_sign_up_log_in_and_use_the_token_before_the_replica_catches_up(self):
+        # Each step is anonymous until the last, so none of them pins the client
+        response = self.client.post('/auth/users/', {'username': 'new', 'email': 'new@example.com',
+                                                     'password': 'Lemon-pass-42', 're_password': 'Lemon-pass-42'})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/auth/token/login/', {'username': 'new', 'password': 'Lemon-pass-42'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/cart/menu-items/', headers={'Authorization': f"Token {response.json()['token']}"})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_async_views_route_the_same_way(self):
+        await sync_to_async(Cart.objects.create)(user=self.user, menuitem=self.soup, quantity=1,
+                                                 unit_price=self.soup.price, price=self.soup.price)
+        response = await AsyncClient().get('/api/cart/menu-items/', headers=self.auth)
+        self.assertEqual(response.json(), [])
+        await sync_to_async(cache.set)(pin_key(RequestFactory().get('/', headers=self.auth)), True)
+        response = await AsyncClient().get('/api/cart/menu-items/', headers=self.auth)
+        self.assertEqual(len(response.json()), 1)
+
+    def test_reads_outside_requests_and_in_transactions_use_the_primary(self):
+        self.assertEqual(MenuItem.objects.all().db, 'default')
+        state, token = start_request(RequestFactory().get('/'), pinned=False)
+        try:
+            self.assertEqual(MenuItem.objects.all().db, 'replica')
+            with transaction.atomic():
+                self.assertEqual(MenuItem.objects.all().db, 'default')
+            self.assertEqual(router.db_for_write(MenuItem), 'default')
+            # The rest of a request that wrote reads its writes
+            self.assertEqual(MenuItem.objects.all().db, 'default')
+        finally:
+            finish_request(token)
+
+
+class LoadTestTests(TransactionTestCase):
+    def test_every_journey_runs_through_the_app(self):
+        seed(200)
+        context = loadtest_context()
+        for app in ('wsgi', 'asgi'):
+            results = run_loadtest(context, duration=0.5, concurrency=1, app=app)
+            self.assertEqual(results['all']['error_rate'], 0, app)
+            self.assertEqual(results['all']['locked'], 0, app)
+            self.assertLessEqual(set(results), {'menu-items', 'menu-item-detail', 'menu-search', 'cart-add', 'cart',
+                                                'checkout', 'assigned-orders', 'all'})
+        results = run_loadtest(context, mix=parse_mix('checkout'), duration=0.5, concurrency=1)
+        self.assertEqual(set(results), {'cart-add', 'checkout', 'all'})
+        self.assertEqual(results['checkout']['error_rate'], 0)
+        self.assertTrue(Order.objects.filter(date=date.today()).exists())
+
+    def test_mix_is_validated(self):
+        self.assertEqual(parse_mix('browse=3,crew'), {'browse': 3.0, 'crew': 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix('browse=1,lunch=2')
+        with self.assertRaises(ValueError):
+            parse_mix('browse=0')
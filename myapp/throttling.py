@@ -0,0 +1,104 @@
+import time
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import throttling
+from rest_framework.settings import api_settings
+
+from .models import ThrottleBucket
+
+
+def consume(key, capacity, refill_rate, now=None, using=None):
+    """
+    Take one token from the bucket ``key`` in a single atomic statement.
+
+    The bucket refills at ``refill_rate`` tokens per second up to
+    ``capacity``. Returns ``(allowed, tokens_left)``.
+    """
+    using = using or getattr(settings, 'THROTTLE_DATABASE', 'default')
+    connection = connections[using]
+    now = time.time() if now is None else now
+    least = 'MIN' if connection.vendor == 'sqlite' else 'LEAST'
+    quote = connection.ops.quote_name
+    table = quote(ThrottleBucket._meta.db_table)
+    # SET expressions all see the row as it was before this statement
+    refilled = f'{least}(%s, {table}.tokens + (%s - {table}.updated) * %s)'
+    sql = f"""
+        INSERT INTO {table} ({quote('key')}, tokens, updated, allowed) VALUES (%s, %s, %s, %s)
+        ON CONFLICT ({quote('key')}) DO UPDATE SET
+            tokens = CASE WHEN {refilled} >= 1 THEN {refilled} - 1 ELSE {refilled} END,
+            allowed = {refilled} >= 1,
+            updated = %s
+        RETURNING allowed, tokens
+    """
+    refill_params = [capacity, now, refill_rate]
+    params = [key, capacity - 1, now, True] + refill_params * 4 + [now]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        allowed, tokens = cursor.fetchone()
+    return bool(allowed), tokens
+
+
+def prune_buckets(now=None, using=None):
+    """
+    Delete the buckets left untouched for the longest throttle period, which
+    have refilled completely: consume() treats a missing row as a full bucket.
+    Returns how many were deleted.
+    """
+    using = using or getattr(settings, 'THROTTLE_DATABASE', 'default')
+    now = time.time() if now is None else now
+    rates = [rate for rate in api_settings.DEFAULT_THROTTLE_RATES.values() if rate]
+    if not rates:
+        return ThrottleBucket.objects.using(using).all().delete()[0]
+    # parse_rate() only reads its argument: (requests, seconds to refill them all)
+    period = max(throttling.SimpleRateThrottle.parse_rate(None, rate)[1] for rate in rates)
+    return ThrottleBucket.objects.using(using).filter(updated__lt=now - period).delete()[0]
+
+
+class TokenBucketThrottle(throttling.SimpleRateThrottle):
+    """
+    Token-bucket throttle keyed like ScopedRateThrottle.
+
+    Each key keeps a single row (tokens left and the time they were counted)
+    in the database, so every worker process shares the same counters. The
+    rate for a scope comes from ``DEFAULT_THROTTLE_RATES``; ``100/day`` means a
+    burst of 100 requests refilled at 100 tokens per day.
+    """
+
+    def get_rate(self):
+        # DRF copies the rates when it is imported; reading them per request
+        # lets override_settings change them
+        self.THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+        return super().get_rate()
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.refill_rate = self.num_requests / self.duration
+        allowed, self.tokens = consume(self.key, self.num_requests, self.refill_rate)
+        return allowed
+
+    def wait(self):
+        return max(0.0, (1 - self.tokens) / self.refill_rate)
+
+
+class MenuItemThrottle(TokenBucketThrottle):
+    scope = 'menu_item'
+
+
+class AssignedOrdersThrottle(TokenBucketThrottle):
+    scope = 'assigned_orders'
+
+
+class RestrictedThrottle(TokenBucketThrottle):
+    scope = 'restricted'
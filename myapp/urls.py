@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path('menu-items/', views.menu_items_view, name='menu-item'),
+    path('menu-items/bulk/', views.bulk_menu_items, name='menu-items-bulk'),
     path('menu-items/<int:menu_item_id>/', views.manage_menu_item, name='menu-details'),
     path('categories/', views.categories_view, name='categories-list'),
     path('groups/manager/users/', views.manage_manager, name='manager'),
@@ -12,7 +13,11 @@ urlpatterns = [
     path('cart/orders/', views.manage_user_orders, name='user_order'),
     path('orders/', views.view_assigned_orders, name='order-list'),
     path('orders/', views.create_order, name='create-order'),
+    path('orders/export/', views.export_orders, name='order-export'),
+    path('orders/dispatch/', views.dispatch_orders, name='order-dispatch'),
+    path('orders/events/', views.order_events, name='order-events'),
     path('orders/<int:order_id>/', views.manage_order_items, name='order-detail'),
+    path('reports/sales/', views.sales_report, name='sales-report'),
     ]
 
 
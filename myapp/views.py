@@ -1,65 +1,89 @@
 from django.shortcuts import render
+from django.db import transaction
+from django.http import StreamingHttpResponse
 
 # Create your views here.
-from rest_framework import status, throttling
+from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.decorators import api_view, permission_classes, throttle_classes
-from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.exceptions import NotFound
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, throttle_classes
 from rest_framework.permissions import IsAdminUser, IsAuthenticated, BasePermission
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from django.contrib.auth.models import User, Group
-from django.db.models import Q
-from django.db import transaction
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
 #from django_filters.rest_framework import DjangoFilterBackend
 from .models import *
 from .serializers import *
+from .pagination import KeysetPagination
+from .archive import paginate_orders
+from .cache import cache_catalog_response
+from .cart import add_to_cart, parse_lines
+from .catalog_sync import sync_menu_items
+from .checkout import EmptyCart, place_order
+from .dispatch import BATCH_SIZE, assign_orders
+from .events import (RETRY, events_after, format_event, latest_event_id, parse_last_event_id, record_assignments,
+                     record_placed)
+from .export import FORMATS, export_rows
+from .fast_serializers import ValuesSerializer
+from .lifecycle import (CREW_STATES, TRANSITIONS, InvalidTransition, assign_order, set_order_status, state_for,
+                        transition)
+from .search import search_menu_items
+from .roles import DELIVERY_CREW, get_user_roles
+from .rollups import record_orders, remove_orders
+from .throttling import AssignedOrdersThrottle, MenuItemThrottle, RestrictedThrottle
 
 class IsDeliveryCrewUser(BasePermission):
     def has_permission(self, request, view):
         # Check if the user is authenticated and belongs to the delivery crew group
-        return request.user.is_authenticated and request.user.groups.filter(name='Delivery Crew').exists()
+        return request.user.is_authenticated and DELIVERY_CREW in get_user_roles(request.user)
 
-class CustomThrottle(throttling.AnonRateThrottle):
-     rate = '100/day'
+class EventStreamRenderer(BaseRenderer):
+    # Lets EventSource clients (Accept: text/event-stream) through content
+    # negotiation; only error responses are rendered, events are streamed
+    media_type = 'text/event-stream'
+    format = 'event-stream'
 
-class CustomUserThrottle(throttling.UserRateThrottle):
-     rate = '100/day'
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b'event: error\ndata: ' + JSONRenderer().render(data) + b'\n\n'
 
 @api_view(['POST', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAdminUser])
-@throttle_classes([CustomThrottle, CustomUserThrottle])
+@throttle_classes([RestrictedThrottle])
 def restricted_access(request):
      return Response({"error": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
 
 @api_view(['POST', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAdminUser])
-@throttle_classes([CustomThrottle, CustomUserThrottle])
+@throttle_classes([RestrictedThrottle])
 def restricted_access_detail(request, menu_id):
      return Response({"error":"Access Denied"}, status=status.HTTP_403_FORBIDDEN)
      
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_catalog_response
 def menu_items_view(request):
-    paginator = PageNumberPagination()
-    paginator.page_size = 3 
     if request.method == 'GET':
         search_query = request.GET.get('search')
         if search_query:
-            # Filter menu items by category name or menu item title
-            menu_items = MenuItem.objects.filter(
-                Q(category__title__icontains=search_query) | Q(title__icontains=search_query)
-            )
+            # Filter menu items by category name or menu item title, best matches first
+            fast_serializer = ValuesSerializer(MenuItemSerializer)
+            menu_items = fast_serializer.values(search_menu_items(MenuItem.objects.all(), search_query), 'search_rank')
+            paginator = KeysetPagination(page_size=3, ordering_fields=['search_rank', 'id', 'title', 'price'],
+                                         default_ordering='search_rank')
         else:
-            menu_items = MenuItem.objects.all()
-        paginated_menu_items = paginator.paginate_queryset(menu_items, request)  
-        serializer = MenuItemSerializer(menu_items, many=True)
-        return Response(serializer.data)
+            fast_serializer = ValuesSerializer(MenuItemSerializer)
+            menu_items = fast_serializer.values(MenuItem.objects.all())
+            paginator = KeysetPagination(page_size=3, ordering_fields=['id', 'title', 'price'])
+        paginated_menu_items = paginator.paginate_queryset(menu_items, request)
+        return paginator.get_paginated_response(fast_serializer.render(paginated_menu_items))
    
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
-@throttle_classes([CustomThrottle, CustomUserThrottle])
+@throttle_classes([MenuItemThrottle])
 def manage_menu_item(request, menu_item_id=None):
     if request.method == 'GET':
         if menu_item_id is None:
@@ -71,17 +95,12 @@ def manage_menu_item(request, menu_item_id=None):
             if category:
                 queryset = queryset.filter(category__title=category)
 
-            # Pagination
-            paginator = PageNumberPagination
-            paginator.page_size = 10
-            paginated_queryset = paginator.paginate_queryset(queryset, request)
-
-            # Sorting
-            sort_by = request.query_params.get('sort_by', 'title')
-            queryset = queryset.order_by(sort_by)
-
-            serializer = MenuItemSerializer(paginated_queryset, many=True)
-            return paginator.get_paginated_response(serializer.data)
+            # Sorting and pagination
+            paginator = KeysetPagination(page_size=10, ordering_fields=['id', 'title', 'price'],
+                                         default_ordering='title', ordering_query_param='sort_by')
+            fast_serializer = ValuesSerializer(MenuItemSerializer)
+            paginated_rows = paginator.paginate_queryset(fast_serializer.values(queryset), request)
+            return paginator.get_paginated_response(fast_serializer.render(paginated_rows))
         else:
             # If menu_item_id is provided, handle retrieving a specific menu item
             try:
@@ -124,8 +143,22 @@ def manage_menu_item(request, menu_item_id=None):
         else:
             return Response({'message': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
 
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def bulk_menu_items(request):
+    # {'upsert': [menu item, ...], 'delete': [id, ...]}; rows with an id update that item
+    upserts = request.data.get('upsert', [])
+    deletes = request.data.get('delete', [])
+    if not isinstance(upserts, list) or not isinstance(deletes, list):
+        return Response({'error': 'upsert and delete must be lists.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Validate everything, then write it all in one transaction (or nothing if any row is invalid)
+    results, ok = sync_menu_items(upserts, deletes)
+    return Response(results, status=status.HTTP_200_OK if ok else status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET', 'POST', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@cache_catalog_response
 def categories_view(request, pk=None):
     if request.method == 'GET':
         if pk is not None:
@@ -136,9 +169,7 @@ def categories_view(request, pk=None):
             except Category.DoesNotExist:
                 return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
         else:
-            queryset = Category.objects.all()
-            serializer = CategorySerializer(queryset, many=True)
-            return Response(serializer.data)
+            return Response(ValuesSerializer(CategorySerializer).data(Category.objects.all()))
 
     elif request.method == 'POST':
         if request.user.is_staff:  # Check if the user is admin
@@ -240,33 +271,6 @@ def manage_manager(request, user_id=None):
 
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated, IsDeliveryCrewUser])
-def view_assigned_orders(request):
-    # Retrieve orders assigned to the authenticated delivery crew user
-    assigned_orders = Order.objects.filter(delivery_crew=request.user)
-
-    # Apply filtering
-    filter_backends = [OrderingFilter, SearchFilter]
-    ordering_fields = ['created_at', 'total_amount']  # Define fields for sorting
-    search_fields = ['id', 'status', 'customer_name']  # Define fields for searching
-    for backend in filter_backends:
-        assigned_orders = backend().filter_queryset(request, assigned_orders, view=view_assigned_orders)
-    
-    # Apply sorting
-    assigned_orders = OrderingFilter().filter_queryset(request, assigned_orders, view=view_assigned_orders)
-    
-    # Paginate the queryset
-    paginator = PageNumberPagination()
-    paginated_orders = paginator.paginate_queryset(assigned_orders, request)
-
-    # Serialize the paginated queryset
-    serializer = OrderSerializer(paginated_orders, many=True)
-
-    # Return paginated and serialized data
-    return paginator.get_paginated_response(serializer.data)
-
-
 @api_view(['GET', 'POST', 'DELETE'])
 @permission_classes([IsAdminUser])
 def manage_delivery_crew(request, user_id=None):
@@ -309,58 +313,37 @@ def manage_cart(request):
             # Retrieve cart items associated with the authenticated user
             cart_items = Cart.objects.filter(user=request.user)
             
-            # Serialize the cart items
-            serializer = CartSerializer(cart_items, many=True)
-            
-            return Response(serializer.data, status=200)
+            # Serialize the cart items straight from the rows
+            return Response(ValuesSerializer(CartSerializer).data(cart_items), status=200)
         except Exception as e:
             return Response({'error': str(e)}, status=500)
     
     elif request.method == 'POST':
+        # Either one item ({'menuitem', 'quantity'}) or several at once ({'items': [...]})
+        batch = 'items' in request.data
         try:
-            # Extract data from the request body
-            menuitem_id = request.data.get('menuitem')
-            quantity = request.data.get('quantity')
-
-            # Validate the input data
-            if not menuitem_id or not quantity:
-                return Response({'error': 'Menu item and quantity are required.'}, status=400)
-
-            # Check if the item already exists in the cart
-            existing_cart_item = Cart.objects.filter(user=request.user, menuitem=menuitem_id).first()
-            if existing_cart_item:
-                # If item already exists, update its quantity
-                existing_cart_item.quantity += int(quantity)
-                existing_cart_item.save()
-                serializer = CartSerializer(existing_cart_item)
-                return Response(serializer.data, status=status.HTTP_200_OK)
-            else:
-                # Get the unit price of the menu item
-                menuitem = MenuItem.objects.get(id=menuitem_id)
-                unit_price = menuitem.price
-
-                # Calculate the total price for the new cart item
-                price = unit_price * int(quantity)
-
-                # Create a new cart item instance
-                cart_item = Cart.objects.create(
-                    user=request.user,
-                    menuitem_id=menuitem_id,
-                    unit_price=unit_price,
-                    quantity=quantity,
-                    price=price
-                )
-
-                # Serialize the cart item
-                serializer = CartSerializer(cart_item)
+            items = request.data['items'] if batch else [request.data]
+            lines = parse_lines(items)
+        except (KeyError, TypeError, ValueError):
+            return Response({'error': 'Menu item and quantity are required.'}, status=400)
+        if not lines:
+            return Response({'error': 'Menu item and quantity are required.'}, status=400)
 
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        except MenuItem.DoesNotExist:
-            return Response({'error': 'Menu item does not exist.'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            # Insert or top up every line in a single statement
+            results = add_to_cart(request.user, lines)
+        except MenuItem.DoesNotExist as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        if batch:
+            serializer = CartSerializer([cart_item for cart_item, _ in results], many=True)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        cart_item, created = results[0]
+        serializer = CartSerializer(cart_item)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
     elif request.method == 'DELETE':
         try:
             user = request.user
@@ -376,13 +359,27 @@ def manage_cart(request):
 def manage_user_orders(request):
     if request.method == 'GET':
         try:
-            # Retrieve orders associated with the authenticated user
-            orders = Order.objects.filter(user=request.user)
+            # Retrieve orders associated with the authenticated user, a page at a time,
+            # reading through to the archive for older history
+            expand = parse_expand(request)
+            orders = OrderSerializer.setup_queryset(Order.objects.filter(user=request.user), expand)
+            archived_orders = OrderSerializer.setup_queryset(ArchivedOrder.objects.filter(user=request.user), expand)
+            paginator = KeysetPagination(ordering_fields=['id', 'date'], default_ordering='-date')
+
+            # Plain order headers come straight from the rows; expanded lines need the serializer
+            if 'items' not in expand:
+                fast_serializer = ValuesSerializer(OrderSerializer)
+                paginated_rows = paginate_orders(paginator, request, fast_serializer.values(orders),
+                                                 fast_serializer.values(archived_orders))
+                return paginator.get_paginated_response(fast_serializer.render(paginated_rows))
+            paginated_orders = paginate_orders(paginator, request, orders, archived_orders)
             
             # Serialize the orders
-            serializer = OrderSerializer(orders, many=True)
+            serializer = OrderSerializer(paginated_orders, many=True, context={'expand': expand})
             
-            return Response(serializer.data, status=200)
+            return paginator.get_paginated_response(serializer.data)
+        except NotFound:
+            raise
         except Exception as e:
             return Response({'error': str(e)}, status=500)
 
@@ -398,63 +395,72 @@ def manage_user_orders(request):
             # Convert the date string to a datetime object
             order_date = datetime.strptime(date, '%Y-%m-%d').date()
 
-            # Retrieve the cart items associated with the authenticated user
-            cart_items = Cart.objects.filter(user=request.user)
-            
-            # Calculate the total amount of the order
-            total_amount = sum(cart_item.price for cart_item in cart_items)
-
-            #Create a new order instance
-            with transaction.atomic():
-                order = Order.objects.create(user=request.user, total=total_amount, date=order_date)
-                # Add cart items to the order
-                for cart_item in cart_items:
-                    OrderItem.objects.create(
-                        order=order, 
-                        menuitem=cart_item.menuitem, 
-                        quantity=cart_item.quantity,
-                        unit_price=cart_item.unit_price
-                        )
-
-
-            # Clear the cart after placing the order
-            cart_items.delete()
+            # Move the cart into a new order; retries with the same key get the original order back
+            idempotency_key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+            order, created = place_order(request.user, order_date, idempotency_key=idempotency_key)
 
             # Serialize the order
             serializer = OrderSerializer(order)
 
-            return Response(serializer.data, status=201)
+            return Response(serializer.data, status=201 if created else 200)
 
+        except EmptyCart as e:
+            return Response({'error': str(e)}, status=400)
         except Exception as e:
             return Response({'error': str(e)}, status=500)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsDeliveryCrewUser])
-@throttle_classes([CustomThrottle, CustomUserThrottle])
+@throttle_classes([AssignedOrdersThrottle])
 def view_assigned_orders(request):
     # Retrieve orders assigned to the authenticated delivery crew user
+    expand = parse_expand(request)
     assigned_orders = Order.objects.filter(delivery_crew=request.user)
 
-    # Apply filtering
-    filter_backends = [OrderingFilter, SearchFilter]
-    ordering_fields = ['created_at', 'total_amount']  # Define fields for sorting
-    search_fields = ['id', 'status', 'customer_name']  # Define fields for searching
-    for backend in filter_backends:
-        assigned_orders = backend().filter_queryset(request, assigned_orders, view=view_assigned_orders)
-    
-    # Apply sorting
-    assigned_orders = OrderingFilter().filter_queryset(request, assigned_orders, view=view_assigned_orders)
-    
-    # Paginate the queryset
-    paginator = PageNumberPagination()
+    # Optionally only the orders still on their way (?state=active) or in one state
+    state = request.query_params.get('state')
+    if state:
+        if state != 'active' and state not in TRANSITIONS:
+            return Response({'error': f"Unknown state. Use active or one of: {', '.join(TRANSITIONS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        if state == 'active' or state not in (Order.DELIVERED, Order.CANCELLED):
+            # Spelled out so SQLite reads the active orders' partial index
+            assigned_orders = assigned_orders.filter(ACTIVE_ORDERS)
+        if state != 'active':
+            assigned_orders = assigned_orders.filter(state=state)
+    assigned_orders = OrderSerializer.setup_queryset(assigned_orders, expand)
+
+    # Sort and paginate the queryset
+    paginator = KeysetPagination(ordering_fields=['id', 'date', 'total'], default_ordering='-date')
+    if 'items' not in expand:
+        # Plain order headers come straight from the rows
+        fast_serializer = ValuesSerializer(OrderSerializer)
+        paginated_rows = paginator.paginate_queryset(fast_serializer.values(assigned_orders), request)
+        return paginator.get_paginated_response(fast_serializer.render(paginated_rows))
     paginated_orders = paginator.paginate_queryset(assigned_orders, request)
 
     # Serialize the paginated queryset
-    serializer = OrderSerializer(paginated_orders, many=True)
+    serializer = OrderSerializer(paginated_orders, many=True, context={'expand': expand})
 
     # Return paginated and serialized data
     return paginator.get_paginated_response(serializer.data)
          
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsDeliveryCrewUser])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def order_events(request):
+    # Resume after the last event the client saw, or start from now
+    try:
+        last_id = parse_last_event_id(request)
+    except ValueError:
+        return Response({'error': 'Last-Event-ID must be an event id.'}, status=status.HTTP_400_BAD_REQUEST)
+    if last_id is None:
+        last_id = latest_event_id(request.user.id)
+
+    # Under WSGI the stream sends the waiting events and ends, and EventSource
+    # reconnects after RETRY ms; the ASGI app keeps it open instead
+    events = [f'retry: {RETRY}\n\n'] + [format_event(row) for row in events_after(request.user.id, last_id)]
+    return StreamingHttpResponse(events, content_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+         
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def manage_order_items(request, order_id):
@@ -482,25 +488,35 @@ def manage_order_items(request, order_id):
     # Check if the request method is PATCH
     elif request.method == 'PATCH':
         try:
-            # Check if the authenticated user is the assigned delivery crew for the order
-            if order.delivery_crew != request.user:
+            # Check if the authenticated user is the assigned delivery crew for the order (or staff)
+            if order.delivery_crew_id != request.user.id and not request.user.is_staff:
                 return Response({'message': 'You are not assigned as the delivery crew for this order.'}, status=status.HTTP_403_FORBIDDEN)
-            
-            # Retrieve the status value from the request data
-            status_value = request.data.get('status')
 
-            # Validate the status value
-            if status_value not in [True, False]:
-                return Response({'message': 'Invalid status value. Please provide either true or false.'}, status=status.HTTP_400_BAD_REQUEST)
+            state = request.data.get('state')
+            if state is not None:
+                # Move the order through its lifecycle; only staff can cancel it or take it back a step
+                if state not in TRANSITIONS:
+                    return Response({'message': f"Invalid state. Use one of: {', '.join(TRANSITIONS)}."}, status=status.HTTP_400_BAD_REQUEST)
+                if state not in CREW_STATES and not request.user.is_staff:
+                    return Response({'message': 'Only staff can move an order to that state.'}, status=status.HTTP_403_FORBIDDEN)
+                transition(order, state)
+            else:
+                # Retrieve the status value from the request data
+                status_value = request.data.get('status')
+
+                # Validate the status value
+                if status_value not in [True, False]:
+                    return Response({'message': 'Invalid status value. Please provide either true or false.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Update the status of the order
-            order.status = status_value
-            order.save()
+                # Update the status of the order (and the delivered sales totals)
+                set_order_status(order, status_value)
 
             # Serialize the updated order object
             serializer = OrderSerializer(order)
 
             return Response(serializer.data, status=status.HTTP_200_OK)
+        except InvalidTransition as e:
+            return Response({'message': str(e)}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -510,58 +526,150 @@ def create_order(request):
     try:
         user = request.user
         
-        # Create a new order
-        new_order = Order.objects.create(user=user)
-        
-        # Retrieve current cart items for the user
-        cart_items = Cart.objects.filter(user=user)
-        
-        # Create order items from cart items
-        for item in cart_items:
-            OrderItem.objects.create(
-                order=new_order,
-                menuitem=item.menuitem,
-                quantity=item.quantity,
-                unit_price=item.unit_price
-            )
-        
-        # Clear the cart after creating order items
-        cart_items.delete()
+        # Create a new order from the user's cart
+        idempotency_key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+        new_order, created = place_order(user, date.today(), idempotency_key=idempotency_key)
         
         # Serialize the created order
         serializer = OrderSerializer(new_order)
         
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def parse_date_range(params):
+    # Optional inclusive ?start= and ?end= dates; raises ValueError for a malformed one
+    return [
+        datetime.strptime(params[name], '%Y-%m-%d').date() if params.get(name) else None
+        for name in ('start', 'end')
+    ]
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_orders(request):
+    # Pick the output format (?type=ndjson or ?type=csv)
+    export_type = request.query_params.get('type', 'ndjson')
+    if export_type not in FORMATS:
+        return Response({'error': f"Unknown export type. Use one of: {', '.join(FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Optional inclusive date range
+    try:
+        start, end = parse_date_range(request.query_params)
+    except ValueError:
+        return Response({'error': 'Dates must be in YYYY-MM-DD format.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Stream the rows as they are read instead of building the export in memory
+    content_type, write_lines = FORMATS[export_type]
+    response = StreamingHttpResponse(write_lines(export_rows(start, end)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="orders.{export_type}"'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def dispatch_orders(request):
+    # Optional cap on how many orders to assign in this run
+    try:
+        limit = request.data.get('limit')
+        limit = int(limit) if limit is not None else None
+        batch_size = int(request.data.get('batch_size', BATCH_SIZE))
+    except (TypeError, ValueError):
+        return Response({'error': 'limit and batch_size must be numbers.'}, status=status.HTTP_400_BAD_REQUEST)
+    if (limit is not None and limit < 1) or batch_size < 1:
+        return Response({'error': 'limit and batch_size must be positive.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Spread the waiting orders over the delivery crew by their open load
+    assigned = assign_orders(batch_size=batch_size, limit=limit)
+    return Response({
+        'assigned': sum(assigned.values()),
+        'delivery_crew': [{'id': user_id, 'assigned': count} for user_id, count in sorted(assigned.items())],
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sales_report(request):
+    # Reports only read the rollup tables, never the orders themselves
+    group = request.query_params.get('group', 'day')
+    try:
+        start, end = parse_date_range(request.query_params)
+        limit = int(request.query_params.get('limit', 20))
+    except ValueError:
+        return Response({'error': 'Dates must be in YYYY-MM-DD format and limit a number.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Totals over the requested days
+    days = DailySales.objects.all()
+    if start:
+        days = days.filter(date__gte=start)
+    if end:
+        days = days.filter(date__lte=end)
+    totals = days.aggregate(
+        orders=Coalesce(Sum('orders'), 0),
+        quantity=Coalesce(Sum('quantity'), 0),
+        revenue=Coalesce(Sum('revenue'), Decimal('0.00')),
+        delivered_orders=Coalesce(Sum('delivered_orders'), 0),
+        delivered_revenue=Coalesce(Sum('delivered_revenue'), Decimal('0.00')),
+    )
+
+    # Day by day, or the best selling menu items/categories of all time
+    if group == 'day':
+        serializer = DailySalesSerializer(days.order_by('date'), many=True)
+    elif group == 'menu-item':
+        rows = MenuItemSales.objects.select_related('menuitem').order_by('-revenue', 'menuitem_id')[:limit]
+        serializer = MenuItemSalesSerializer(rows, many=True)
+    elif group == 'category':
+        rows = CategorySales.objects.select_related('category').order_by('-revenue', 'category_id')[:limit]
+        serializer = CategorySalesSerializer(rows, many=True)
+    else:
+        return Response({'error': 'Unknown group. Use day, menu-item or category.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Match the decimal strings the serializers use
+    for name in ('revenue', 'delivered_revenue'):
+        totals[name] = str(totals[name].quantize(Decimal('0.01')))
+    return Response({'group': group, 'totals': totals, 'results': serializer.data})
+
+
 @api_view(['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def order(request, order_id=None):
     if request.method == 'GET':
         # Retrieve a list of orders for the authenticated user
+        expand = parse_expand(request)
+        orders = OrderSerializer.setup_queryset(Order.objects.all(), expand)
+        archived_orders = OrderSerializer.setup_queryset(ArchivedOrder.objects.all(), expand)
         if order_id is None:
-            orders = Order.objects.filter(user=request.user)
-            serializer = OrderSerializer(orders, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # The user's orders and archived orders together, a page at a time in id order
+            paginator = KeysetPagination(ordering_fields=['id', 'date'], default_ordering='id')
+            paginated_orders = paginate_orders(paginator, request, orders.filter(user=request.user),
+                                               archived_orders.filter(user=request.user))
+            serializer = OrderSerializer(paginated_orders, many=True, context={'expand': expand})
+            return paginator.get_paginated_response(serializer.data)
         # Retrieve details of a specific order
         else:
             try:
-                order = Order.objects.get(id=order_id)
-                if order.user == request.user:
-                    serializer = OrderSerializer(order)
+                # Read through to the archive for an order no longer in the order table
+                order = orders.filter(id=order_id).first() or archived_orders.get(id=order_id)
+                if order.user_id == request.user.id:
+                    serializer = OrderSerializer(order, context={'expand': expand})
                     return Response(serializer.data, status=status.HTTP_200_OK)
                 else:
                     return Response({'error': 'You do not have permission to view this order.'}, status=status.HTTP_403_FORBIDDEN)
-            except Order.DoesNotExist:
+            except ArchivedOrder.DoesNotExist:
                 return Response({'error': 'Order not found.'}, status=status.HTTP_404_NOT_FOUND)
     
     elif request.method == 'POST':
         # Create a new order
         serializer = OrderSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            with transaction.atomic():
+                state = state_for(serializer.validated_data.get('delivery_crew'), serializer.validated_data.get('status'))
+                new_order = serializer.save(user=request.user, state=state)
+                record_orders([new_order.id])
+                if new_order.delivery_crew_id:
+                    record_assignments([new_order], from_state='')
+                else:
+                    record_placed([new_order])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -580,19 +688,38 @@ def order(request, order_id=None):
         if request.method == 'PUT':
             serializer = OrderSerializer(order, data=request.data)
             if serializer.is_valid():
-                serializer.save()
+                crew = serializer.validated_data.pop('delivery_crew', order.delivery_crew)
+                crew_id = crew.id if crew else None
+                delivered = serializer.validated_data.pop('status', order.status)
+                try:
+                    with transaction.atomic():
+                        # Crew and status changes go through the lifecycle, which logs them
+                        if crew_id != order.delivery_crew_id:
+                            assign_order(order, crew_id)
+                        set_order_status(order, delivered)
+
+                        # Swap the old version of the order for the new one in the sales rollups
+                        remove_orders([order.id])
+                        serializer.save()
+                        record_orders([order.id])
+                except InvalidTransition as e:
+                    return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
                 return Response(serializer.data, status=status.HTTP_200_OK)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         # Update the status of the order (PATCH)
         elif request.method == 'PATCH':
-            order.status = request.data.get('status')
-            order.save()
+            try:
+                set_order_status(order, request.data.get('status'))
+            except InvalidTransition as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
             return Response({'message': 'Order status updated successfully.'}, status=status.HTTP_200_OK)
         
         # Delete the order (DELETE)
         elif request.method == 'DELETE':
-            order.delete()
+            with transaction.atomic():
+                remove_orders([order.id])
+                order.delete()
             return Response({'message': 'Order deleted successfully.'}, status=status.HTTP_204_NO_CONTENT)
 
 
@@ -0,0 +1,21 @@
+"""
+URL configuration for the ASGI entry point.
+
+Serves the hot read endpoints, the order export and the event stream from
+the native async views in myapp.async_views and everything else exactly
+like myproject.urls.
+"""
+from django.urls import path
+
+from myapp import async_views
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('api/menu-items/', async_views.menu_items),
+    path('api/menu-items/<int:menu_item_id>/', async_views.menu_item_detail),
+    path('api/cart/menu-items/', async_views.cart),
+    path('api/cart/orders/', async_views.user_orders),
+    path('api/orders/export/', async_views.export_orders),
+    path('api/orders/events/', async_views.order_events),
+] + wsgi_urlpatterns
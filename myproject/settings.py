@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -58,6 +60,9 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 MIDDLEWARE = [
+    'myapp.middleware.QueryProfilerMiddleware',
+    'myapp.middleware.ASGIUrlconfMiddleware',
+    'myapp.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,6 +74,9 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'myproject.urls'
 
+# The ASGI app serves the hot read endpoints from native async views
+ASGI_URLCONF = 'myproject.asgi_urls'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -95,7 +103,106 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Keep connections open between requests instead of reconnecting
+        # (and re-applying SQLITE_PRAGMAS) every time
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+}
+
+# myapp.routers.ReplicaRouter reads from these aliases while serving requests
+# and writes to default. Unset, everything uses default; locally, each named
+# replica is a copy of db.sqlite3 in db.<alias>.sqlite3, kept up to date by
+# `manage.py sync_replicas`. A client that writes reads from default for the
+# next REPLICA_PIN_SECONDS, which should cover the replicas' lag.
+DATABASE_ROUTERS = ['myapp.routers.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in os.environ.get('DATABASE_REPLICAS', '').split(',') if alias]
+REPLICA_PIN_SECONDS = 10
+
+for alias in DATABASE_REPLICAS:
+    DATABASES.setdefault(alias, {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db.{alias}.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+# Applied to every new SQLite connection (myapp.database). WAL lets readers
+# carry on while a checkout writes, and with it synchronous=NORMAL is still
+# safe against corruption; busy_timeout is in milliseconds, a negative
+# cache_size in KiB.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# LocMem is per process; point CATALOG_CACHE_ALIAS at a file or database cache
+# to share catalog responses between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+ROLES_CACHE_TIMEOUT = 5 * 60
+
+# In-process cache of authenticated tokens/JWT users (entries, seconds)
+AUTH_CACHE = {
+    'MAXSIZE': 10000,
+    'TTL': 60,
+}
+
+# JWT access tokens are stateless and cannot be revoked, so keep them short-lived
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+}
+
+
+# Database that holds the shared throttle buckets
+THROTTLE_DATABASE = 'default'
+
+# Longest a delivery crew event stream goes without checking for events
+# written by other processes (events from this process arrive at once), in seconds
+ORDER_EVENTS_POLL_INTERVAL = 5
+
+# Delivered orders older than this many days are moved to the archive tables
+# by `manage.py archive_orders`, and order history reads look in the archive
+# only past this age. Raise it only after restoring archived orders newer
+# than the new age.
+ORDER_ARCHIVE_AFTER_DAYS = 365
+
+# Background jobs (myapp.jobs, run by `manage.py runworker`). A job is
+# claimed for LEASE seconds, after which it is run again if its worker has
+# not finished it; a failed job is retried MAX_ATTEMPTS times in all, waiting
+# BACKOFF seconds, doubling each time up to MAX_BACKOFF. Idle workers look
+# for jobs every POLL_INTERVAL seconds.
+JOB_QUEUE = {
+    'POLL_INTERVAL': 1,
+    'LEASE': 300,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF': 10,
+    'MAX_BACKOFF': 3600,
+}
+
+# Per-request SQL profiling (myapp.middleware.QueryProfilerMiddleware):
+# Server-Timing headers, and a warning for every query shape a request runs
+# REPEAT_THRESHOLD times or more, with the lines that ran it. Off by default
+# since it costs a stack walk per query; turn it on while developing.
+QUERY_PROFILER = {
+    'ENABLED': False,
+    'REPEAT_THRESHOLD': 3,
 }
 
 
@@ -142,7 +249,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES':[
-         'rest_framework.authentication.TokenAuthentication',
+         'myapp.authentication.CachedTokenAuthentication',
+         'myapp.authentication.CachedJWTAuthentication',
          'rest_framework.authentication.SessionAuthentication'
      ],
     
@@ -151,7 +259,15 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
     ],
 
-    'DEFAULT_PAGINATION_CLASS':'rest_framework.pagination.PageNumberPagination',
+    # Token-bucket rates per throttle scope, shared by every worker through
+    # the THROTTLE_DATABASE table
+    'DEFAULT_THROTTLE_RATES': {
+        'menu_item': '100/day',
+        'assigned_orders': '100/day',
+        'restricted': '100/day',
+    },
+
+    'DEFAULT_PAGINATION_CLASS':'myapp.pagination.KeysetPagination',
     'PAGE_SIZE': 2,
     
     'DEFAULT_RENDERER_CLASSES' : [
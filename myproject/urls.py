@@ -24,4 +24,5 @@ urlpatterns = [
     path('api/', include('myapp.urls')),
     path('auth/', include('djoser.urls')),  
     path('auth/', include('djoser.urls.authtoken')),
+    path('auth/', include('djoser.urls.jwt')),
 ]